@@ -0,0 +1,233 @@
+"""End-to-end benchmark of ``datasets_process.dataset`` on a synthetic MultiDataTile input.
+
+Usage:
+    python -m benchmarks.dataset_benchmark --profile default [--work-dir DIR] [--output result.json]
+
+A ``data`` tree with ``--tiles`` random-texture TIFF images of ``--size`` pixels
+is generated under the work directory (a temporary directory by default), and
+the whole rdetoolkit workflow is run on it in-process, inside the same run
+contexts as ``main.py`` (:func:`datasets_process.structuring_run`). The
+per-tile latency of ``dataset``, the total throughput, the tracemalloc peak
+of each tile and the peak RSS of the process and of its worker processes
+(``tile_workers``) are measured and compared with the budgets of the
+selected profile in ``budgets.json``. The exit code is 1 when a budget is exceeded.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import rdetoolkit
+import yaml
+from PIL import Image
+
+from modules import datasets_process
+
+REPOSITORY_ROOT = Path(__file__).resolve().parents[2]
+TASKSUPPORT_TEMPLATE = REPOSITORY_ROOT.joinpath("templates", "template", "tasksupport")
+INVOICE_TEMPLATE = REPOSITORY_ROOT.joinpath("tryout", "invoice_sample.json")
+BUDGETS_PATH = Path(__file__).with_name("budgets.json")
+PROFILES = {
+    "small": {"tiles": 3, "size": 512},
+    "default": {"tiles": 8, "size": 2048},
+}
+
+
+@dataclass
+class BenchmarkResult:
+    """Measurements of one benchmark run.
+
+    Attributes:
+        tiles (int): Number of tiles processed.
+        size (int): Edge length of the generated images.
+        tile_seconds (list[float]): Wall time of ``dataset`` for each tile.
+        tile_tracemalloc_peak_mb (list[float]): tracemalloc peak of each tile in MiB.
+        total_seconds (float): Wall time of the whole workflow.
+        rss_peak_mb (float): Peak resident set size of the process in MiB.
+        rss_children_peak_mb (float): Largest peak resident set size of the terminated
+            worker processes in MiB. The tracemalloc peaks cover the main process only.
+        failed_tiles (int): Number of tiles reported as failed by rdetoolkit.
+
+    """
+
+    tiles: int
+    size: int
+    tile_seconds: list[float] = field(default_factory=list)
+    tile_tracemalloc_peak_mb: list[float] = field(default_factory=list)
+    total_seconds: float = 0.0
+    rss_peak_mb: float = 0.0
+    rss_children_peak_mb: float = 0.0
+    failed_tiles: int = 0
+
+    def summary(self) -> dict[str, float]:
+        """Return the aggregated values that are compared with the budgets."""
+        return {
+            "tile_seconds_p50": float(np.percentile(self.tile_seconds, 50)),
+            "tile_seconds_p95": float(np.percentile(self.tile_seconds, 95)),
+            "tiles_per_second": self.tiles / self.total_seconds,
+            "tracemalloc_peak_mb": max(self.tile_tracemalloc_peak_mb),
+            "rss_peak_mb": self.rss_peak_mb,
+            "rss_children_peak_mb": self.rss_children_peak_mb,
+            "failed_tiles": self.failed_tiles,
+        }
+
+
+def generate_input_tree(root: Path, tiles: int, size: int, *, seed: int = 0, wavelet_settings: dict[str, Any] | None = None) -> None:
+    """Create a MultiDataTile ``data`` tree with random-texture TIFF images.
+
+    Args:
+        root (Path): Directory in which ``data`` is created. An existing ``data`` is removed.
+        tiles (int): Number of images (one tile each).
+        size (int): Edge length of the square 8-bit images.
+        seed (int): Seed of the random textures.
+        wavelet_settings (dict[str, Any] | None): ``wavelet`` section written to ``rdeconfig.yaml``.
+
+    """
+    data = root / "data"
+    if data.exists():
+        shutil.rmtree(data)
+    for name in ("inputdata", "invoice", "tasksupport"):
+        data.joinpath(name).mkdir(parents=True)
+    for path in TASKSUPPORT_TEMPLATE.iterdir():
+        shutil.copy(path, data / "tasksupport" / path.name)
+    shutil.copy(INVOICE_TEMPLATE, data / "invoice" / "invoice.json")
+    config = yaml.safe_load(data.joinpath("tasksupport", "rdeconfig.yaml").read_text(encoding="utf-8"))
+    config["system"]["extended_mode"] = "MultiDataTile"
+    if wavelet_settings is not None:
+        config["wavelet"] = wavelet_settings
+    data.joinpath("tasksupport", "rdeconfig.yaml").write_text(yaml.safe_dump(config), encoding="utf-8")
+
+    rng = np.random.default_rng(seed)
+    for i in range(tiles):
+        image = (rng.random((size, size)) * 255).astype(np.uint8)
+        Image.fromarray(image).save(data / "inputdata" / f"tile{i:04d}.tif")
+
+
+@contextmanager
+def _working_directory(path: Path):  # noqa: ANN202
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _measured(result: BenchmarkResult, dataset: Callable[..., None]) -> Callable[..., None]:
+    def wrapper(*args: Any, **kwargs: Any) -> None:
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            dataset(*args, **kwargs)
+        finally:
+            result.tile_seconds.append(time.perf_counter() - start)
+            result.tile_tracemalloc_peak_mb.append(tracemalloc.get_traced_memory()[1] / 2**20)
+
+    return wrapper
+
+
+def _rss_peak_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is reported in KiB on Linux and in bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_benchmark(root: Path, tiles: int, size: int, *, wavelet_settings: dict[str, Any] | None = None) -> BenchmarkResult:
+    """Generate the input tree under ``root`` and run the workflow on it.
+
+    Args:
+        root (Path): Work directory.
+        tiles (int): Number of tiles.
+        size (int): Edge length of the images.
+        wavelet_settings (dict[str, Any] | None): ``wavelet`` section of ``rdeconfig.yaml``.
+
+    Returns:
+        BenchmarkResult: The measurements.
+
+    """
+    generate_input_tree(root, tiles, size, wavelet_settings=wavelet_settings)
+    result = BenchmarkResult(tiles=tiles, size=size)
+    tracemalloc.start()
+    try:
+        with _working_directory(root):
+            start = time.perf_counter()
+            with datasets_process.structuring_run(Path("data")):
+                status = rdetoolkit.workflows.run(custom_dataset_function=_measured(result, datasets_process.dataset))
+            result.total_seconds = time.perf_counter() - start
+    finally:
+        tracemalloc.stop()
+    result.rss_peak_mb = _rss_peak_mb()
+    result.rss_children_peak_mb = _rss_peak_mb(resource.RUSAGE_CHILDREN)
+    result.failed_tiles = sum(1 for item in json.loads(status)["statuses"] if item["status"] != "success")
+    return result
+
+
+def check_budgets(summary: dict[str, float], budgets: dict[str, float]) -> list[str]:
+    """Compare a summary with its budgets.
+
+    Budgets named ``*_min`` are lower bounds and all others are upper bounds
+    of the summary value with the same name (without the suffix).
+
+    Args:
+        summary (dict[str, float]): Output of :meth:`BenchmarkResult.summary`.
+        budgets (dict[str, float]): Budgets of one profile.
+
+    Returns:
+        list[str]: A message for every exceeded budget. Empty if all budgets are met.
+
+    """
+    violations = []
+    for name, limit in budgets.items():
+        if name.endswith("_min"):
+            value = summary[name.removesuffix("_min")]
+            if value < limit:
+                violations.append(f"{name.removesuffix('_min')} = {value:.3f} is below the budget {limit}")
+        elif summary[name] > limit:
+            violations.append(f"{name} = {summary[name]:.3f} exceeds the budget {limit}")
+    return violations
+
+
+def load_budgets(profile: str, path: Path = BUDGETS_PATH) -> dict[str, float]:
+    """Return the budgets of ``profile`` from ``budgets.json``."""
+    return json.loads(path.read_text(encoding="utf-8"))[profile]
+
+
+def main(profile: str, tiles: int | None, size: int | None, work_dir: Path | None, output: Path | None) -> int:
+    """Run the benchmark and return the process exit code."""
+    tiles = tiles if tiles is not None else PROFILES[profile]["tiles"]
+    size = size if size is not None else PROFILES[profile]["size"]
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run_benchmark(work_dir or Path(tmp), tiles, size)
+    summary = result.summary()
+    violations = check_budgets(summary, load_budgets(profile))
+    report = {"profile": profile, "summary": summary, "violations": violations, "result": asdict(result)}
+    text = json.dumps(report, indent=4)
+    if output is not None:
+        output.write_text(text, encoding="utf-8")
+    print(text)  # noqa: T201
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="default")
+    parser.add_argument("--tiles", type=int, default=None, help="override the number of tiles of the profile")
+    parser.add_argument("--size", type=int, default=None, help="override the image size of the profile")
+    parser.add_argument("--work-dir", type=Path, default=None)
+    parser.add_argument("--output", type=Path, default=None)
+    options = parser.parse_args()
+    sys.exit(main(options.profile, options.tiles, options.size, options.work_dir, options.output))
@@ -0,0 +1,80 @@
+"""Compare the wavelet engines with the steerable pyramid on a set of images.
+
+Usage:
+    python -m benchmarks.dwt_engine <image_dir> <output_csv> [--repeat 1] [--threads 1]
+
+For every TIFF image in ``image_dir`` the features are computed with every
+engine of ``wavelet.ENGINES`` from the same decoded pixels. The Pearson and
+Spearman correlation of each feature with the steerable pyramid result
+across the image set, and the median time and speed-up of each engine, are
+written to ``output_csv``, one row per engine and feature. The features of
+different engines have different scales, so only their correlation across
+images is meaningful.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.quick_correlation import correlate
+from modules import wavelet
+from modules.image_ingest import ingest_image
+
+
+def collect_features(image_paths: list[Path], repeat: int, threads: int) -> tuple[dict[str, pd.DataFrame], pd.DataFrame]:
+    """Compute the features of each image with every engine.
+
+    Args:
+        image_paths (list[Path]): Images to process.
+        repeat (int): Number of timed runs per image and engine.
+        threads (int): Number of pyramid threads of the steerable engine.
+
+    Returns:
+        tuple[dict[str, pd.DataFrame], pd.DataFrame]: The features of every engine (indexed by
+        file name, columns ``wavelet.FEATURE_NAMES``) and the median seconds per image and engine.
+
+    """
+    rows: dict[str, dict[str, dict]] = {engine: {} for engine in wavelet.ENGINES}
+    seconds: dict[str, dict[str, float]] = {engine: {} for engine in wavelet.ENGINES}
+    for path in image_paths:
+        pixels = ingest_image(path, crop=wavelet.CROP_SIZE).pixels
+        for engine in wavelet.ENGINES:
+            elapsed = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                features = wavelet.compute_features(pixels, threads=threads, prescreen=False, engine=engine)
+                elapsed.append(time.perf_counter() - start)
+            rows[engine][path.name] = {name: features[name] for name in wavelet.FEATURE_NAMES}
+            seconds[engine][path.name] = float(np.median(elapsed))
+    tables = {engine: pd.DataFrame.from_dict(engine_rows, orient="index") for engine, engine_rows in rows.items()}
+    return tables, pd.DataFrame(seconds)
+
+
+def main(image_dir: Path, output_csv: Path, repeat: int, threads: int) -> None:
+    """Run the comparison and save the correlation and timing table."""
+    image_paths = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in (".tif", ".tiff"))
+    tables, seconds = collect_features(image_paths, repeat, threads)
+    speedups = seconds.rdiv(seconds["steerable"], axis=0)
+    results = []
+    for engine in wavelet.ENGINES:
+        result = correlate(tables["steerable"], tables[engine])
+        result.insert(0, "engine", engine)
+        result["median_seconds"] = seconds[engine].median()
+        result["median_speedup"] = speedups[engine].median()
+        results.append(result)
+    pd.concat(results).rename_axis("feature").to_csv(output_csv)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_dir")
+    parser.add_argument("output_csv")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=1)
+    options = parser.parse_args()
+    main(Path(options.image_dir), Path(options.output_csv), options.repeat, options.threads)
@@ -0,0 +1,87 @@
+"""Compare quick-mode features with the full computation on a set of images.
+
+Usage:
+    python -m benchmarks.quick_correlation <image_dir> <output_csv> [--bin-factor 4]
+
+For every TIFF image in ``image_dir`` the features are computed twice, once
+with the full-resolution crop and once in quick mode. The Pearson and Spearman
+correlation of each feature across the image set, and the median speed-up of
+the quick mode, are written to ``output_csv``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from modules import wavelet
+
+
+def collect_features(image_paths: list[Path], bin_factor: int) -> tuple[pd.DataFrame, pd.DataFrame, pd.Series]:
+    """Compute full and quick features for each image.
+
+    Args:
+        image_paths (list[Path]): Images to process.
+        bin_factor (int): Requested block size for quick mode.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame, pd.Series]: Full features, quick features
+        (both indexed by file name) and the per-image speed-up of quick mode.
+
+    """
+    full_rows: dict[str, dict] = {}
+    quick_rows: dict[str, dict] = {}
+    speedups: dict[str, float] = {}
+    for path in image_paths:
+        start = time.perf_counter()
+        full_rows[path.name] = wavelet.wavelet_process(path)
+        full_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        quick_rows[path.name] = wavelet.wavelet_process(path, quick=True, bin_factor=bin_factor)
+        quick_elapsed = time.perf_counter() - start
+        speedups[path.name] = full_elapsed / quick_elapsed
+    full = pd.DataFrame.from_dict(full_rows, orient="index")
+    quick = pd.DataFrame.from_dict(quick_rows, orient="index")[full.columns]
+    return full, quick, pd.Series(speedups)
+
+
+def correlate(full: pd.DataFrame, quick: pd.DataFrame) -> pd.DataFrame:
+    """Return per-feature Pearson and Spearman correlation between two feature tables.
+
+    Args:
+        full (pd.DataFrame): Features from the full computation, one row per image.
+        quick (pd.DataFrame): Features from quick mode with the same index and columns.
+
+    Returns:
+        pd.DataFrame: One row per feature with ``pearson`` and ``spearman`` columns.
+
+    """
+    rows = {
+        column: {
+            "pearson": full[column].corr(quick[column], method="pearson"),
+            "spearman": full[column].corr(quick[column], method="spearman"),
+        }
+        for column in full.columns
+    }
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def main(image_dir: Path, output_csv: Path, bin_factor: int) -> None:
+    """Run the comparison and save the correlation table."""
+    image_paths = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in (".tif", ".tiff"))
+    full, quick, speedups = collect_features(image_paths, bin_factor)
+    result = correlate(full, quick)
+    result["median_speedup"] = speedups.median()
+    result.to_csv(output_csv)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_dir")
+    parser.add_argument("output_csv")
+    parser.add_argument("--bin-factor", type=int, default=wavelet.QUICK_BIN_FACTOR)
+    options = parser.parse_args()
+    main(Path(options.image_dir), Path(options.output_csv), options.bin_factor)
@@ -0,0 +1,93 @@
+"""Benchmark the shape normalization modes across common detector sizes.
+
+Usage:
+    python -m benchmarks.shape_normalization <output_csv> [--repeat 3] [--threads 1]
+
+For every size in ``DETECTOR_SIZES`` a smooth random texture is generated and
+its features are computed with ``shape_mode`` ``"none"``, ``"pad"`` and
+``"crop"``. The median wall time of ``compute_features`` and the largest
+relative deviation of a feature from the ``"none"`` result are written to
+``output_csv``, one row per size and mode.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from modules import wavelet
+from modules.shape_normalization import SHAPE_MODES
+
+# (rows, cols) of common camera and detector formats, before the 2048 crop.
+DETECTOR_SIZES: tuple[tuple[int, int], ...] = (
+    (960, 1280),
+    (1040, 1392),
+    (1103, 1536),
+    (1200, 1600),
+    (1536, 2048),
+    (2048, 2048),
+    (2160, 2560),
+)
+
+
+def make_image(shape: tuple[int, int], seed: int = 0) -> np.ndarray:
+    """Return a smooth random texture of the given shape."""
+    return ndimage.gaussian_filter(np.random.default_rng(seed).random(shape), 2) * 1000
+
+
+def benchmark(shape: tuple[int, int], repeat: int, threads: int) -> list[dict]:
+    """Time every mode on one image size and compare the features with ``"none"``.
+
+    Args:
+        shape (tuple[int, int]): Image size.
+        repeat (int): Number of timed runs per mode.
+        threads (int): Number of pyramid threads.
+
+    Returns:
+        list[dict]: One row per mode.
+
+    """
+    image = make_image(shape)
+    rows = []
+    reference: dict | None = None
+    for mode in SHAPE_MODES:
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            features = wavelet.compute_features(image, threads=threads, shape_mode=mode)
+            elapsed.append(time.perf_counter() - start)
+        if reference is None:
+            reference = features
+        deviation = max(abs(features[name] / reference[name] - 1) for name in wavelet.FEATURE_NAMES if name not in ("ms_kurtosis", "ms_skewness"))
+        rows.append(
+            {
+                "shape": f"{shape[0]} x {shape[1]}",
+                "mode": mode,
+                "pyramid_shape": features.get("pyramid_shape", f"{min(shape[0], wavelet.CROP_SIZE)} x {min(shape[1], wavelet.CROP_SIZE)}"),
+                "seconds": float(np.median(elapsed)),
+                "max_relative_deviation": deviation,
+            },
+        )
+    return rows
+
+
+def main(output_csv: Path, repeat: int, threads: int) -> None:
+    """Run the benchmark on all sizes and save the table."""
+    table = pd.DataFrame([row for shape in DETECTOR_SIZES for row in benchmark(shape, repeat, threads)])
+    none_seconds = table[table["mode"] == "none"].set_index("shape")["seconds"]
+    table["speedup"] = none_seconds.loc[table["shape"]].to_numpy() / table["seconds"]
+    table.to_csv(output_csv, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1)
+    options = parser.parse_args()
+    main(Path(options.output_csv), options.repeat, options.threads)
@@ -1,5 +1,13 @@
+import argparse
+from pathlib import Path
+
 import rdetoolkit
 
 from modules import datasets_process
 
-rdetoolkit.workflows.run(custom_dataset_function=datasets_process.dataset)
+parser = argparse.ArgumentParser()
+parser.add_argument("--stage-from", help="download the job directory from this source while processing (az://<container>/<prefix> or a directory)")
+options = parser.parse_args()
+
+with datasets_process.structuring_run(Path("data"), stage_from=options.stage_from):
+    rdetoolkit.workflows.run(custom_dataset_function=datasets_process.dataset)
@@ -0,0 +1,249 @@
+"""Chunked, compressed storage of steerable pyramid coefficients.
+
+:func:`wavelet.get_steerable_pyramid_feature` reduces every band to its mean
+absolute value and discards the coefficients. With a
+:class:`CoefficientStoreWriter` the bands are also written to a single ZIP
+file as they are computed: each band is split into square chunks, and every
+chunk is a member of the archive, byte-shuffled (the bytes of equal
+significance are grouped, which makes floating-point data compressible) and
+zlib-compressed. ``index.json`` records the shape, chunk size and dtype of
+each band.
+
+:class:`CoefficientStore` opens the file lazily. Indexing a band reads and
+decompresses only the chunks that intersect the requested region, so
+downstream analysis can inspect one band or one region without loading the
+whole pyramid and without recomputing it.
+
+Example:
+    with CoefficientStore(Path("sample_pyramid.zip")) as store:
+        band = store[(2, 1)]
+        region = band[100:200, 0:64]
+        lowpass = store["residual_lowpass"].read()
+
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import zipfile
+import zlib
+from collections.abc import Hashable, Iterator
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+
+STORE_FORMAT: int = 1
+DEFAULT_CHUNK: int = 256
+INDEX_NAME: str = "index.json"
+# Level 1 is about as small as higher levels on shuffled coefficients and much faster.
+COMPRESSION_LEVEL: int = 1
+# Dimensions of a band; LazyBand indexes rows and columns.
+BAND_NDIM: int = 2
+
+
+def band_name(key: Hashable) -> str:
+    """Return the archive name of a ``pyr_coeffs`` key (``(2, 1)`` -> ``"band_2_1"``)."""
+    if isinstance(key, tuple):
+        return "band_" + "_".join(str(k) for k in key)
+    return str(key)
+
+
+class CoefficientStoreWriter:
+    """Write pyramid bands to a chunked, compressed ZIP file.
+
+    :meth:`add_band` may be called from several threads (the threaded pyramid
+    reports bands from its workers). Chunks are compressed in the calling
+    thread and only the archive write is serialized. If the ``with`` block
+    raises, the incomplete file is removed instead of being indexed.
+
+    Args:
+        path (Path): Output file.
+        chunk (int): Edge length of the square chunks.
+        dtype (str): Storage dtype of the coefficients, e.g. ``"float32"``.
+        attributes (dict[str, Any] | None): Additional information stored in the index
+            (e.g. pyramid height and order).
+
+    """
+
+    def __init__(self, path: Path, *, chunk: int = DEFAULT_CHUNK, dtype: str = "float32", attributes: dict[str, Any] | None = None):
+        self.path = Path(path)
+        self.chunk = chunk
+        self.dtype = np.dtype(dtype)
+        self.attributes = dict(attributes or {})
+        self._bands: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._archive = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_STORED)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def add_band(self, key: Hashable, coefficients: np.ndarray) -> None:
+        """Compress and write one band.
+
+        Args:
+            key (Hashable): The ``pyr_coeffs`` key of the band.
+            coefficients (np.ndarray): 2-D coefficient array.
+
+        """
+        name = band_name(key)
+        array = np.asarray(coefficients)
+        rows, cols = array.shape
+        for y in range(0, rows, self.chunk):
+            for x in range(0, cols, self.chunk):
+                block = np.ascontiguousarray(array[y : y + self.chunk, x : x + self.chunk], dtype=self.dtype)
+                shuffled = block.view(np.uint8).reshape(-1, self.dtype.itemsize).T.tobytes()
+                data = zlib.compress(shuffled, COMPRESSION_LEVEL)
+                with self._lock:
+                    self._archive.writestr(f"{name}/{y // self.chunk}.{x // self.chunk}", data)
+        with self._lock:
+            self._bands[name] = {"key": _encode_key(key), "shape": [rows, cols]}
+
+    def close(self) -> None:
+        """Write the index and close the archive."""
+        if self._archive.fp is None:
+            return
+        index = {"format": STORE_FORMAT, "chunk": self.chunk, "dtype": self.dtype.str, "filters": ["shuffle", "zlib"], "attributes": self.attributes, "bands": self._bands}
+        self._archive.writestr(INDEX_NAME, json.dumps(index, indent=4))
+        self._archive.close()
+
+    def discard(self) -> None:
+        """Close the archive without an index and remove the file."""
+        self._archive.close()
+        self.path.unlink(missing_ok=True)
+
+
+class CoefficientStore:
+    """Lazy reader of a file written by :class:`CoefficientStoreWriter`.
+
+    Args:
+        path (Path): The store file.
+
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._archive = zipfile.ZipFile(self.path)
+        index = json.loads(self._archive.read(INDEX_NAME))
+        if index.get("format") != STORE_FORMAT:
+            err_msg = f"Unsupported coefficient store format: {index.get('format')}"
+            raise ValueError(err_msg)
+        self.chunk: int = index["chunk"]
+        self.dtype = np.dtype(index["dtype"])
+        self.attributes: dict[str, Any] = index["attributes"]
+        self._bands: dict[str, dict[str, Any]] = index["bands"]
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys())
+
+    def __contains__(self, key: object) -> bool:
+        return band_name(key) in self._bands  # type: ignore[arg-type]
+
+    def __getitem__(self, key: Hashable) -> LazyBand:
+        name = band_name(key)
+        if name not in self._bands:
+            raise KeyError(key)
+        return LazyBand(self, name, tuple(self._bands[name]["shape"]))
+
+    def keys(self) -> list[Hashable]:
+        """Return the ``pyr_coeffs`` keys of the stored bands in the order they were written."""
+        return [_decode_key(band["key"]) for band in self._bands.values()]
+
+    def close(self) -> None:
+        """Close the underlying file."""
+        self._archive.close()
+
+    def read_chunk(self, name: str, row: int, col: int, shape: tuple[int, int]) -> np.ndarray:
+        """Read and decompress one chunk of a band.
+
+        Args:
+            name (str): Archive name of the band.
+            row (int): Chunk row index.
+            col (int): Chunk column index.
+            shape (tuple[int, int]): Shape of the whole band.
+
+        Returns:
+            np.ndarray: The chunk, clipped at the band edges.
+
+        """
+        rows = min(self.chunk, shape[0] - row * self.chunk)
+        cols = min(self.chunk, shape[1] - col * self.chunk)
+        data = zlib.decompress(self._archive.read(f"{name}/{row}.{col}"))
+        shuffled = np.frombuffer(data, dtype=np.uint8).reshape(self.dtype.itemsize, rows * cols)
+        return np.ascontiguousarray(shuffled.T).view(self.dtype).reshape(rows, cols)
+
+
+class LazyBand:
+    """One band of a :class:`CoefficientStore`, loaded on indexing.
+
+    Supports 2-D basic slicing (``band[y0:y1, x0:x1]``, with steps) and
+    ``np.asarray(band)``.
+
+    Attributes:
+        shape (tuple[int, int]): Shape of the band.
+
+    """
+
+    def __init__(self, store: CoefficientStore, name: str, shape: tuple[int, ...]):
+        self._store = store
+        self._name = name
+        self.shape: tuple[int, int] = (shape[0], shape[1])
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Storage dtype of the coefficients."""
+        return self._store.dtype
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> np.ndarray:
+        array = self.read()
+        return array if dtype is None else array.astype(dtype)
+
+    def __getitem__(self, index: Any) -> np.ndarray:
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) > BAND_NDIM or not all(isinstance(i, slice) for i in index):
+            err_msg = "LazyBand supports only slices, e.g. band[0:100, 50:80]"
+            raise TypeError(err_msg)
+        rows, cols = (*index, slice(None))[:2]
+        y0, y1, y_step = rows.indices(self.shape[0])
+        x0, x1, x_step = cols.indices(self.shape[1])
+        if y_step < 0 or x_step < 0:
+            return self.read()[rows, cols]
+        return self._read_region(y0, max(y1, y0), x0, max(x1, x0))[::y_step, ::x_step]
+
+    def read(self) -> np.ndarray:
+        """Load the whole band."""
+        return self._read_region(0, self.shape[0], 0, self.shape[1])
+
+    def _read_region(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        chunk = self._store.chunk
+        out = np.empty((y1 - y0, x1 - x0), dtype=self.dtype)
+        for row in range(y0 // chunk, -(-y1 // chunk)):
+            for col in range(x0 // chunk, -(-x1 // chunk)):
+                block = self._store.read_chunk(self._name, row, col, self.shape)
+                by0, bx0 = row * chunk, col * chunk
+                ys, ye = max(y0, by0), min(y1, by0 + block.shape[0])
+                xs, xe = max(x0, bx0), min(x1, bx0 + block.shape[1])
+                out[ys - y0 : ye - y0, xs - x0 : xe - x0] = block[ys - by0 : ye - by0, xs - bx0 : xe - bx0]
+        return out
+
+
+def _encode_key(key: Hashable) -> Any:
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _decode_key(value: Any) -> Hashable:
+    return tuple(value) if isinstance(value, list) else value
@@ -1,18 +1,28 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 
-from rdetoolkit.errors import catch_exception_with_message
+from rdetoolkit.errors import catch_exception_with_message, handle_and_exit_on_structured_error, handle_generic_error
+from rdetoolkit.exceptions import StructuredError
 from rdetoolkit.models.rde2types import (
     MetaType,
     RdeInputDirPaths,
     RdeOutputResourcePath,
 )
-from rdetoolkit.rde2util import Meta
+from rdetoolkit.rdelogger import get_logger
 
+from modules import telemetry
+from modules.definition_cache import DEFINITION_CACHE
+from modules.feature_statistics import CAMPAIGN_STATISTICS, STATISTICS_NAME
 from modules.graph_handler import GraphPlotter
+from modules.input_staging import INPUT_STAGER, refresh_raw_copies
 from modules.inputfile_handler import FileReader
 from modules.invoice_handler import InvoiceWriter
 from modules.meta_handler import MetaParser
+from modules.output_writer import OUTPUT_WRITER
+from modules.settings import WaveletSettings, load_wavelet_settings
 from modules.structured_handler import StructuredDataProcessor
+from modules.tile_dispatcher import TILE_DISPATCHER
 
 
 class CustomProcessingCoordinator:
@@ -61,6 +71,41 @@ class CustomProcessingCoordinator:
         self.invoice_writer = invoice_writer
 
 
+@contextmanager
+def structuring_run(data_dir: Path, *, stage_from: str | None = None) -> Iterator[None]:
+    """Set up the per-run state around ``rdetoolkit.workflows.run``.
+
+    The input files are staged from ``stage_from`` if it is given, the
+    resource usage is monitored, and the buffered outputs and the tile worker
+    pool are flushed and shut down when the run ends.
+
+    Staging starts before the workflow, so its errors are reported like those of
+    the workflow: ``job.failed`` is written, the error is logged to
+    ``logs/rdesys.log`` and the process exits with status 1.
+
+    Args:
+        data_dir (Path): The ``data`` directory of the run.
+        stage_from (str | None): Source of the job directory (see :mod:`modules.input_staging`).
+
+    Example:
+        with structuring_run(Path("data")):
+            rdetoolkit.workflows.run(custom_dataset_function=dataset)
+
+    """
+    try:
+        INPUT_STAGER.open(stage_from, data_dir)
+    except Exception as e:
+        INPUT_STAGER.shutdown()
+        # The source may fail before anything was staged, when data_dir does not exist yet.
+        data_dir.mkdir(parents=True, exist_ok=True)
+        logger = get_logger(__name__, file_path=data_dir.joinpath("logs", "rdesys.log"))
+        if isinstance(e, StructuredError):
+            handle_and_exit_on_structured_error(e, logger)
+        handle_generic_error(e, logger)
+    with INPUT_STAGER, telemetry.monitor_run(data_dir), OUTPUT_WRITER, TILE_DISPATCHER:
+        yield
+
+
 @catch_exception_with_message(error_message="ERROR: failed in data processing", error_code=50)
 def dataset(srcpaths: RdeInputDirPaths, resource_paths: RdeOutputResourcePath) -> None:
     """Execute structured processing in Wavelet-transform.
@@ -79,22 +124,42 @@ def dataset(srcpaths: RdeInputDirPaths, resource_paths: RdeOutputResourcePath) -
         The actual function names and processing details may vary depending on the project.
 
     """
-    module = CustomProcessingCoordinator(FileReader(), MetaParser(), GraphPlotter(), StructuredDataProcessor(), InvoiceWriter())
+    settings: WaveletSettings = load_wavelet_settings(srcpaths.config)
+    module = CustomProcessingCoordinator(FileReader(settings), MetaParser(), GraphPlotter(), StructuredDataProcessor(), InvoiceWriter())
+
+    # Wait for the input files of this tile if they are still being staged
+    if INPUT_STAGER.wait(resource_paths.rawfiles):
+        refresh_raw_copies(srcpaths.config.system, resource_paths)
+
+    # Mask sidecar files are read together with their image
+    if module.file_reader.is_mask_tile(resource_paths.rawfiles):
+        return
 
     # Check input File
     rawfile: Path = module.file_reader.validate(resource_paths.rawfiles)
+    INPUT_STAGER.wait(module.file_reader.mask_files(rawfile))
 
     # Read the file, perform a wavelet transform, and extract the metadata
-    meta: MetaType = module.file_reader.read(rawfile)
-
-    # Save metadata as CSV format
-    module.structured_processer.save_meta_to_csv(meta, rawfile.name, resource_paths.struct.joinpath(f"{rawfile.stem}.csv"))
+    coefficient_store = resource_paths.struct.joinpath(f"{rawfile.stem}_pyramid.zip") if settings.save_coefficients else None
+    meta: MetaType = TILE_DISPATCHER.read(module.file_reader, rawfile, coefficient_store=coefficient_store)
+
+    # Update the running campaign statistics of the features
+    if settings.feature_statistics:
+        CAMPAIGN_STATISTICS.record(srcpaths.inputdata.parent.joinpath("logs", STATISTICS_NAME), meta, str(rawfile.resolve()))
+
+    # Parse the metadata and save it as CSV and metadata.json from one serialized record
+    const_meta, _ = module.meta_parser.parse(meta)
+    OUTPUT_WRITER.write(
+        const_meta,
+        rawfile.name,
+        resource_paths.struct.joinpath(f"{rawfile.stem}.csv"),
+        resource_paths.meta.joinpath("metadata.json"),
+        DEFINITION_CACHE.meta(srcpaths.tasksupport.joinpath("metadata-def.json")),
+        buffer_size=settings.output_buffer,
+    )
 
     # Convert from input tif file to png file
     module.structured_processer.to_png(rawfile, resource_paths.main_image.joinpath(f"{rawfile.stem}.png"))
-    # Parse and save meta
-    module.meta_parser.parse(meta)
-    module.meta_parser.save_meta(resource_paths.meta.joinpath("metadata.json"), Meta(srcpaths.tasksupport.joinpath("metadata-def.json")))
 
     # Overwrite invoice
     module.invoice_writer.overwrite_invoice_calculated_date(resource_paths)
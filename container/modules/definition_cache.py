@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from rdetoolkit.rde2util import Meta
+
+
+@dataclass
+class _Entry:
+    stat_key: tuple[int, int]
+    digest: str
+    value: Any
+
+
+class DefinitionCache:
+    """Per-run cache of parsed definition files shared by all tiles.
+
+    In MultiDataTile mode ``dataset`` is called once per tile with the same
+    ``metadata-def.json``. Parsing it involves encoding detection and JSON
+    decoding, so the parsed object is kept here and reused while the file is
+    unchanged.
+
+    An entry is reused while the file's modification time and size are the
+    same. When they change, the content hash is compared, so a file that was
+    only touched is not parsed again.
+
+    Example:
+        cache = DefinitionCache()
+        meta = cache.meta(Path("data/tasksupport/metadata-def.json"))
+
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str, str], _Entry] = {}
+
+    def meta(self, metadef_path: Path) -> Meta:
+        """Return a new ``Meta`` object for ``metadata-def.json``.
+
+        The definition file is parsed once. Each call returns an independent
+        deep copy of the parsed object, so values assigned for one tile never
+        leak into another.
+
+        Args:
+            metadef_path (Path): Path to ``metadata-def.json``.
+
+        Returns:
+            Meta: A ``Meta`` object with no values assigned yet.
+
+        """
+        template: Meta = self._get("meta", metadef_path, Meta)
+        return copy.deepcopy(template)
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        self._entries.clear()
+
+    def _get(self, kind: str, path: Path, loader: Any) -> Any:
+        key = (kind, str(Path(path).resolve()))
+        stat = Path(path).stat()
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(key)
+        if entry is not None and entry.stat_key == stat_key:
+            return entry.value
+        digest = hashlib.sha256(Path(path).read_bytes()).hexdigest()
+        if entry is not None and entry.digest == digest:
+            entry.stat_key = stat_key
+            return entry.value
+        value = loader(path)
+        self._entries[key] = _Entry(stat_key, digest, value)
+        return value
+
+
+DEFINITION_CACHE = DefinitionCache()
@@ -0,0 +1,146 @@
+"""Registry of the output features and of the intermediates they share.
+
+Every output feature is declared with the intermediates it is computed
+from, and every intermediate with the inputs it is derived from. For a
+requested list of features :meth:`FeatureRegistry.evaluate` computes each
+required intermediate once (on first use, cached for the image) and then
+evaluates only the requested features, so a new feature that reuses an
+existing intermediate adds no pass over the image.
+
+:meth:`FeatureRegistry.requirements` returns the intermediates and inputs a
+list of features depends on. The feature extraction uses it to skip the
+expensive stages nobody needs, e.g. the pyramid decomposition when only
+pixel statistics are requested.
+
+Example:
+    registry = FeatureRegistry()
+
+    @registry.intermediate("pixels", "image")
+    def _pixels(image):
+        return image.reshape(-1)
+
+    @registry.feature("ms_max", "pixels")
+    def _max(pixels):
+        return pixels.max()
+
+    registry.evaluate(["ms_max"], {"image": image})
+
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(frozen=True)
+class Definition:
+    """A registered feature or intermediate.
+
+    Attributes:
+        name (str): Name of the value.
+        requires (tuple[str, ...]): Names of the intermediates or inputs passed to ``compute``, in order.
+        compute (Callable[..., Any]): Function computing the value from the required values.
+
+    """
+
+    name: str
+    requires: tuple[str, ...]
+    compute: Callable[..., Any]
+
+
+class FeatureRegistry:
+    """Declarations of features and intermediates, and their evaluation."""
+
+    def __init__(self) -> None:
+        self._features: dict[str, Definition] = {}
+        self._intermediates: dict[str, Definition] = {}
+
+    @property
+    def names(self) -> tuple[str, ...]:
+        """Names of the registered features, in registration order."""
+        return tuple(self._features)
+
+    def add_feature(self, name: str, requires: tuple[str, ...], compute: Callable[..., Any]) -> None:
+        """Register an output feature computed by ``compute(*requires)``."""
+        self._features[name] = Definition(name, requires, compute)
+
+    def add_intermediate(self, name: str, requires: tuple[str, ...], compute: Callable[..., Any]) -> None:
+        """Register an intermediate computed by ``compute(*requires)``."""
+        self._intermediates[name] = Definition(name, requires, compute)
+
+    def feature(self, name: str, *requires: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Return a decorator registering a function as the output feature ``name``."""
+
+        def register(compute: Callable[..., Any]) -> Callable[..., Any]:
+            self.add_feature(name, requires, compute)
+            return compute
+
+        return register
+
+    def intermediate(self, name: str, *requires: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Return a decorator registering a function as the intermediate ``name``."""
+
+        def register(compute: Callable[..., Any]) -> Callable[..., Any]:
+            self.add_intermediate(name, requires, compute)
+            return compute
+
+        return register
+
+    def check(self, names: Iterable[str]) -> None:
+        """Raise ``ValueError`` if a name is not a registered feature."""
+        unknown = [name for name in names if name not in self._features]
+        if unknown:
+            emsg = f"Unknown features: {', '.join(unknown)}. Available: {', '.join(self._features)}"
+            raise ValueError(emsg)
+
+    def requirements(self, names: Iterable[str]) -> set[str]:
+        """Return every intermediate and input the given features depend on, directly or not.
+
+        Raises:
+            ValueError: If a name is not a registered feature.
+
+        """
+        names = list(names)
+        self.check(names)
+        required: set[str] = set()
+        pending = [requirement for name in names for requirement in self._features[name].requires]
+        while pending:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                if name in self._intermediates:
+                    pending.extend(self._intermediates[name].requires)
+        return required
+
+    def evaluate(self, names: Iterable[str], inputs: Mapping[str, Any]) -> dict[str, Any]:
+        """Evaluate the requested features.
+
+        Args:
+            names (Iterable[str]): Features to evaluate, in output order.
+            inputs (Mapping[str, Any]): Values that are not computed by the registry, and
+                intermediates that were already computed elsewhere.
+
+        Returns:
+            dict[str, Any]: The value of every requested feature.
+
+        Raises:
+            ValueError: If a name is not a registered feature.
+            KeyError: If a required value is neither an input nor a registered intermediate.
+
+        """
+        names = list(names)
+        self.check(names)
+        values = dict(inputs)
+
+        def get(name: str) -> Any:
+            if name not in values:
+                if name not in self._intermediates:
+                    emsg = f"Missing input for the features: {name}"
+                    raise KeyError(emsg)
+                definition = self._intermediates[name]
+                values[name] = definition.compute(*(get(requirement) for requirement in definition.requires))
+            return values[name]
+
+        return {name: self._features[name].compute(*(get(requirement) for requirement in self._features[name].requires)) for name in names}
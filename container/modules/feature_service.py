@@ -0,0 +1,389 @@
+"""Long-running local service for steerable pyramid feature extraction.
+
+Interactive tools that would otherwise start ``python -m modules.wavelet`` per
+image can send requests to this service instead. Imports, the pyrtools C
+library and the filter banks stay loaded in a pool of worker processes, and
+concurrent requests are grouped into batches before they are handed to the
+pool.
+
+Usage:
+    python -m modules.feature_service --port 8765 --workers 4
+
+Endpoints (localhost only):
+    POST /features
+        ``Content-Type: application/json`` with ``{"path": "<image path>"}``, or
+        ``Content-Type: application/octet-stream`` with the raw image file content.
+        The query parameter ``quick=1`` selects quick mode.
+    GET /stats
+        Queue depth, number of requests in flight and latency percentiles.
+
+A request that is not answered within ``request_timeout`` seconds fails
+with 504. If the worker pool breaks (e.g. a worker is killed for running out
+of memory), the requests of the affected batches fail with 503 and the next
+batch is dispatched to a new pool.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from modules import wavelet
+from modules.image_ingest import ingest_image
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 1000
+REQUEST_TIMEOUT = 600.0
+
+
+class ServiceUnavailableError(RuntimeError):
+    """The worker pool failed before the request could be processed."""
+
+
+@dataclass
+class _Job:
+    source: str | bytes
+    quick: bool
+    submitted: float = field(default_factory=time.perf_counter)
+    future: Future = field(default_factory=Future)
+
+
+def _warm_up() -> None:
+    """Load the pyramid filters and the C convolution library in a worker process."""
+    size = wavelet.PYRAMID_FILTER_SIZE * 2 ** (wavelet.PYRAMID_HEIGHT - 1)
+    wavelet.get_steerable_pyramid_feature(np.random.default_rng(0).random((size, size)), wavelet.PYRAMID_HEIGHT, wavelet.PYRAMID_ORDER)
+
+
+def _process_batch(items: list[tuple[str | bytes, bool]]) -> list[tuple[bool, Any]]:
+    """Compute features for a batch of requests inside a worker process.
+
+    Args:
+        items (list[tuple[str | bytes, bool]]): Pairs of image source (a path or the raw
+            file content) and the quick-mode flag.
+
+    Returns:
+        list[tuple[bool, Any]]: For each item, ``(True, features)`` on success or
+        ``(False, error message)`` on failure.
+
+    """
+    results: list[tuple[bool, Any]] = []
+    for source, quick in items:
+        try:
+            image_source = Path(source) if isinstance(source, str) else io.BytesIO(source)
+            ingested = ingest_image(image_source)
+            features = wavelet.compute_features(ingested.pixels, quick=quick) | ingested.metadata()
+            results.append((True, features))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class FeatureService:
+    """Batching front end for a pool of warm feature-extraction workers.
+
+    Requests are queued by :meth:`submit`. A dispatcher thread takes the first
+    waiting request, collects further requests for up to ``max_batch_wait``
+    seconds (at most ``max_batch_size``), and sends them to a worker as one
+    task. At most ``workers`` batches are in flight, so the queue depth
+    reported by :meth:`stats` reflects the real backlog.
+
+    Args:
+        workers (int): Number of worker processes.
+        max_batch_size (int): Maximum number of requests per batch.
+        max_batch_wait (float): Time in seconds to wait for more requests before dispatching.
+        request_timeout (float): Time in seconds the HTTP front end waits for a result.
+
+    Example:
+        service = FeatureService(workers=4)
+        service.start()
+        features = service.submit("image.tif").result()
+        service.stop()
+
+    """
+
+    def __init__(self, workers: int = 1, max_batch_size: int = 8, max_batch_wait: float = 0.01, request_timeout: float = REQUEST_TIMEOUT):
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.request_timeout = request_timeout
+        self._queue: queue.Queue[_Job | None] = queue.Queue()
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._batches = 0
+        self._pool_restarts = 0
+        self._pool_broken = False
+        self._executor: ProcessPoolExecutor | None = None
+        self._dispatcher: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start the worker pool and the dispatcher thread."""
+        self._pool()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="feature-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self) -> None:
+        """Stop accepting requests and shut down the worker pool."""
+        self._queue.put(None)
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def submit(self, source: str | bytes, *, quick: bool = False) -> Future:
+        """Queue a feature-extraction request.
+
+        Args:
+            source (str | bytes): Path of the image file, or the raw file content.
+            quick (bool): If True, compute provisional quick-mode features.
+
+        Returns:
+            Future: Resolves to the feature dictionary, or raises ``RuntimeError``
+            with the worker's error message (:class:`ServiceUnavailableError` if
+            the worker pool failed).
+
+        """
+        job = _Job(source, quick)
+        self._queue.put(job)
+        return job.future
+
+    def stats(self) -> dict[str, Any]:
+        """Return queue depth, throughput counters and latency percentiles in milliseconds."""
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            result: dict[str, Any] = {
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "batches": self._batches,
+                "pool_restarts": self._pool_restarts,
+                "workers": self.workers,
+            }
+        if latencies.size:
+            p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+            result["latency_ms"] = {"p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(latencies.max())}
+        else:
+            result["latency_ms"] = None
+        return result
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = time.perf_counter() + self.max_batch_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    job = self._queue.get(timeout=max(deadline - time.perf_counter(), 0.0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)
+                    break
+                batch.append(job)
+            self._slots.acquire()
+            with self._lock:
+                self._in_flight += len(batch)
+                self._batches += 1
+            try:
+                task = self._pool().submit(_process_batch, [(j.source, j.quick) for j in batch])
+            except Exception as e:
+                # Keep dispatching: fail this batch and start a new pool for the next one.
+                self._pool_broken = True
+                task = Future()
+                task.set_exception(e)
+            task.add_done_callback(partial(self._complete, batch))
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """Return the worker pool, replacing it first if it is broken."""
+        if self._executor is not None and self._pool_broken:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pool_restarts += 1
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up)
+            self._pool_broken = False
+        return self._executor
+
+    def _complete(self, batch: list[_Job], task: Future) -> None:
+        self._slots.release()
+        now = time.perf_counter()
+        unavailable = False
+        try:
+            results = task.result()
+        except Exception as e:
+            # Errors of single images are returned in the results; this is a failure of the pool.
+            unavailable = True
+            if isinstance(e, BrokenProcessPool):
+                self._pool_broken = True
+            results = [(False, f"{type(e).__name__}: {e}")] * len(batch)
+        with self._lock:
+            self._in_flight -= len(batch)
+            for job, (ok, _) in zip(batch, results, strict=True):
+                self._latencies.append(now - job.submitted)
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+        for job, (ok, value) in zip(batch, results, strict=True):
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(ServiceUnavailableError(value) if unavailable else RuntimeError(value))
+
+
+class _FeatureRequestHandler(BaseHTTPRequestHandler):
+    server: _FeatureHTTPServer
+
+    def do_GET(self) -> None:  # noqa: N802
+        if urlparse(self.path).path != "/stats":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "unknown endpoint"})
+            return
+        self._send_json(HTTPStatus.OK, self.server.service.stats())
+
+    def do_POST(self) -> None:  # noqa: N802
+        url = urlparse(self.path)
+        if url.path != "/features":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "unknown endpoint"})
+            return
+        quick = parse_qs(url.query).get("quick", ["0"])[0] in ("1", "true")
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        source: str | bytes
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                source = str(json.loads(body)["path"])
+            except (ValueError, KeyError, TypeError):
+                self._send_json(HTTPStatus.BAD_REQUEST, {"error": 'expected {"path": "<image path>"}'})
+                return
+        else:
+            source = body
+        try:
+            features = self.server.service.submit(source, quick=quick).result(timeout=self.server.service.request_timeout)
+        except TimeoutError:
+            self._send_json(HTTPStatus.GATEWAY_TIMEOUT, {"error": "request timed out"})
+            return
+        except ServiceUnavailableError as e:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)})
+            return
+        except RuntimeError as e:
+            self._send_json(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)})
+            return
+        self._send_json(HTTPStatus.OK, features)
+
+    def _send_json(self, status: HTTPStatus, payload: Any) -> None:
+        content = json.dumps(payload, default=_to_builtin).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Silence per-request logging."""
+
+
+class _FeatureHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], service: FeatureService):
+        super().__init__(address, _FeatureRequestHandler)
+        self.service = service
+
+
+def _to_builtin(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    err_msg = f"Object of type {type(value).__name__} is not JSON serializable"
+    raise TypeError(err_msg)
+
+
+def create_server(service: FeatureService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Create the HTTP front end for a started :class:`FeatureService`.
+
+    Args:
+        service (FeatureService): The service that processes the requests.
+        host (str): Address to bind. Only loopback addresses should be used.
+        port (int): Port to bind. ``0`` selects a free port.
+
+    Returns:
+        ThreadingHTTPServer: The server. Call ``serve_forever`` to handle requests.
+
+    """
+    return _FeatureHTTPServer((host, port), service)
+
+
+def request_features(source: Path | bytes, *, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", quick: bool = False, timeout: float = 600.0) -> dict[str, Any]:
+    """Request features from a running service.
+
+    Args:
+        source (Path | bytes): Path of the image file, or the raw file content.
+        url (str): Base URL of the service.
+        quick (bool): If True, request quick-mode features.
+        timeout (float): Timeout in seconds.
+
+    Returns:
+        dict[str, Any]: The feature dictionary returned by the service.
+
+    """
+    if isinstance(source, bytes):
+        data, content_type = source, "application/octet-stream"
+    else:
+        data, content_type = json.dumps({"path": str(Path(source).resolve())}).encode("utf-8"), "application/json"
+    request = Request(f"{url}/features?quick={int(quick)}", data=data, headers={"Content-Type": content_type}, method="POST")  # noqa: S310
+    with urlopen(request, timeout=timeout) as response:  # noqa: S310
+        return json.loads(response.read())
+
+
+def request_stats(*, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout: float = 10.0) -> dict[str, Any]:
+    """Return the queue depth and latency statistics of a running service."""
+    with urlopen(f"{url}/stats", timeout=timeout) as response:  # noqa: S310
+        return json.loads(response.read())
+
+
+def main(host: str, port: int, workers: int, max_batch_size: int, max_batch_wait: float, *, request_timeout: float = REQUEST_TIMEOUT) -> None:
+    """Run the service until interrupted."""
+    service = FeatureService(workers=workers, max_batch_size=max_batch_size, max_batch_wait=max_batch_wait, request_timeout=request_timeout)
+    service.start()
+    server = create_server(service, host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-wait", type=float, default=0.01)
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT)
+    options = parser.parse_args()
+    main(options.host, options.port, options.workers, options.max_batch_size, options.max_batch_wait, request_timeout=options.request_timeout)
@@ -0,0 +1,202 @@
+"""Running campaign-level statistics of the extracted features.
+
+Normalizing features by the campaign mean and covariance used to mean
+re-reading every structured CSV. :class:`RunningStatistics` keeps the count,
+the mean vector and the co-moment matrix (the sum of outer products of the
+deviations from the mean) instead. One image updates them in
+O(len(FEATURE_NAMES) ** 2) with Welford's algorithm. Two states, for example
+from shards processed by parallel runs, are combined exactly with the
+pairwise formula of Chan et al.
+
+``dataset`` updates ``data/logs/feature_statistics.json`` after every tile
+through :data:`CAMPAIGN_STATISTICS`. Features of another
+:func:`wavelet.feature_variant` (engine, mode or extent) are not comparable
+and go to ``feature_statistics_<engine>_<mode>_<extent>.json`` instead.
+The persisted state has a fixed size whatever the number of images. A
+file that ``dataset`` sees twice in one run is counted once; which files
+were counted is not persisted. Shards are merged with:
+
+    python -m modules.feature_statistics <output.json> <shard.json>...
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from modules import wavelet
+from modules.output_writer import atomic_write_bytes
+
+STATISTICS_NAME = "feature_statistics.json"
+
+
+class RunningStatistics:
+    """Mergeable mean, variance and covariance of feature vectors.
+
+    Args:
+        names (tuple[str, ...]): Feature names, in the order of the vectors.
+
+    Example:
+        statistics = RunningStatistics()
+        statistics.update(features)
+        statistics.merge(RunningStatistics.load(Path("shard.json")))
+        z = (vector - statistics.mean) / statistics.std()
+
+    """
+
+    def __init__(self, names: tuple[str, ...] = wavelet.FEATURE_NAMES):
+        self.names = tuple(names)
+        self.count = 0
+        self.mean = np.zeros(len(self.names))
+        self.comoment = np.zeros((len(self.names), len(self.names)))
+
+    def update(self, features: np.ndarray | dict[str, Any]) -> bool:
+        """Add one feature vector.
+
+        Args:
+            features (np.ndarray | dict[str, Any]): Vector in the order of ``names``, or a
+                dictionary containing those keys.
+
+        Returns:
+            bool: False if the vector was skipped because a feature is missing or not finite.
+
+        """
+        if isinstance(features, dict):
+            if not all(name in features for name in self.names):
+                return False
+            features = np.array([float(features[name]) for name in self.names])
+        vector = np.asarray(features, dtype=float)
+        if not np.all(np.isfinite(vector)):
+            return False
+        self.count += 1
+        delta = vector - self.mean
+        self.mean += delta / self.count
+        self.comoment += np.outer(delta, vector - self.mean)
+        return True
+
+    def merge(self, other: RunningStatistics) -> None:
+        """Combine the statistics of another set of vectors into this one.
+
+        Raises:
+            ValueError: If the feature names differ.
+
+        """
+        if other.names != self.names:
+            emsg = f"Cannot merge statistics of different features: {other.names} != {self.names}"
+            raise ValueError(emsg)
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment += other.comoment + np.outer(delta, delta) * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+
+    def covariance(self, ddof: int = 1) -> np.ndarray:
+        """Return the covariance matrix (NaN with fewer than ``ddof + 1`` vectors)."""
+        if self.count <= ddof:
+            return np.full_like(self.comoment, np.nan)
+        return self.comoment / (self.count - ddof)
+
+    def variance(self, ddof: int = 1) -> np.ndarray:
+        """Return the variance of every feature."""
+        return np.diag(self.covariance(ddof)).copy()
+
+    def std(self, ddof: int = 1) -> np.ndarray:
+        """Return the standard deviation of every feature."""
+        return np.sqrt(self.variance(ddof))
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return a JSON-serializable representation of the state."""
+        return {"names": list(self.names), "count": self.count, "mean": self.mean.tolist(), "comoment": self.comoment.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> RunningStatistics:
+        """Restore a state written by :meth:`to_dict`."""
+        statistics = cls(tuple(data["names"]))
+        statistics.count = int(data["count"])
+        statistics.mean = np.array(data["mean"], dtype=float)
+        statistics.comoment = np.array(data["comoment"], dtype=float)
+        return statistics
+
+    def save(self, path: Path) -> None:
+        """Write the state to a JSON file, replacing it atomically."""
+        atomic_write_bytes(path, json.dumps(self.to_dict(), indent=2).encode("utf-8"))
+
+    @classmethod
+    def load(cls, path: Path) -> RunningStatistics:
+        """Read a state written by :meth:`save`."""
+        return cls.from_dict(json.loads(path.read_text(encoding="utf-8")))
+
+
+class CampaignStatistics:
+    """Per-run registry of the persisted statistics files updated by ``dataset``.
+
+    Each file is read once per process (so a resumed run keeps counting) and
+    written back after every update. The keys of the images counted by this
+    process are kept in memory only.
+    """
+
+    def __init__(self) -> None:
+        self._states: dict[Path, RunningStatistics] = {}
+        self._counted: dict[Path, set[str]] = {}
+
+    def record(self, path: Path, features: dict[str, Any], key: str | None = None) -> None:
+        """Add the features of one image to the statistics stored at ``path``.
+
+        Images flagged by the pre-screen (``image_quality`` other than ``"ok"``),
+        outputs without the plain feature names (per-channel features) and images
+        whose ``key`` was already counted by this process are not counted. Features of another
+        variant than :data:`wavelet.STANDARD_VARIANT` are counted in a file next to
+        ``path`` named after the variant.
+
+        Args:
+            path (Path): Statistics file of the standard features.
+            features (dict[str, Any]): Extracted metadata of one image.
+            key (str | None): Identifies the image within the run, e.g. its resolved path.
+
+        """
+        if features.get("image_quality", "ok") != "ok":
+            return
+        path = variant_path(path, wavelet.feature_variant(features))
+        resolved = path.resolve()
+        if resolved not in self._states:
+            self._states[resolved] = RunningStatistics.load(path) if path.exists() else RunningStatistics()
+            self._counted[resolved] = set()
+        if key in self._counted[resolved]:
+            return
+        if self._states[resolved].update(features):
+            if key is not None:
+                self._counted[resolved].add(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._states[resolved].save(path)
+
+
+def variant_path(path: Path, variant: tuple[str, str, str]) -> Path:
+    """Return the statistics file of a feature variant (``path`` itself for the standard one)."""
+    if variant == wavelet.STANDARD_VARIANT:
+        return path
+    return path.with_name(f"{path.stem}_{'_'.join(variant)}{path.suffix}")
+
+
+CAMPAIGN_STATISTICS = CampaignStatistics()
+
+
+def main(output_path: Path, shard_paths: list[Path]) -> None:
+    """Merge statistics files into one."""
+    merged = RunningStatistics.load(shard_paths[0])
+    for path in shard_paths[1:]:
+        merged.merge(RunningStatistics.load(path))
+    merged.save(output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_path")
+    parser.add_argument("shard_paths", nargs="+")
+    options = parser.parse_args()
+    main(Path(options.output_path), [Path(p) for p in options.shard_paths])
@@ -0,0 +1,232 @@
+"""Decoding of input images into 2-D arrays ready for the pyramid.
+
+The steerable pyramid works on one 2-D plane, but microscopes also write
+RGB, palette, bilevel and 16-bit TIFF files. :func:`ingest_image` decodes an
+image, crops it, and normalizes it to a grayscale plane:
+
+* Grayscale images are returned as a view on the decoded buffer (no copy,
+  no dtype conversion).
+* Bilevel images become ``uint8`` 0/1 (one byte-wise pass, no float copy).
+* Multi-channel and palette images are converted to luminance (ITU-R BT.601
+  weights, as PIL's ``"L"`` conversion) in a single fused step that writes
+  ``float64`` values directly, without an intermediate 3-channel float copy
+  or the rounding of an 8-bit grayscale image.
+
+With ``keep_channels=True`` the samples are kept instead and returned as a
+``(channels, rows, cols)`` stack for the per-channel features (palette
+images are expanded to RGB). The mode and bit depth of the original image
+are returned with the pixels so that they can be reported in the metadata.
+
+:func:`map_image` gives the same grayscale plane of a whole TIFF file as a
+memory map, for images that do not fit in memory.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import numpy as np
+from PIL import Image
+
+from modules import tiff_reader
+
+LUMA_WEIGHTS: tuple[float, float, float] = (0.299, 0.587, 0.114)
+TIFF_SUFFIXES: tuple[str, ...] = (".tif", ".tiff")
+# Rows converted at a time by map_image.
+MAP_BAND_ROWS: int = 256
+# Samples of an RGB pixel; fewer samples are gray (+ alpha).
+RGB_SAMPLES: int = 3
+# Dimensions of a (rows, cols) plane and of a (rows, cols, samples) array.
+PLANE_NDIM: int = 2
+SAMPLES_NDIM: int = 3
+
+# Bits per sample of the PIL modes that can reach the pyramid.
+_PIL_BIT_DEPTHS: dict[str, int] = {"1": 1, "I": 32, "F": 32, "I;16": 16, "I;16L": 16, "I;16B": 16, "I;16N": 16}
+
+
+@dataclass(frozen=True)
+class IngestedImage:
+    """A decoded image normalized to one grayscale plane.
+
+    Attributes:
+        pixels (np.ndarray): 2-D pixel array, or a ``(channels, rows, cols)`` stack when the
+            channels are kept. Grayscale input keeps its dtype and may be a read-only view on
+            the decoded buffer; converted color input is ``float64``.
+        mode (str): Mode of the original image in PIL notation (e.g. ``"L"``, ``"I;16"``,
+            ``"RGB"``, ``"P"``).
+        bit_depth (int): Bits per sample of the original image.
+
+    """
+
+    pixels: np.ndarray
+    mode: str
+    bit_depth: int
+
+    def metadata(self) -> dict[str, Any]:
+        """Return the original mode and bit depth as ``image_mode`` and ``image_bit_depth``."""
+        return {"image_mode": self.mode, "image_bit_depth": self.bit_depth}
+
+
+def ingest_image(source: Path | BinaryIO, *, backend: str = "pil", threads: int = 1, crop: int | None = None, keep_channels: bool = False) -> IngestedImage:
+    """Decode an image file and normalize it to a grayscale plane.
+
+    Args:
+        source (Path | BinaryIO): Path to the image file, or a binary stream with its content.
+        backend (str): ``"pil"`` decodes with PIL. ``"tifffile"`` decodes the tiles or
+            strips of a TIFF file in parallel and only those inside ``crop``.
+            ``"auto"`` uses tifffile for TIFF paths when it is installed.
+        threads (int): Number of decoding threads of the tifffile backend.
+        crop (int | None): Edge length of the top-left region to return. ``None`` returns
+            the whole image.
+        keep_channels (bool): If True, return every sample (including alpha) as a channel
+            of a ``(channels, rows, cols)`` view instead of converting to grayscale.
+
+    Returns:
+        IngestedImage: The grayscale pixels with the original mode and bit depth.
+
+    """
+    backend = resolve_backend(source, backend)
+    if backend == "tifffile":
+        return _ingest_tifffile(Path(source), crop, threads, keep_channels)  # type: ignore[arg-type]
+    return _ingest_pil(source, crop, keep_channels)
+
+
+def map_image(path: Path, scratch: Path, *, threads: int = 1) -> IngestedImage:
+    """Memory-map a TIFF file as a grayscale plane without holding the image in memory.
+
+    Grayscale pages are returned as the memory map of :func:`tiff_reader.map_tiff`.
+    Color, palette, inverted and bilevel pages are converted like :func:`ingest_image`
+    in bands of ``MAP_BAND_ROWS`` rows into another memory-mapped file.
+
+    Args:
+        path (Path): Path to the TIFF file.
+        scratch (Path): Existing directory for the decoded and converted pixels.
+        threads (int): Number of decoding threads.
+
+    Returns:
+        IngestedImage: The memory-mapped grayscale pixels with the original mode and bit depth.
+
+    """
+    info = tiff_reader.read_page_info(path)
+    pixels = tiff_reader.map_tiff(path, scratch.joinpath("decoded.raw"), threads=threads)
+    if pixels.ndim == PLANE_NDIM and pixels.dtype != np.bool_ and info.photometric not in ("PALETTE", "MINISWHITE"):
+        return IngestedImage(pixels, info.mode, info.bit_depth)
+    # Bands of a float inverted page are inverted against the maximum of the whole page.
+    white = _white_level(pixels, info) if info.photometric == "MINISWHITE" else None
+    gray: np.ndarray | None = None
+    for y in range(0, pixels.shape[0], MAP_BAND_ROWS):
+        band = _normalize_tiff(np.asarray(pixels[y : y + MAP_BAND_ROWS]), info, keep_channels=False, white=white).pixels
+        if gray is None:
+            gray = np.memmap(scratch.joinpath("gray.raw"), dtype=band.dtype, mode="w+", shape=pixels.shape[:2])
+        gray[y : y + band.shape[0]] = band
+    return IngestedImage(gray, info.mode, info.bit_depth)  # type: ignore[arg-type]
+
+
+def resolve_backend(source: Path | BinaryIO, backend: str) -> str:
+    """Return the backend :func:`ingest_image` uses for ``source``; ``"auto"`` becomes ``"pil"`` or ``"tifffile"``."""
+    if backend != "auto":
+        return backend
+    is_tiff_path = isinstance(source, Path) and source.suffix.lower() in TIFF_SUFFIXES
+    return "tifffile" if is_tiff_path and tiff_reader.is_available() else "pil"
+
+
+def to_grayscale(pixels: np.ndarray) -> np.ndarray:
+    """Return the luminance of a ``(rows, cols, samples)`` array as ``float64``.
+
+    Extra samples after the third (alpha) are ignored and two-sample images
+    (gray + alpha) return their first sample as a view. The weighted sum is
+    accumulated channel by channel into the output, so no float copy of the
+    whole multi-channel array is made.
+
+    Args:
+        pixels (np.ndarray): Pixel array with the samples on the last axis.
+
+    Returns:
+        np.ndarray: 2-D grayscale array.
+
+    """
+    if pixels.shape[-1] < RGB_SAMPLES:
+        return pixels[..., 0]
+    gray = np.multiply(pixels[..., 0], LUMA_WEIGHTS[0], dtype=np.float64)
+    scratch = np.empty_like(gray)
+    for channel in (1, 2):
+        np.multiply(pixels[..., channel], LUMA_WEIGHTS[channel], out=scratch, dtype=np.float64)
+        gray += scratch
+    return gray
+
+
+def palette_to_grayscale(indices: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """Map palette indices to luminance through a lookup table.
+
+    Args:
+        indices (np.ndarray): 2-D array of palette indices.
+        palette (np.ndarray): ``(entries, 3)`` RGB palette.
+
+    Returns:
+        np.ndarray: 2-D ``float64`` grayscale array.
+
+    """
+    lut = palette.astype(np.float64) @ np.asarray(LUMA_WEIGHTS)
+    return np.take(lut, indices)
+
+
+def _ingest_pil(source: Path | BinaryIO, crop: int | None, keep_channels: bool) -> IngestedImage:
+    with Image.open(source) as opened:
+        mode = opened.mode
+        bit_depth = _PIL_BIT_DEPTHS.get(mode, 8)
+        image: Image.Image = opened
+        if crop is not None and (image.width > crop or image.height > crop):
+            image = image.crop((0, 0, min(image.width, crop), min(image.height, crop)))
+        if mode in ("P", "PA"):
+            palette = np.asarray(image.getpalette("RGB"), dtype=np.uint8).reshape(-1, 3)
+            indices = np.asarray(image)
+            indices = indices[..., 0] if mode == "PA" else indices
+            if keep_channels:
+                return IngestedImage(_channels_first(np.take(palette, indices, axis=0)), mode, bit_depth)
+            return IngestedImage(palette_to_grayscale(indices, palette), mode, bit_depth)
+        if mode in ("CMYK", "YCbCr", "LAB", "HSV"):
+            image = image.convert("RGB")
+        # np.asarray wraps PIL's pixel bytes without a second copy.
+        pixels = np.asarray(image)
+    return IngestedImage(_normalize_samples(pixels, keep_channels), mode, bit_depth)
+
+
+def _ingest_tifffile(path: Path, crop: int | None, threads: int, keep_channels: bool) -> IngestedImage:
+    info = tiff_reader.read_page_info(path)
+    return _normalize_tiff(tiff_reader.read_tiff(path, crop=crop, threads=threads), info, keep_channels)
+
+
+def _normalize_tiff(pixels: np.ndarray, info: tiff_reader.TiffPageInfo, keep_channels: bool, *, white: Any = None) -> IngestedImage:
+    if info.photometric == "PALETTE" and info.colormap is not None:
+        # TIFF colormaps are 16-bit; PIL keeps the upper byte.
+        palette = (info.colormap >> 8).T
+        if keep_channels:
+            return IngestedImage(_channels_first(np.take(palette, pixels, axis=0)), info.mode, info.bit_depth)
+        return IngestedImage(palette_to_grayscale(pixels, palette), info.mode, info.bit_depth)
+    if info.photometric == "MINISWHITE":
+        pixels = np.logical_not(pixels) if pixels.dtype == np.bool_ else (_white_level(pixels, info) if white is None else white) - pixels
+    return IngestedImage(_normalize_samples(pixels, keep_channels), info.mode, info.bit_depth)
+
+
+def _white_level(pixels: np.ndarray, info: tiff_reader.TiffPageInfo) -> Any:
+    # Integer samples are inverted within their bit depth (e.g. 15 for 4-bit samples
+    # unpacked to uint8), float samples against the maximum of the page.
+    if pixels.dtype.kind in "ui":
+        return pixels.dtype.type(2**info.bit_depth - 1)
+    return pixels.max() if pixels.size else 0
+
+
+def _normalize_samples(pixels: np.ndarray, keep_channels: bool) -> np.ndarray:
+    if pixels.ndim == SAMPLES_NDIM and not keep_channels:
+        pixels = to_grayscale(pixels)
+    if pixels.dtype == np.bool_:
+        # PIL stores bilevel pixels as 0/255 bytes behind the bool dtype.
+        pixels = (pixels.view(np.uint8) != 0).view(np.uint8)
+    return _channels_first(pixels) if keep_channels else pixels
+
+
+def _channels_first(pixels: np.ndarray) -> np.ndarray:
+    return pixels[np.newaxis] if pixels.ndim == PLANE_NDIM else np.moveaxis(pixels, -1, 0)
+
@@ -0,0 +1,307 @@
+"""Streaming staging of the input files from object storage.
+
+The batch job normally downloads the whole job directory into ``data``
+before ``main.py`` starts, so the first tile waits for the last byte of the
+last image. With ``main.py --stage-from <source>`` the task downloads the
+job directory itself through :class:`InputStager` instead:
+
+- everything outside ``inputdata`` (``invoice``, ``tasksupport``) and the
+  input files rdetoolkit parses before the first tile (ZIP archives, Excel
+  invoices) are downloaded first, before rdetoolkit starts;
+- every other input file gets an empty placeholder under its final name, so
+  rdetoolkit lists and numbers the tiles as usual, and is then downloaded
+  in the background, in the order rdetoolkit processes the tiles, into a
+  partial file that is renamed over the placeholder when complete;
+- ``dataset`` waits for the files of its own tile only (:meth:`InputStager.wait`),
+  so the first tile is processed while the following files are still
+  being transferred.
+
+rdetoolkit copies the raw files of a tile to ``raw``/``nonshared_raw``
+before it calls ``dataset``, i.e. possibly while they are placeholders;
+:func:`refresh_raw_copies` copies them again once they have arrived.
+
+A source is a local directory (``file://`` or a plain path, e.g. a mounted
+blob container), served by :class:`LocalStorage`, or an Azure Blob Storage
+container (``az://<container>/<prefix>``, authenticated with the
+``AZURE_STORAGE_CONNECTION_STRING`` environment variable), served by
+:class:`AzureBlobStorage`. :class:`LocalStorage` can also limit its
+transfer rate, which makes it an offline stand-in for a remote store.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Self
+
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.models.config import SystemSettings
+from rdetoolkit.models.rde2types import RdeOutputResourcePath
+
+try:
+    from azure.storage.blob import ContainerClient  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover
+    ContainerClient = None  # type: ignore[assignment,misc]
+
+INPUT_DIR = "inputdata"
+# Input files rdetoolkit reads while listing the tiles, before the first one is processed.
+EAGER_SUFFIXES = (".zip", ".xls", ".xlsx")
+DOWNLOAD_WORKERS = 2
+CHUNK_SIZE = 8 * 2**20
+
+
+class StorageBackend(ABC):
+    """Read-only access to the files of a job directory in a storage service."""
+
+    @abstractmethod
+    def list_keys(self) -> list[str]:
+        """Return the keys of all files, as ``/``-separated paths relative to the job directory."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def download(self, key: str, destination: Path) -> None:
+        """Download the file ``key`` to ``destination``."""
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    """Storage backend of a local directory.
+
+    Args:
+        root (Path): The job directory.
+        bandwidth (float | None): If given, the transfer rate is limited to this many
+            bytes per second, to emulate a remote store.
+
+    Raises:
+        ValueError: If ``root`` is not a directory.
+
+    """
+
+    def __init__(self, root: Path, *, bandwidth: float | None = None) -> None:
+        if not root.is_dir():
+            emsg = f"Staging source is not a directory: {root}"
+            raise ValueError(emsg)
+        self.root = root
+        self.bandwidth = bandwidth
+
+    def list_keys(self) -> list[str]:
+        """Return the paths of all files below the job directory."""
+        return sorted(path.relative_to(self.root).as_posix() for path in self.root.rglob("*") if path.is_file())
+
+    def download(self, key: str, destination: Path) -> None:
+        """Copy the file ``key`` to ``destination`` in chunks, at most at ``bandwidth``."""
+        start = time.perf_counter()
+        copied = 0
+        with self.root.joinpath(key).open("rb") as source, destination.open("wb") as target:
+            while chunk := source.read(CHUNK_SIZE):
+                target.write(chunk)
+                copied += len(chunk)
+                if self.bandwidth is not None:
+                    time.sleep(max(0.0, copied / self.bandwidth - (time.perf_counter() - start)))
+
+
+class AzureBlobStorage(StorageBackend):
+    """Storage backend of the blobs below a prefix of an Azure Blob Storage container.
+
+    Args:
+        container (str): Container name.
+        prefix (str): Blob name prefix of the job directory.
+        connection_string (str): Storage account connection string.
+
+    Raises:
+        ImportError: If azure-storage-blob is not installed.
+
+    """
+
+    def __init__(self, container: str, prefix: str, connection_string: str) -> None:
+        if ContainerClient is None:
+            emsg = "azure-storage-blob is required to stage from Azure Blob Storage"
+            raise ImportError(emsg)
+        self.client = ContainerClient.from_connection_string(connection_string, container)
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    def list_keys(self) -> list[str]:
+        """Return the names of the blobs below the prefix, without the prefix."""
+        return sorted(blob.name[len(self.prefix) :] for blob in self.client.list_blobs(name_starts_with=self.prefix) if not blob.name.endswith("/"))
+
+    def download(self, key: str, destination: Path) -> None:
+        """Download the blob ``key`` to ``destination`` with concurrent range requests."""
+        with destination.open("wb") as target:
+            self.client.download_blob(self.prefix + key, max_concurrency=DOWNLOAD_WORKERS).readinto(target)
+
+
+def open_storage(source: str) -> StorageBackend:
+    """Return the storage backend of a staging source.
+
+    Args:
+        source (str): ``az://<container>/<prefix>``, ``file://<directory>`` or a directory path.
+
+    Returns:
+        StorageBackend: The backend of the source.
+
+    Raises:
+        ValueError: If the source is not a directory or the Azure connection string is not set.
+
+    """
+    if source.startswith("az://"):
+        container, _, prefix = source.removeprefix("az://").partition("/")
+        connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+        if not connection_string:
+            emsg = "AZURE_STORAGE_CONNECTION_STRING is required to stage from Azure Blob Storage"
+            raise ValueError(emsg)
+        return AzureBlobStorage(container, prefix, connection_string)
+    return LocalStorage(Path(source.removeprefix("file://")))
+
+
+def is_streamed(key: str) -> bool:
+    """Return True if a file is downloaded in the background while the tiles are processed."""
+    path = PurePosixPath(key)
+    return path.parent == PurePosixPath(INPUT_DIR) and path.suffix.lower() not in EAGER_SUFFIXES
+
+
+class InputStager:
+    """Background download of the input files of a run.
+
+    Without a source, or for files that were not staged, :meth:`wait` returns
+    immediately, so ``dataset`` calls it unconditionally.
+
+    Example:
+        with INPUT_STAGER.open(source, Path("data")):
+            rdetoolkit.workflows.run(custom_dataset_function=dataset)
+
+    """
+
+    def __init__(self) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+        self._futures: dict[Path, Future] = {}
+        self._partial_dir: Path | None = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.shutdown()
+
+    def open(self, source: str | None, data_dir: Path, *, workers: int = DOWNLOAD_WORKERS) -> Self:
+        """Start staging from ``source`` if it is given (see :func:`open_storage`) and return the stager.
+
+        Raises:
+            StructuredError: If the source cannot be opened or listed, or a file needed before
+                the first tile cannot be downloaded.
+
+        """
+        if source:
+            try:
+                storage = open_storage(source)
+            except (ValueError, ImportError) as e:
+                emsg = f"Invalid staging source {source}: {e}"
+                raise StructuredError(emsg) from e
+            self.start(storage, data_dir, workers=workers)
+        return self
+
+    def start(self, storage: StorageBackend, data_dir: Path, *, workers: int = DOWNLOAD_WORKERS) -> None:
+        """Download the control files and start the background download of the input files.
+
+        Args:
+            storage (StorageBackend): Source of the job directory.
+            data_dir (Path): The ``data`` directory of the run.
+            workers (int): Number of concurrent downloads.
+
+        Raises:
+            StructuredError: If the source cannot be listed or a file needed before the first
+                tile cannot be downloaded.
+
+        """
+        self.shutdown()
+        data_dir.mkdir(parents=True, exist_ok=True)
+        partial_dir = self._partial_dir = Path(tempfile.mkdtemp(prefix=".staging_", dir=data_dir))
+        try:
+            keys = storage.list_keys()
+        except Exception as e:
+            emsg = f"Failed to list the staging source: {e}"
+            raise StructuredError(emsg) from e
+        for key in keys:
+            if not is_streamed(key):
+                try:
+                    self._download(storage, key, data_dir.joinpath(key), partial_dir)
+                except Exception as e:
+                    emsg = f"Failed to stage {key}: {e}"
+                    raise StructuredError(emsg) from e
+        streamed = sorted((data_dir.joinpath(key) for key in keys if is_streamed(key)), key=str)
+        for path in streamed:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="input_staging")
+        for path in streamed:
+            self._futures[path.resolve()] = self._executor.submit(self._download, storage, path.relative_to(data_dir).as_posix(), path, partial_dir)
+
+    def wait(self, paths: Iterable[Path]) -> bool:
+        """Wait until the given files have been downloaded.
+
+        Args:
+            paths (Iterable[Path]): Files of a tile.
+
+        Returns:
+            bool: True if any of the files was staged in the background.
+
+        Raises:
+            StructuredError: If the download of one of the files failed.
+
+        """
+        staged = False
+        for path in paths:
+            future = self._futures.get(path.resolve())
+            if future is None:
+                continue
+            staged = True
+            try:
+                future.result()
+            except Exception as e:
+                emsg = f"Failed to stage input file {path.name}: {e}"
+                raise StructuredError(emsg) from e
+        return staged
+
+    def is_ready(self, path: Path) -> bool:
+        """Return True if a file is complete: not staged, or successfully downloaded."""
+        future = self._futures.get(path.resolve())
+        return future is None or (future.done() and not future.cancelled() and future.exception() is None)
+
+    def shutdown(self) -> None:
+        """Cancel the pending downloads and remove the partial files."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._futures.clear()
+        if self._partial_dir is not None:
+            shutil.rmtree(self._partial_dir, ignore_errors=True)
+            self._partial_dir = None
+
+    @staticmethod
+    def _download(storage: StorageBackend, key: str, destination: Path, partial_dir: Path) -> None:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        partial = partial_dir.joinpath(key)
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            storage.download(key, partial)
+            os.replace(partial, destination)
+        finally:
+            partial.unlink(missing_ok=True)
+
+
+def refresh_raw_copies(system: SystemSettings, resource_paths: RdeOutputResourcePath) -> None:
+    """Copy the raw files of a tile again where rdetoolkit copied them before they were staged."""
+    targets = [directory for enabled, directory in ((system.save_raw, resource_paths.raw), (system.save_nonshared_raw, resource_paths.nonshared_raw)) if enabled]
+    for path in resource_paths.rawfiles:
+        for directory in targets:
+            copy = directory.joinpath(path.name)
+            if copy.exists() and copy.stat().st_size != path.stat().st_size:
+                shutil.copy2(path, copy)
+
+
+INPUT_STAGER = InputStager()
@@ -1,10 +1,21 @@
+from __future__ import annotations
+
 from pathlib import Path
 
 from rdetoolkit.exceptions import StructuredError
 from rdetoolkit.models.rde2types import MetaType
+from rdetoolkit.rdelogger import get_logger
 
-from modules import wavelet
+from modules import masking, out_of_core, wavelet
+from modules.image_ingest import resolve_backend
 from modules.interfaces import IInputFileParser
+from modules.settings import WaveletSettings
+from modules.tiff_header import TiffHeader, TiffHeaderError, read_tiff_header
+
+# Memory kept free for the interpreter and the rest of the structuring process.
+MEMORY_RESERVE: int = 256 * 1024**2
+
+logger = get_logger(__name__, file_path="data/logs/rdesys.log")
 
 
 class FileReader(IInputFileParser):
@@ -16,7 +27,13 @@ class FileReader(IInputFileParser):
     requirements.
 
     Args:
-        srcpaths (tuple[Path, ...]): Paths to input source files.
+        settings (WaveletSettings | None): Feature extraction settings. Defaults to the
+            full computation if not provided.
+
+    Attributes:
+        header (TiffHeader | None): Header of the last validated file.
+        threads (int): Number of threads planned for the last validated file. It is
+            ``settings.threads`` unless less memory is available than that needs.
 
     Returns:
         Any: The loaded data from the input file(s).
@@ -28,27 +45,39 @@ class FileReader(IInputFileParser):
 
     """
 
-    def read(self, path: Path) -> MetaType:
+    def __init__(self, settings: WaveletSettings | None = None):
+        self.settings = settings if settings is not None else WaveletSettings()
+        self.header: TiffHeader | None = None
+        self.threads = self.settings.threads
+
+    def read(self, path: Path, *, coefficient_store: Path | None = None) -> MetaType:
         """Read and convert wavelet-processed data from the input file into a MetaType object.
 
         This method processes the given input file using the `wavelet.wavelet_process`
         function and wraps the resulting dictionary into a `MetaType` instance.
+        In quick mode the features are computed on a block-averaged image and
+        are marked as approximate.
 
         Args:
             path (Path): The path to the input file to be processed.
+            coefficient_store (Path | None): If given, the pyramid coefficients are
+                also written to this file.
 
         Returns:
             MetaType: An instance containing the processed metadata.
 
         """
-        dict_result = wavelet.wavelet_process(path)
+        dict_result = self.wavelet_process(path, coefficient_store=coefficient_store)
         return MetaType(dict_result)
 
     def validate(self, rawfiles: tuple[Path, ...]) -> Path:
         """Validate input files for TIFF processing.
 
         This function ensures that exactly one TIFF file is provided for processing.
-        It checks for file existence, quantity, and format validity.
+        It checks for file existence, quantity, and format validity. The TIFF header
+        is then parsed without decoding pixels (see :meth:`check_header`), so corrupt,
+        truncated or undecodable files are rejected in milliseconds, and the image
+        size is used to plan the memory of the feature extraction.
 
         Args:
             rawfiles (tuple[Path, ...]): A tuple containing paths to input files.
@@ -60,23 +89,114 @@ class FileReader(IInputFileParser):
             StructuredError: If no input files are provided.
             StructuredError: If more than one file is provided.
             StructuredError: If the file is not in TIFF format (.tif or .tiff).
+            StructuredError: If the TIFF header is invalid or the file cannot be decoded.
+            StructuredError: If an unknown feature is configured, or a feature or setting that
+                cannot be combined with ``out_of_core``.
 
         Note:
-            Only TIFF files with .tif or .tiff extensions are accepted.
+            Only TIFF files with .tif or .tiff extensions are accepted. With the
+            ``sidecar`` mask setting, mask files (``<stem>_mask.png``) are not
+            counted as input files.
 
         """
-        if not rawfiles:
-            msg = "No input files provided"
-            raise StructuredError(msg)
-        if len(rawfiles) > 1:
-            msg = "Multiple files detected, only one file allowed"
-            raise StructuredError(msg)
-        input_file = rawfiles[0]
+        input_file = self._single_file(rawfiles)
+        self._check_settings()
         if not (input_file.suffix.lower() == ".tif" or input_file.suffix.lower() == ".tiff"):
             raise StructuredError("An unexpected file was registered: " + input_file.name)
+        self.header = self.check_header(input_file)
+        self.threads = self.plan_threads(self.header, self._backend(input_file))
         return input_file
 
-    def wavelet_process(self, input_file: Path) -> dict:
+    def check_header(self, input_file: Path) -> TiffHeader:
+        """Parse the TIFF header and check that the configured backend can decode the file.
+
+        Args:
+            input_file (Path): The TIFF file.
+
+        Returns:
+            TiffHeader: The layout of the first page.
+
+        Raises:
+            StructuredError: If the header is malformed, the file is truncated, or the
+                compression or bit depth is not supported by the decoding backend.
+
+        """
+        try:
+            header = read_tiff_header(input_file)
+        except (OSError, TiffHeaderError) as e:
+            err_msg = f"Invalid TIFF file {input_file.name}: {e}"
+            raise StructuredError(err_msg) from e
+        reason = header.unsupported_reason(self._backend(input_file))
+        if reason is not None:
+            err_msg = f"Unsupported TIFF file {input_file.name}: {reason}"
+            raise StructuredError(err_msg)
+        return header
+
+    def plan_threads(self, header: TiffHeader, backend: str) -> int:
+        """Return the number of threads whose estimated peak memory fits in the available memory.
+
+        The peak is the decoded pixels (the crop with tifffile, the whole page with
+        PIL or planar-separate pages) plus :func:`wavelet.estimate_working_memory`.
+        With ``out_of_core`` the pixels are memory-mapped and the peak is that of
+        the tiles in flight, :func:`out_of_core.estimate_working_memory`.
+        The configured number of threads is reduced until the estimate fits in
+        the share of one of the ``tile_workers`` concurrently processed tiles.
+        If even one thread does not fit, the tile is still processed with one
+        thread and a warning is logged: the estimate is conservative, and the
+        memory freed by the other tiles may be enough.
+
+        Args:
+            header (TiffHeader): Header of the input file.
+            backend (str): ``"pil"`` or ``"tifffile"``.
+
+        Returns:
+            int: The number of threads to use.
+
+        """
+        available = _available_memory()
+        if available is None:
+            return self.settings.threads
+        # Tiles extracted concurrently share the memory left after the reserve.
+        budget = (available - MEMORY_RESERVE) // self.settings.tile_workers
+        crops_on_decode = backend == "tifffile" and (header.planar == 1 or header.samples == 1)
+        decoded = header.decoded_nbytes(wavelet.CROP_SIZE if crops_on_decode else None)
+        channels = header.samples if self.settings.channels == "separate" else 1
+
+        def peak(threads: int) -> int:
+            if self.settings.out_of_core:
+                return out_of_core.estimate_working_memory(threads=threads)
+            quick = self.settings.mode == "quick"
+            return decoded + wavelet.estimate_working_memory(header.shape, threads=threads, channels=channels, quick=quick, bin_factor=self.settings.quick_bin_factor)
+
+        threads = self.settings.threads
+        while threads > 1 and peak(threads) > budget:
+            threads -= 1
+        if peak(threads) > budget:
+            logger.warning("Processing %d x %d pixels needs about %d MB, but only %d MB of memory is available; continuing with one thread", header.shape[1], header.shape[0], peak(threads) // 1024**2, available // 1024**2)
+        return threads
+
+    def is_mask_tile(self, rawfiles: tuple[Path, ...]) -> bool:
+        """Return True if the input files are only mask sidecar files.
+
+        In MultiDataTile mode every file, including a mask sidecar, is registered
+        as its own tile. Such a tile has nothing to process; the mask is read
+        together with its image.
+
+        Args:
+            rawfiles (tuple[Path, ...]): A tuple containing paths to input files.
+
+        Returns:
+            bool: True if masks are read from sidecar files and every file is one.
+
+        """
+        return self.settings.mask == "sidecar" and bool(rawfiles) and all(masking.is_mask_file(path) for path in rawfiles)
+
+    def mask_files(self, input_file: Path) -> tuple[Path, ...]:
+        """Return the mask sidecar file read together with an input file, if any."""
+        sidecar = masking.find_sidecar(input_file) if self.settings.mask == "sidecar" else None
+        return () if sidecar is None else (sidecar,)
+
+    def wavelet_process(self, input_file: Path, *, coefficient_store: Path | None = None) -> dict:
         """Apply wavelet-based processing to the input file.
 
         This method calls an external `wavelet.wavelet_process` function to perform
@@ -86,10 +206,73 @@ class FileReader(IInputFileParser):
 
         Args:
             input_file (Path): The path to the input file to be processed.
+            coefficient_store (Path | None): If given, the pyramid coefficients are
+                also written to this file.
 
         Returns:
             dict: A dictionary containing the results of the wavelet processing.
                 The exact structure and contents depend on `wavelet.wavelet_process`.
 
         """
-        return wavelet.wavelet_process(input_file)
+        if self.settings.out_of_core:
+            features = wavelet.FEATURE_NAMES if self.settings.features is None else self.settings.features
+            return out_of_core.process_image(input_file, threads=self.threads, prescreen=self.settings.prescreen, features=features)
+        return wavelet.wavelet_process(
+            input_file,
+            quick=self.settings.mode == "quick",
+            bin_factor=self.settings.quick_bin_factor,
+            threads=self.threads,
+            backend=self.settings.tiff_backend,
+            separate_channels=self.settings.channels == "separate",
+            moment_sample_size=self.settings.moment_sample_size if self.settings.moments == "sampled" else None,
+            mask=self.settings.mask,
+            coefficient_store=coefficient_store,
+            prescreen=self.settings.prescreen,
+            shape_mode=self.settings.shape_normalization,
+            features=wavelet.FEATURE_NAMES if self.settings.features is None else self.settings.features,
+            engine=self.settings.engine,
+        )
+
+    def _single_file(self, rawfiles: tuple[Path, ...]) -> Path:
+        # The one input file of the tile, not counting mask sidecar files.
+        if self.settings.mask == "sidecar":
+            rawfiles = tuple(path for path in rawfiles if not masking.is_mask_file(path))
+        if not rawfiles:
+            msg = "No input files provided"
+            raise StructuredError(msg)
+        if len(rawfiles) > 1:
+            msg = "Multiple files detected, only one file allowed"
+            raise StructuredError(msg)
+        return rawfiles[0]
+
+    def _check_settings(self) -> None:
+        # The configured features must be registered, and available with out_of_core if it is set.
+        features = wavelet.FEATURE_NAMES if self.settings.features is None else self.settings.features
+        try:
+            wavelet.FEATURES.check(features)
+            if self.settings.out_of_core:
+                out_of_core.check_settings(self.settings)
+                out_of_core.check_features(features)
+        except ValueError as e:
+            raise StructuredError(str(e)) from e
+
+    def _backend(self, input_file: Path) -> str:
+        # The out-of-core mode maps the page with tifffile whatever tiff_backend says.
+        return "tifffile" if self.settings.out_of_core else resolve_backend(input_file, self.settings.tiff_backend)
+
+
+def _available_memory() -> int | None:
+    # MemAvailable of the system, capped by the memory limit of the container (cgroup v2).
+    try:
+        with open("/proc/meminfo") as fh:
+            available = next(int(line.split()[1]) * 1024 for line in fh if line.startswith("MemAvailable:"))
+    except (OSError, StopIteration):
+        return None
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            used = int(Path("/sys/fs/cgroup/memory.current").read_text())
+            available = min(available, int(limit) - used)
+    except (OSError, ValueError):
+        pass
+    return available
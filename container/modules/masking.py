@@ -0,0 +1,256 @@
+"""Region-of-interest masks for the feature extraction.
+
+Micrographs often contain an information banner (magnification, scale bar,
+acquisition date) or regions blanked by the instrument. A mask marks the
+pixels used for the features (``True`` = valid). It is taken from a sidecar
+image next to the input file (``<stem>_mask.png`` / ``<stem>_mask.tif``,
+nonzero = valid) or from an automatic detection of banners at the top or
+bottom of the image.
+
+The pyramid is still built on the whole crop, because the filters need the
+surrounding pixels, but every reduction (pixel moments and band means) is
+restricted to the valid pixels. The reductions run tile by tile with
+``where=`` masks, so the valid pixels are never gathered into a copy, and
+tiles without any valid pixel are skipped entirely.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+from scipy import stats
+
+MASK_SUFFIX: str = "_mask"
+MASK_EXTENSIONS: tuple[str, ...] = (".png", ".tif", ".tiff")
+REDUCTION_TILE: int = 256
+# A banner is a run of at least BANNER_MIN_ROWS rows covering at most BANNER_MAX_FRACTION of the height.
+BANNER_MIN_ROWS: int = 4
+BANNER_MAX_FRACTION: float = 0.25
+# Row means further than this many robust standard deviations from the image are banner rows.
+BANNER_THRESHOLD: float = 6.0
+
+
+@dataclass(frozen=True)
+class Mask:
+    """A validity mask and where it came from.
+
+    Attributes:
+        valid (np.ndarray): Boolean array, ``True`` for the pixels used for the features.
+        source (str): ``"sidecar"`` or ``"auto"``.
+
+    """
+
+    valid: np.ndarray
+    source: str
+
+    def metadata(self) -> dict[str, Any]:
+        """Return ``mask_source`` and the excluded fraction of the pixels as ``masked_fraction``."""
+        return {"mask_source": self.source, "masked_fraction": 1.0 - float(np.count_nonzero(self.valid)) / self.valid.size}
+
+
+def is_mask_file(path: Path) -> bool:
+    """Return True if ``path`` is named like a mask sidecar file."""
+    return path.stem.endswith(MASK_SUFFIX) and path.suffix.lower() in MASK_EXTENSIONS
+
+
+def find_sidecar(image_path: Path) -> Path | None:
+    """Return the mask sidecar file of an image, or None if there is none."""
+    for extension in MASK_EXTENSIONS:
+        candidate = image_path.with_name(f"{image_path.stem}{MASK_SUFFIX}{extension}")
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def get_mask(image_path: Path, image: np.ndarray, method: str) -> Mask | None:
+    """Build the mask of an image.
+
+    Args:
+        image_path (Path): Path of the input image, used to find the sidecar file.
+        image (np.ndarray): Decoded 2-D image (already cropped).
+        method (str): ``"sidecar"`` reads ``<stem>_mask.*``; ``"auto"`` detects banners;
+            ``"none"`` disables masking.
+
+    Returns:
+        Mask | None: The mask, or None if there is nothing to mask.
+
+    Raises:
+        ValueError: If the mask leaves no valid pixel.
+
+    """
+    if method == "sidecar":
+        sidecar = find_sidecar(image_path)
+        mask = None if sidecar is None else Mask(load_mask(sidecar, image.shape), "sidecar")
+    elif method == "auto":
+        valid = detect_banner(image)
+        mask = None if valid is None else Mask(valid, "auto")
+    else:
+        mask = None
+    if mask is not None and not mask.valid.any():
+        err_msg = f"The mask of {image_path.name} leaves no valid pixel"
+        raise ValueError(err_msg)
+    return mask
+
+
+def load_mask(path: Path, shape: tuple[int, ...]) -> np.ndarray:
+    """Read a sidecar mask image and crop it to ``shape``.
+
+    Args:
+        path (Path): Mask image; nonzero pixels are valid.
+        shape (tuple[int, ...]): Shape of the cropped input image.
+
+    Returns:
+        np.ndarray: Boolean mask with shape ``shape``.
+
+    Raises:
+        ValueError: If the mask is smaller than the image.
+
+    """
+    with Image.open(path) as image:
+        mask = np.asarray(image.convert("L")) != 0
+    if mask.shape[0] < shape[0] or mask.shape[1] < shape[1]:
+        err_msg = f"The mask {path.name} ({mask.shape[1]} x {mask.shape[0]}) is smaller than the image ({shape[1]} x {shape[0]})"
+        raise ValueError(err_msg)
+    return mask[: shape[0], : shape[1]]
+
+
+def detect_banner(image: np.ndarray) -> np.ndarray | None:
+    """Detect information banners along the top and bottom edges of an image.
+
+    A banner row has a mean brightness far from the typical row of the image
+    (more than ``BANNER_THRESHOLD`` robust standard deviations of the row
+    means of the central half) or is nearly uniform. A contiguous run of such
+    rows at an edge, between ``BANNER_MIN_ROWS`` rows and
+    ``BANNER_MAX_FRACTION`` of the height, is masked.
+
+    Args:
+        image (np.ndarray): 2-D image.
+
+    Returns:
+        np.ndarray | None: Boolean mask, or None if no banner was found.
+
+    """
+    rows = image.shape[0]
+    row_mean = image.mean(axis=1, dtype=np.float64)
+    row_std = image.std(axis=1, dtype=np.float64)
+    center = slice(rows // 4, rows - rows // 4)
+    reference = np.median(row_mean[center])
+    spread = max(float(stats.median_abs_deviation(row_mean[center], scale="normal")), 1e-6)
+    banner_rows = (np.abs(row_mean - reference) > BANNER_THRESHOLD * spread) | (row_std < 0.05 * np.median(row_std[center]))
+
+    valid = np.ones(image.shape, dtype=bool)
+    limit = int(rows * BANNER_MAX_FRACTION)
+    top, bottom = _edge_run(banner_rows), _edge_run(banner_rows[::-1])
+    if BANNER_MIN_ROWS <= top <= limit:
+        valid[:top] = False
+    if BANNER_MIN_ROWS <= bottom <= limit:
+        valid[rows - bottom :] = False
+    return None if valid.all() else valid
+
+
+def _edge_run(flags: np.ndarray) -> int:
+    # Length of the run of True values at the start of ``flags``.
+    return int(np.argmin(flags)) if not flags.all() else len(flags)
+
+
+def level_masks(valid: np.ndarray, levels: int) -> list[np.ndarray]:
+    """Return the mask of each pyramid level.
+
+    Level ``i + 1`` has the shape of the lowpass image after ``i + 1``
+    decimations (``ceil`` of half the size). A coefficient is valid only when
+    all pixels of its 2 x 2 block at the finer level are valid, so banner
+    edges do not leak into the coarse scales.
+
+    Args:
+        valid (np.ndarray): Mask of the full-resolution image.
+        levels (int): Number of decimated levels.
+
+    Returns:
+        list[np.ndarray]: ``levels + 1`` masks, starting with ``valid``.
+
+    """
+    masks = [valid]
+    for _ in range(levels):
+        previous = masks[-1]
+        rows, cols = -(-previous.shape[0] // 2), -(-previous.shape[1] // 2)
+        padded = np.pad(previous, ((0, rows * 2 - previous.shape[0]), (0, cols * 2 - previous.shape[1])), mode="edge")
+        masks.append(np.asarray(padded.reshape(rows, 2, cols, 2).all(axis=(1, 3))))
+    return masks
+
+
+def downsample_mask(valid: np.ndarray, factor: int) -> np.ndarray:
+    """Downsample a mask like :func:`wavelet.block_average`; a block is valid only if all its pixels are."""
+    if factor <= 1:
+        return valid
+    rows, cols = valid.shape[0] // factor, valid.shape[1] // factor
+    return np.asarray(valid[: rows * factor, : cols * factor].reshape(rows, factor, cols, factor).all(axis=(1, 3)))
+
+
+def masked_mean_abs(array: np.ndarray, valid: np.ndarray, tile: int = REDUCTION_TILE) -> float:
+    """Return the mean absolute value of the valid elements, tile by tile.
+
+    Args:
+        array (np.ndarray): 2-D array.
+        valid (np.ndarray): Boolean mask of the same shape.
+        tile (int): Edge length of the reduction tiles.
+
+    Returns:
+        float: The mean absolute value over the valid elements (NaN if there are none).
+
+    """
+    total = 0.0
+    count = 0
+    for block, block_valid in _tiles(array, valid, tile):
+        total += float(np.sum(np.abs(block), where=block_valid))
+        count += int(np.count_nonzero(block_valid))
+    return total / count if count else float("nan")
+
+
+def masked_pixel_moments(image: np.ndarray, valid: np.ndarray, tile: int = REDUCTION_TILE) -> dict:
+    """Return the pixel moments of :func:`wavelet.get_pixel_moments` over the valid pixels.
+
+    Two tiled passes are made: the first accumulates the count and the sum,
+    the second the centered second, third and fourth power sums. Only one
+    tile-sized temporary is alive at a time.
+
+    Args:
+        image (np.ndarray): 2-D image.
+        valid (np.ndarray): Boolean mask of the same shape.
+        tile (int): Edge length of the reduction tiles.
+
+    Returns:
+        dict: ``ms_mean``, ``ms_std``, ``ms_kurtosis`` and ``ms_skewness``.
+
+    """
+    tiles = list(_tiles(image, valid, tile))
+    count = sum(int(np.count_nonzero(block_valid)) for _, block_valid in tiles)
+    mean = sum(float(np.sum(block, where=block_valid, dtype=np.float64)) for block, block_valid in tiles) / count
+    m2 = m3 = m4 = 0.0
+    for block, block_valid in tiles:
+        deviation = block.astype(np.float64) - mean
+        square = deviation * deviation
+        m2 += float(np.sum(square, where=block_valid))
+        m3 += float(np.sum(square * deviation, where=block_valid))
+        m4 += float(np.sum(square * square, where=block_valid))
+    m2, m3, m4 = m2 / count, m3 / count, m4 / count
+    return {
+        "ms_mean": mean,
+        "ms_std": float(np.sqrt(m2 * count / (count - 1))) if count > 1 else float("nan"),
+        "ms_kurtosis": m4 / m2**2 - 3.0 if m2 > 0 else float("nan"),
+        "ms_skewness": m3 / m2**1.5 if m2 > 0 else float("nan"),
+    }
+
+
+def _tiles(array: np.ndarray, valid: np.ndarray, tile: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    # Views of the tiles that contain at least one valid element.
+    tiles = []
+    for y in range(0, array.shape[0], tile):
+        for x in range(0, array.shape[1], tile):
+            block_valid = valid[y : y + tile, x : x + tile]
+            if block_valid.any():
+                tiles.append((array[y : y + tile, x : x + tile], block_valid))
+    return tiles
@@ -6,6 +6,7 @@ from rdetoolkit import rde2util
 from rdetoolkit.models.rde2types import MetaType, RepeatedMetaType
 
 from modules.interfaces import IMetaParser
+from modules.output_writer import atomic_write
 
 
 class MetaParser(IMetaParser[MetaType]):
@@ -68,4 +69,4 @@ class MetaParser(IMetaParser[MetaType]):
         meta_obj.assign_vals(const_meta_info)
         meta_obj.assign_vals(repeated_meta_info)
 
-        meta_obj.writefile(str(save_path))
+        atomic_write(save_path, lambda tmp: meta_obj.writefile(str(tmp)))
@@ -0,0 +1,359 @@
+"""Out-of-core features of whole images larger than the memory.
+
+The normal extraction decodes the 2048 x 2048 crop of an image. Stitched
+mosaics of tens of thousands of pixels per side do not fit in memory at all,
+so :func:`process_image` computes the features of the whole image from a
+memory map (see :func:`image_ingest.map_image`) instead, one tile at a time.
+
+Every stage of the steerable pyramid is a correlation with a filter of
+limited support, so a tile of a stage's output only depends on the input
+tile extended by the filter radius. :func:`get_tiled_pyramid_feature` reads
+each tile with a halo of that size, computes the stage on the extended
+block, and keeps the part of the output that is not affected by the cut
+edges. At the image borders the block reaches the border itself, so the
+``reflect1`` edge handling is the one of the full image. The halos are even
+and the tiles start at even positions, so the decimation keeps the phase of
+the full computation. The kept coefficients are therefore the coefficients
+of the full-image pyramid, and the band means, which are summed tile by tile,
+match :func:`wavelet.get_steerable_pyramid_feature` up to floating-point
+rounding.
+
+- Stage 0 reads the image with a halo of ``HALO_0``. It computes the highpass
+  residual, the ``lo0`` lowpass, the bands of level 0 and the first
+  decimated lowpass from the block.
+- Stage ``i`` reads the lowpass of level ``i`` with a halo of ``HALO`` and
+  computes the bands of level ``i`` and the next decimated lowpass.
+
+The decimated lowpass images are written to memory-mapped files, so about a
+third of the image size in ``float64`` is needed on disk (in the directory of
+``tempfile``, i.e. ``TMPDIR``). The memory is bounded by the tiles in flight:
+``threads`` tiles of ``TILE_SIZE`` x ``TILE_SIZE`` coefficients, independent
+of the image size. The ``ms_*`` moments are accumulated from shifted power
+sums in one pass over the tiles.
+"""
+
+from __future__ import annotations
+
+import math
+import tempfile
+from collections import deque
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from pyrtools.pyramids.c.wrapper import corrDn  # type: ignore[import-untyped]
+from pyrtools.pyramids.filters import parse_filter  # type: ignore[import-untyped]
+
+from modules import wavelet
+from modules.image_ingest import map_image
+from modules.prescreen import screen_image, uniform_image_feature
+from modules.settings import WaveletSettings
+
+# Output rows and columns of one tile at every level (even, so tiles start at even positions).
+TILE_SIZE: int = 1024
+# Halo of stage 0: radius of lo0filt (4) plus the larger radius of bfilts (4) and lofilt (8).
+# It also covers hi0filt (7).
+HALO_0: int = 12
+# Halo of the later stages: the larger radius of bfilts and lofilt.
+HALO: int = 8
+# Float64 blocks alive per tile (extended input, lowpass, band, absolute values, decimated output).
+TILE_WORKING_COPIES: int = 6
+
+Tile = tuple[int, int, int, int]
+
+
+def process_image(
+    path: Path,
+    *,
+    threads: int = 1,
+    prescreen: bool = True,
+    features: Sequence[str] = wavelet.FEATURE_NAMES,
+    tile: int = TILE_SIZE,
+) -> dict[str, Any]:
+    """Compute the features of a whole TIFF image without loading it into memory.
+
+    The result has the entries of :func:`wavelet.wavelet_process` for the whole
+    image instead of the crop, marked by ``feature_extent`` ``"image"``, and
+    ``pyramid_shape`` gives the decomposed size.
+
+    Args:
+        path (Path): TIFF file.
+        threads (int): Number of tiles processed concurrently (and of decoding threads).
+        prescreen (bool): If True, blank, saturated and constant images are flagged and constant
+            images get the features of a uniform image without the pyramid computation (see
+            :mod:`modules.prescreen`).
+        features (Sequence[str]): Registered features to compute, in output order.
+        tile (int): Tile size.
+
+    Returns:
+        dict: A dictionary mapping feature names to their computed values.
+
+    Raises:
+        ValueError: If a requested feature needs the whole pixel array (see :func:`check_features`).
+
+    """
+    check_features(features)
+    required = wavelet.FEATURES.requirements(features)
+    height, order = wavelet.PYRAMID_HEIGHT, wavelet.PYRAMID_ORDER
+    with tempfile.TemporaryDirectory(prefix="wavelet_out_of_core_") as scratch:
+        ingested = map_image(path, Path(scratch), threads=threads)
+        image = ingested.pixels
+        screening = screen_image(image) if prescreen else None
+        if screening is not None and not screening.usable:
+            feature = uniform_image_feature(screening.value, height, order)
+        elif "bands" in required:
+            feature = get_tiled_pyramid_feature(image, height, order, scratch=Path(scratch), tile=tile, threads=threads, moments="moments" in required)
+        else:
+            feature = get_tiled_pixel_moments(image, tile=tile, threads=threads) if "moments" in required else {}
+        result = wavelet.summarize_features(feature, features)
+        result["feature_extent"] = "image"
+        result["pyramid_shape"] = f"{image.shape[0]} x {image.shape[1]}"
+    if screening is not None:
+        result |= screening.metadata()
+    return result | ingested.metadata()
+
+
+def check_features(features: Sequence[str]) -> None:
+    """Raise ``ValueError`` if a feature cannot be computed tile by tile.
+
+    Features derived from the ``pixels`` of the image (e.g. ``ms_median``) need
+    the whole pixel array at once.
+    """
+    unsupported = [name for name in features if "image" in wavelet.FEATURES.requirements([name])]
+    if unsupported:
+        emsg = f"Features not available out of core: {', '.join(unsupported)}"
+        raise ValueError(emsg)
+
+
+def check_settings(settings: WaveletSettings) -> None:
+    """Raise ``ValueError`` if a setting other than its default has no out-of-core implementation.
+
+    The tiled pyramid computes the standard features of the whole grayscale
+    image: quick mode, per-channel features, sampled moments, masks, stored
+    coefficients, shape normalization and the DWT engines are not available.
+    """
+    unsupported = settings.changed(("mode", "channels", "moments", "mask", "save_coefficients", "shape_normalization", "engine"))
+    if unsupported:
+        emsg = f"Settings not available with out_of_core: {', '.join(unsupported)}"
+        raise ValueError(emsg)
+
+
+def estimate_working_memory(*, threads: int = 1, tile: int = TILE_SIZE) -> int:
+    """Return the estimated peak memory of :func:`get_tiled_pyramid_feature`, independent of the image size."""
+    return (tile + 2 * HALO_0) ** 2 * np.dtype(np.float64).itemsize * TILE_WORKING_COPIES * threads
+
+
+def get_tiled_pyramid_feature(
+    image: np.ndarray,
+    height: int,
+    order: int,
+    *,
+    scratch: Path,
+    tile: int = TILE_SIZE,
+    threads: int = 1,
+    moments: bool = True,
+) -> dict:
+    """Compute the output of :func:`wavelet.get_steerable_pyramid_feature` tile by tile.
+
+    Args:
+        image (np.ndarray): 2-D image, typically a ``numpy.memmap``.
+        height (int): Height of the pyramid.
+        order (int): Order of the pyramid.
+        scratch (Path): Directory for the memory-mapped lowpass images.
+        tile (int): Tile size, even and at least twice the largest filter.
+        threads (int): Number of tiles processed concurrently.
+        moments (bool): If False, the ``ms_*`` pixel moments are not computed.
+
+    Returns:
+        dict: ``ms_*`` pixel moments and ``ss_<key>`` band means.
+
+    Raises:
+        ValueError: If ``tile`` is too small or odd, or the image is too small for ``height``.
+
+    """
+    _check_tiling(image.shape, height, tile)
+    filters = parse_filter(f"sp{order}_filters", normalize=False)
+    feature = get_tiled_pixel_moments(image, tile=tile, threads=threads) if moments else {}
+    sums: dict[Any, list[float]] = {}
+    source = image
+    for i in range(height):
+        stage, keys, halo = _get_stage(i, filters, order)
+        target = _accumulate_level(source, scratch.joinpath(f"lowpass_{i + 1}.raw"), stage, halo=halo, tile=tile, threads=threads, keys=keys, sums=sums)
+        if i > 0:
+            _discard(source)
+        source = target
+    for key, values in sums.items():
+        size = image.size if key == "residual_highpass" else math.prod(_level_shape(image.shape, key[0]))
+        feature["ss_" + str(key)] = math.fsum(values) / size
+    lowpass = [float(np.abs(source[y0:y1, x0:x1]).sum()) for y0, y1, x0, x1 in tiles(source.shape, tile)]
+    feature["ss_residual_lowpass"] = math.fsum(lowpass) / source.size
+    _discard(source)
+    return feature
+
+
+def get_tiled_pixel_moments(image: np.ndarray, *, tile: int = TILE_SIZE, threads: int = 1) -> dict:
+    """Return :func:`wavelet.get_pixel_moments` of an image, reading it one tile at a time.
+
+    The sums of the first to fourth powers of the deviation from a shift (the
+    mean of a strided sample) are accumulated per tile, so the central moments
+    are not subject to the cancellation of raw power sums.
+
+    Args:
+        image (np.ndarray): 2-D image, typically a ``numpy.memmap``.
+        tile (int): Tile size.
+        threads (int): Number of tiles processed concurrently.
+
+    Returns:
+        dict: ``ms_mean``, ``ms_std``, ``ms_kurtosis`` and ``ms_skewness``.
+
+    """
+    step = max(int(np.sqrt(image.size / 65536)), 1)
+    shift = float(np.mean(image[::step, ::step], dtype=np.float64))
+
+    def power_sums(region: Tile) -> list[float]:
+        y0, y1, x0, x1 = region
+        deviation = np.asarray(image[y0:y1, x0:x1], dtype=np.float64) - shift
+        squared = deviation * deviation
+        return [float(deviation.sum()), float(squared.sum()), float((squared * deviation).sum()), float((squared * squared).sum())]
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        per_tile = list(executor.map(power_sums, tiles(image.shape, tile)))
+    n = image.size
+    s1, s2, s3, s4 = (math.fsum(values) / n for values in zip(*per_tile, strict=True))
+    m2 = s2 - s1 * s1
+    m3 = s3 - 3 * s1 * s2 + 2 * s1**3
+    m4 = s4 - 4 * s1 * s3 + 6 * s1 * s1 * s2 - 3 * s1**4
+    undefined = m2 <= 0
+    return {
+        "ms_mean": shift + s1,
+        "ms_std": math.sqrt(max(m2, 0.0) * n / (n - 1)),
+        "ms_kurtosis": math.nan if undefined else m4 / m2**2 - 3,
+        "ms_skewness": math.nan if undefined else m3 / m2**1.5,
+    }
+
+
+def tiles(shape: tuple[int, ...], tile: int) -> list[Tile]:
+    """Return the ``(y0, y1, x0, x1)`` tiles covering an array, in row-major order.
+
+    Tiles start at multiples of ``tile``. A remainder shorter than half a tile is
+    merged into the last tile, so no tile is too thin for the filters.
+    """
+    return [(y0, y1, x0, x1) for y0, y1 in _edges(shape[0], tile) for x0, x1 in _edges(shape[1], tile)]
+
+
+def _edges(size: int, tile: int) -> list[tuple[int, int]]:
+    starts = list(range(0, size, tile))
+    if len(starts) > 1 and size - starts[-1] < tile // 2:
+        starts.pop()
+    return list(zip(starts, [*starts[1:], size], strict=True))
+
+
+def _map_tiles(source: np.ndarray, halo: int, tile: int, threads: int, compute: Callable) -> Iterator[tuple[Any, Tile, np.ndarray]]:
+    """Apply ``compute(block, offset, shape)`` to every tile extended by ``halo`` and yield the results in tile order."""
+
+    def run(region: Tile) -> tuple[Any, np.ndarray]:
+        y0, y1, x0, x1 = region
+        by0, bx0 = max(y0 - halo, 0), max(x0 - halo, 0)
+        block = np.asarray(source[by0 : min(y1 + halo, source.shape[0]), bx0 : min(x1 + halo, source.shape[1])], dtype=np.float64)
+        return compute(block, (y0 - by0, x0 - bx0), (y1 - y0, x1 - x0))
+
+    regions = tiles(source.shape, tile)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # Bounded look-ahead: at most 2 * threads tiles in flight.
+        pending = deque(executor.submit(run, region) for region in regions[: 2 * threads])
+        for index, region in enumerate(regions):
+            values, down = pending.popleft().result()
+            if index + 2 * threads < len(regions):
+                pending.append(executor.submit(run, regions[index + 2 * threads]))
+            yield values, region, down
+
+
+def _check_tiling(shape: tuple[int, ...], height: int, tile: int) -> None:
+    if tile % 2 or tile < 2 * wavelet.PYRAMID_FILTER_SIZE:
+        emsg = f"Tile size must be even and at least {2 * wavelet.PYRAMID_FILTER_SIZE}: {tile}"
+        raise ValueError(emsg)
+    if min(shape) // 2 ** (height - 1) < wavelet.PYRAMID_FILTER_SIZE:
+        emsg = f"Cannot build a pyramid of {height} levels on a {shape[0]} x {shape[1]} image"
+        raise ValueError(emsg)
+
+
+def _get_stage(level: int, filters: dict[str, np.ndarray], order: int) -> tuple[Callable, list[Any], int]:
+    # The tile computation of a level, the keys of the sums it returns and its halo.
+    band_filters = [filters["bfilts"][:, b].reshape(9, 9).T for b in range(order + 1)]
+    keys: list[Any] = [(level, b) for b in range(order + 1)]
+    if level > 0:
+        return partial(_level, band_filters=band_filters, lofilt=filters["lofilt"]), keys, HALO
+    stage = partial(_stage_0, hi0filt=filters["hi0filt"], lo0filt=filters["lo0filt"], band_filters=band_filters, lofilt=filters["lofilt"])
+    return stage, ["residual_highpass", *keys], HALO_0
+
+
+def _level(
+    block: np.ndarray,
+    offset: tuple[int, int],
+    shape: tuple[int, int],
+    *,
+    band_filters: list[np.ndarray],
+    lofilt: np.ndarray,
+) -> tuple[list[float], np.ndarray]:
+    # Bands and the next decimated lowpass of one tile, from the extended lowpass block.
+    (oy, ox), (h, w) = offset, shape
+    bands = [float(np.abs(corrDn(image=block, filt=filt, edge_type=wavelet.PYRAMID_EDGE_TYPE)[oy : oy + h, ox : ox + w]).sum()) for filt in band_filters]
+    down = corrDn(image=block, filt=lofilt, edge_type=wavelet.PYRAMID_EDGE_TYPE, step=(2, 2))
+    return bands, down[oy // 2 : oy // 2 + -(-h // 2), ox // 2 : ox // 2 + -(-w // 2)]
+
+
+def _stage_0(
+    block: np.ndarray,
+    offset: tuple[int, int],
+    shape: tuple[int, int],
+    *,
+    hi0filt: np.ndarray,
+    lo0filt: np.ndarray,
+    band_filters: list[np.ndarray],
+    lofilt: np.ndarray,
+) -> tuple[list[float], np.ndarray]:
+    # Highpass residual, bands of level 0 and the first decimated lowpass of one tile, from the extended image block.
+    (oy, ox), (h, w) = offset, shape
+    highpass = corrDn(image=block, filt=hi0filt, edge_type=wavelet.PYRAMID_EDGE_TYPE)[oy : oy + h, ox : ox + w]
+    bands, down = _level(corrDn(image=block, filt=lo0filt, edge_type=wavelet.PYRAMID_EDGE_TYPE), offset, shape, band_filters=band_filters, lofilt=lofilt)
+    return [float(np.abs(highpass).sum()), *bands], down
+
+
+def _accumulate_level(
+    source: np.ndarray,
+    lowpass_path: Path,
+    stage: Callable,
+    *,
+    halo: int,
+    tile: int,
+    threads: int,
+    keys: list[Any],
+    sums: dict[Any, list[float]],
+) -> np.ndarray:
+    # Apply a stage to every tile of source, append the per-tile sums of its bands to sums,
+    # and return the memory-mapped decimated lowpass.
+    target = np.memmap(lowpass_path, dtype=np.float64, mode="w+", shape=(-(-source.shape[0] // 2), -(-source.shape[1] // 2)))
+    for key in keys:
+        sums[key] = []
+    for values, (y0, _, x0, _), down in _map_tiles(source, halo, tile, threads, stage):
+        for key, value in zip(keys, values, strict=True):
+            sums[key].append(value)
+        target[y0 // 2 : y0 // 2 + down.shape[0], x0 // 2 : x0 // 2 + down.shape[1]] = down
+    return target
+
+
+def _level_shape(shape: tuple[int, ...], level: int) -> tuple[int, int]:
+    rows, cols = shape[0], shape[1]
+    for _ in range(level):
+        rows, cols = -(-rows // 2), -(-cols // 2)
+    return rows, cols
+
+
+def _discard(array: np.ndarray) -> None:
+    # Delete the file of a lowpass memory map that is no longer needed; the space is
+    # released when the last view is garbage collected.
+    if isinstance(array, np.memmap) and array.filename is not None:
+        Path(array.filename).unlink(missing_ok=True)
@@ -0,0 +1,159 @@
+"""Single serialization path for the per-image feature outputs.
+
+The features of one image are written to two targets: the structured CSV
+(one row labelled with the image name) and ``metadata.json`` (through the
+``rde2util.Meta`` object of ``metadata-def.json``). :class:`FeatureRecord`
+normalizes the values once (numpy scalars to Python scalars, NaN to empty)
+and produces both, and :class:`OutputWriter` writes them through temporary
+files that are renamed into place, so a reader never sees a partly written
+file.
+
+The CSV files are not read again during the run, so the writer can hold up
+to ``buffer_size`` of them in memory and write them together; with many
+small tiles this keeps the output I/O out of the per-tile critical path.
+``metadata.json`` is always written immediately because rdetoolkit validates
+it after every tile.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import math
+import os
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+from rdetoolkit.models.rde2types import MetaType
+from rdetoolkit.rde2util import Meta
+
+
+def atomic_write(path: Path, write: Callable[[Path], Any]) -> None:
+    """Write a file through a temporary file in the same directory and rename it into place.
+
+    Args:
+        path (Path): Destination file.
+        write (Callable[[Path], Any]): Function writing the content to the path it is given.
+
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write bytes to a file atomically (see :func:`atomic_write`)."""
+    atomic_write(path, lambda tmp: tmp.write_bytes(data))
+
+
+@dataclass(frozen=True)
+class FeatureRecord:
+    """The extracted metadata of one image, serialized for every output.
+
+    Attributes:
+        name (str): Image file name, used as the row label of the CSV.
+        values (MetaType): Metadata with Python scalar values.
+
+    """
+
+    name: str
+    values: MetaType
+
+    @classmethod
+    def from_meta(cls, meta: MetaType, name: str) -> FeatureRecord:
+        """Convert numpy scalars to Python scalars once for both outputs."""
+        return cls(name, {key: _to_builtin(value) for key, value in meta.items()})
+
+    def csv_bytes(self) -> bytes:
+        """Return the CSV file content: a header row and one row labelled with ``name``.
+
+        The format equals ``pandas.DataFrame.to_csv`` of a one-row frame: floats use
+        their shortest representation, NaN and None are empty, and fields are quoted
+        only when needed.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator=os.linesep)
+        writer.writerow(["", *self.values])
+        writer.writerow([self.name, *(_csv_field(value) for value in self.values.values())])
+        return buffer.getvalue().encode("utf-8")
+
+    def write_meta(self, path: Path, meta_obj: Meta) -> None:
+        """Assign the values to ``meta_obj`` and write ``metadata.json`` atomically."""
+        meta_obj.assign_vals(self.values)
+        atomic_write(path, lambda tmp: meta_obj.writefile(str(tmp)))
+
+
+class OutputWriter:
+    """Writer of the CSV and ``metadata.json`` outputs of every tile.
+
+    Example:
+        with OUTPUT_WRITER:
+            OUTPUT_WRITER.write(meta, "image.tif", csv_path, meta_path, meta_obj, buffer_size=64)
+
+    """
+
+    def __init__(self) -> None:
+        self._pending: list[tuple[Path, bytes]] = []
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.flush()
+
+    @property
+    def pending(self) -> int:
+        """Number of CSV files waiting in the buffer."""
+        return len(self._pending)
+
+    def write(self, meta: MetaType, name: str, csv_path: Path, meta_path: Path, meta_obj: Meta, *, buffer_size: int = 0) -> FeatureRecord:
+        """Serialize the metadata of one image and write it to both outputs.
+
+        Args:
+            meta (MetaType): Extracted metadata.
+            name (str): Image file name.
+            csv_path (Path): Structured CSV file.
+            meta_path (Path): ``metadata.json`` file.
+            meta_obj (Meta): ``Meta`` object of ``metadata-def.json`` with no values assigned.
+            buffer_size (int): Number of CSV files that may be held in memory. 0 writes immediately.
+
+        Returns:
+            FeatureRecord: The serialized record.
+
+        """
+        record = FeatureRecord.from_meta(meta, name)
+        self._pending.append((csv_path, record.csv_bytes()))
+        record.write_meta(meta_path, meta_obj)
+        if len(self._pending) > buffer_size:
+            self.flush()
+        return record
+
+    def flush(self) -> None:
+        """Write all buffered CSV files."""
+        while self._pending:
+            path, data = self._pending[0]
+            atomic_write_bytes(path, data)
+            self._pending.pop(0)
+
+
+def _to_builtin(value: Any) -> Any:
+    # Single-precision floats keep their shortest decimal form (0.1, not 0.10000000149011612),
+    # as pandas and rde2util.Meta write them.
+    if isinstance(value, np.floating) and value.dtype.itemsize < np.dtype(np.float64).itemsize:
+        return float(str(value))
+    return value.item() if hasattr(value, "item") else value
+
+
+def _csv_field(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value
+
+
+OUTPUT_WRITER = OutputWriter()
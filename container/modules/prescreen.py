@@ -0,0 +1,131 @@
+"""Pre-screening of blank, saturated and constant images.
+
+Blank frames (shutter closed, beam off), fully saturated frames and other
+uniform images still go through the whole pyramid, although their features
+carry no texture information and the kurtosis and skewness of a constant
+image are undefined (NaN). :func:`screen_image` classifies an image from the
+histogram of a strided sample of about ``SCREEN_SAMPLE_SIZE`` pixels, which
+costs a few milliseconds instead of the seconds of the decomposition:
+
+* ``"blank"``: at least ``DOMINANT_FRACTION`` of the sample is 0.
+* ``"saturated"``: at least ``DOMINANT_FRACTION`` of the sample is at the
+  maximum of the integer dtype (saturation is not defined for float images).
+* ``"constant"``: every pixel has the same value (checked on the whole image).
+* ``"ok"``: anything else.
+
+Only images whose valid pixels all have the same value skip the pyramid
+(:attr:`Screening.usable` is False): for them :func:`uniform_image_feature`
+gives the features of a uniform image at that value. The band means of a
+uniform image are the DC gains of the pyramid filters times the value, so
+they are computed from the filter sums without a decomposition, and
+``ms_kurtosis`` and ``ms_skewness`` are defined as 0. Near-blank and
+near-saturated images keep their flag but are decomposed as usual, since
+the few remaining pixels still carry texture.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from pyrtools.pyramids.filters import parse_filter  # type: ignore[import-untyped]
+
+SCREEN_SAMPLE_SIZE: int = 65536
+DOMINANT_FRACTION: float = 0.99
+
+
+@dataclass(frozen=True)
+class Screening:
+    """Result of the pre-screen of one image.
+
+    Attributes:
+        quality (str): ``"ok"``, ``"blank"``, ``"saturated"`` or ``"constant"``.
+        value (float): The most frequent value of the sample.
+        fraction (float): Fraction of the sample at ``value``.
+        constant (bool): True if every valid pixel of the image is at ``value``.
+
+    """
+
+    quality: str
+    value: float
+    fraction: float
+    constant: bool = False
+
+    @property
+    def usable(self) -> bool:
+        """True if the image needs the full feature computation, i.e. it is not constant."""
+        return not self.constant
+
+    def metadata(self) -> dict[str, Any]:
+        """Return the quality flag as ``image_quality`` and the fraction as ``dominant_value_fraction``."""
+        return {"image_quality": self.quality, "dominant_value_fraction": self.fraction}
+
+
+def screen_image(
+    image: np.ndarray,
+    mask: np.ndarray | None = None,
+    *,
+    sample_size: int = SCREEN_SAMPLE_SIZE,
+    threshold: float = DOMINANT_FRACTION,
+) -> Screening:
+    """Classify an image as usable, blank, saturated or constant.
+
+    Args:
+        image (np.ndarray): 2-D image in its decoded dtype.
+        mask (np.ndarray | None): Boolean mask of the valid pixels; only those are screened.
+        sample_size (int): Approximate number of sampled pixels.
+        threshold (float): Fraction of the sample at 0 (or at the dtype maximum) above
+            which the image is blank (or saturated).
+
+    Returns:
+        Screening: The classification.
+
+    """
+    step = max(int(np.sqrt(image.size / sample_size)), 1)
+    sample = image[::step, ::step]
+    if mask is not None:
+        sample = sample[mask[::step, ::step]]
+    values, counts = np.unique(sample, return_counts=True)
+    top = int(np.argmax(counts))
+    value, fraction = values[top], float(counts[top]) / sample.size
+    constant = fraction == 1.0 and _is_constant(image, mask, value)
+    quality = "ok"
+    if fraction >= threshold and value == 0:
+        quality = "blank"
+    elif fraction >= threshold and np.issubdtype(image.dtype, np.integer) and value == np.iinfo(image.dtype).max:
+        quality = "saturated"
+    elif constant:
+        quality = "constant"
+    return Screening(quality, float(value), fraction, constant)
+
+
+def uniform_image_feature(value: float, height: int, order: int) -> dict[str, float]:
+    """Return the output of :func:`wavelet.get_steerable_pyramid_feature` for a uniform image.
+
+    Args:
+        value (float): Pixel value of the image.
+        height (int): Height of the pyramid.
+        order (int): Order of the pyramid.
+
+    Returns:
+        dict[str, float]: ``ms_*`` moments and ``ss_<key>`` band means.
+
+    """
+    filters = parse_filter(f"sp{order}_filters", normalize=False)
+    feature = {"ms_mean": float(value), "ms_std": 0.0, "ms_kurtosis": 0.0, "ms_skewness": 0.0}
+    feature["ss_residual_highpass"] = abs(value * float(np.sum(filters["hi0filt"])))
+    # DC gain of the lowpass chain above the current scale.
+    gain = float(np.sum(filters["lo0filt"]))
+    for i in range(height):
+        for b in range(order + 1):
+            feature["ss_" + str((i, b))] = abs(value * gain * float(np.sum(filters["bfilts"][:, b])))
+        gain *= float(np.sum(filters["lofilt"]))
+    feature["ss_residual_lowpass"] = abs(value * gain)
+    return feature
+
+
+def _is_constant(image: np.ndarray, mask: np.ndarray | None, value: Any) -> bool:
+    if mask is None:
+        return bool(image.min() == value and image.max() == value)
+    return bool(np.all((image == value) | ~mask))
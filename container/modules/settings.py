@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Literal, Self
+
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.models.config import Config
+
+# Settings that channels: separate does not implement; they must keep their defaults with it.
+SEPARATE_CHANNELS_FIXED: tuple[str, ...] = ("moments", "mask", "save_coefficients", "shape_normalization", "prescreen", "engine", "features")
+
+
+class WaveletSettings(BaseModel):
+    """Settings for the wavelet feature extraction read from ``rdeconfig.yaml``.
+
+    The settings live in the ``wavelet`` section of ``rdeconfig.yaml``. Every
+    item is optional; an absent section yields the default full computation.
+
+    Attributes:
+        mode (str): ``"full"`` computes the features on the full-resolution crop.
+            ``"quick"`` computes provisional features on a block-averaged image.
+        quick_bin_factor (int): Block size used to average the image in quick mode.
+        threads (int): Number of threads used to decode one image and build its pyramid.
+        tile_workers (int): Number of tiles whose features are extracted concurrently in
+            worker processes in MultiDataTile mode. The tiles share the available memory.
+        channels (str): ``"gray"`` converts color images to grayscale. ``"separate"``
+            computes the standard features of every channel in one batched pass and writes
+            them with the suffix ``_ch<index>``. The channels are not pre-screened, and
+            ``moments``, ``mask``, ``save_coefficients``, ``shape_normalization``,
+            ``prescreen``, ``engine`` and ``features`` must keep their defaults.
+        moments (str): ``"exact"`` computes the ``ms_*`` features from every pixel.
+            ``"sampled"`` estimates them from a stratified pixel sample and writes their
+            confidence interval half-widths as ``ms_*_error``.
+        moment_sample_size (int): Number of pixels sampled in ``"sampled"`` mode.
+        mask (str): ``"none"`` uses every pixel. ``"sidecar"`` excludes the pixels that are
+            zero in ``<stem>_mask.png`` (or ``.tif``) next to the image. ``"auto"`` detects
+            information banners at the top and bottom of the image and excludes them.
+        save_coefficients (bool): Save the pyramid coefficients of every image to
+            ``structured/<stem>_pyramid.zip`` (chunked and compressed, readable with
+            ``coefficient_store.CoefficientStore``).
+        shape_normalization (str): ``"none"`` decomposes the crop as it is. ``"pad"`` reflects
+            it to the next FFT-friendly size (a multiple of 32 whose quotient has no prime
+            factor above 5) and excludes the padding from the features; ``"crop"`` cuts it to
+            the previous such size.
+        prescreen (bool): Detect blank, saturated and constant images from a pixel sample and
+            give them the features of a uniform image without the pyramid computation. The
+            result is written as ``image_quality``.
+        engine (str): ``"steerable"`` computes the band features from the steerable pyramid.
+            ``"haar"``, ``"db2"`` or ``"db4"`` computes analogous features from a decimated
+            orthogonal wavelet transform, an order of magnitude faster; the values are not
+            comparable with the pyramid's and the output gets ``feature_engine``.
+        features (list[str] | None): Names of the features to compute, in output order. ``None``
+            computes the standard features (``wavelet.FEATURE_NAMES``). Additional registered
+            features (e.g. ``ms_median``, ``ms_entropy``) can be listed, and stages no listed
+            feature needs (e.g. the pyramid) are skipped.
+        out_of_core (bool): Compute the features of the whole image instead of the 2048 x 2048
+            crop, tile by tile from a memory-mapped copy, so the memory does not depend on the
+            image size (see ``out_of_core``). ``mode``, ``channels``, ``moments``, ``mask``,
+            ``save_coefficients``, ``shape_normalization`` and ``engine`` must keep their defaults.
+        feature_statistics (bool): Update the running campaign statistics (count, mean and
+            covariance of the features) in ``logs/feature_statistics.json`` after every tile.
+        output_buffer (int): Number of structured CSV files held in memory and written
+            together (at the latest at the end of the run). 0 writes every file immediately.
+            ``metadata.json`` is always written immediately.
+        tiff_backend (str): ``"auto"`` decodes TIFF files with tifffile (tile-parallel,
+            BigTIFF, LZW/Deflate) when it is installed and with PIL otherwise.
+            ``"pil"`` or ``"tifffile"`` force one backend.
+
+    Example:
+        wavelet:
+          mode: quick
+          quick_bin_factor: 4
+          threads: 4
+
+    """
+
+    mode: Literal["full", "quick"] = Field(default="full", description="Feature extraction mode. select: full, quick")
+    quick_bin_factor: int = Field(default=4, ge=1, description="Block size used to average the image in quick mode")
+    threads: int = Field(default=1, ge=1, description="Number of threads used to decode one image and build its pyramid")
+    tile_workers: int = Field(default=1, ge=1, description="Number of tiles processed concurrently")
+    channels: Literal["gray", "separate"] = Field(default="gray", description="Handling of multi-channel images. select: gray, separate")
+    moments: Literal["exact", "sampled"] = Field(default="exact", description="Computation of the ms_* features. select: exact, sampled")
+    moment_sample_size: int = Field(default=65536, ge=2560, description="Number of pixels sampled for the ms_* features in sampled mode")
+    mask: Literal["none", "sidecar", "auto"] = Field(default="none", description="Region-of-interest mask. select: none, sidecar, auto")
+    save_coefficients: bool = Field(default=False, description="Save the pyramid coefficients to structured/<stem>_pyramid.zip")
+    shape_normalization: Literal["none", "pad", "crop"] = Field(default="none", description="Normalization of the image shape. select: none, pad, crop")
+    prescreen: bool = Field(default=True, description="Skip the pyramid for blank, saturated and constant images")
+    engine: Literal["steerable", "haar", "db2", "db4"] = Field(default="steerable", description="Decomposition of the band features. select: steerable, haar, db2, db4")
+    features: list[str] | None = Field(default=None, description="Names of the features to compute. None computes the standard features")
+    out_of_core: bool = Field(default=False, description="Compute the features of the whole image tile by tile from a memory map")
+    feature_statistics: bool = Field(default=True, description="Update the running campaign feature statistics after every tile")
+    output_buffer: int = Field(default=0, ge=0, description="Number of structured CSV files written together")
+    tiff_backend: Literal["auto", "pil", "tifffile"] = Field(default="auto", description="TIFF decoding backend. select: auto, pil, tifffile")
+
+    @model_validator(mode="after")
+    def _check_separate_channels(self) -> Self:
+        changed = self.changed(SEPARATE_CHANNELS_FIXED) if self.channels == "separate" else []
+        if changed:
+            emsg = f"Settings not available with channels: separate: {', '.join(changed)}"
+            raise ValueError(emsg)
+        return self
+
+    def changed(self, names: Sequence[str]) -> list[str]:
+        """Return ``"<name>: <value>"`` for the given settings that differ from their defaults."""
+        return [f"{name}: {getattr(self, name)}" for name in names if getattr(self, name) != type(self).model_fields[name].default]
+
+
+class TelemetrySettings(BaseModel):
+    """Settings for the resource-usage telemetry read from ``rdeconfig.yaml``.
+
+    Attributes:
+        enabled (bool): Sample CPU, RSS and I/O during the run and write
+            ``logs/telemetry.csv`` and ``logs/telemetry_summary.json``.
+        interval (float): Seconds between two samples.
+        otlp (bool): Also write the samples as OpenTelemetry metrics (OTLP/JSON)
+            to ``logs/telemetry_otlp.jsonl``.
+
+    Example:
+        telemetry:
+          enabled: true
+          interval: 0.5
+          otlp: true
+
+    """
+
+    enabled: bool = Field(default=True, description="Record the resource usage of the run")
+    interval: float = Field(default=1.0, ge=0.05, description="Seconds between two samples")
+    otlp: bool = Field(default=False, description="Also write the samples as OTLP/JSON metrics")
+
+
+def load_wavelet_settings(config: Config | None) -> WaveletSettings:
+    """Read the ``wavelet`` section from the rdetoolkit configuration.
+
+    Args:
+        config (Config | None): The configuration object loaded by rdetoolkit.
+
+    Returns:
+        WaveletSettings: The parsed settings. Defaults are used for missing items.
+
+    Raises:
+        StructuredError: If the ``wavelet`` section contains invalid values.
+
+    """
+    extra = (config.model_extra or {}) if config is not None else {}
+    section = extra.get("wavelet") or {}
+    try:
+        return WaveletSettings(**section)
+    except ValidationError as e:
+        err_msg = f"Invalid wavelet settings in rdeconfig.yaml: {e}"
+        raise StructuredError(err_msg) from e
+
+
+def load_telemetry_settings(config: Config | None) -> TelemetrySettings:
+    """Read the ``telemetry`` section from the rdetoolkit configuration.
+
+    Args:
+        config (Config | None): The configuration object loaded by rdetoolkit.
+
+    Returns:
+        TelemetrySettings: The parsed settings. Defaults are used for missing items.
+
+    Raises:
+        StructuredError: If the ``telemetry`` section contains invalid values.
+
+    """
+    extra = (config.model_extra or {}) if config is not None else {}
+    section = extra.get("telemetry") or {}
+    try:
+        return TelemetrySettings(**section)
+    except ValidationError as e:
+        err_msg = f"Invalid telemetry settings in rdeconfig.yaml: {e}"
+        raise StructuredError(err_msg) from e
@@ -0,0 +1,82 @@
+"""Normalization of the image shape before the pyramid decomposition.
+
+Every pyramid level halves the lowpass image. With an awkward size (e.g.
+1536 x 1103) the levels get odd sizes, the last row and column of a level are
+decimated from a partial 2 x 2 block, and FFT-based correlations (the batched
+pyramid) pad each level to a different transform size. :func:`normalize_shape`
+brings the image to an FFT-friendly size instead: a multiple of
+``2 ** height`` (so every level halves exactly) whose quotient has no prime
+factor above 5.
+
+- ``"crop"`` cuts the image to the largest such size that fits. The cut rows
+  and columns are simply not used. A side is not cropped if that would make
+  it shorter than the pyramid needs (``min_size``, e.g. 280 -> 256 for a
+  minimum of 272).
+- ``"pad"`` reflects the image to the smallest such size that contains it and
+  returns a mask of the original region. The features are then reduced over
+  the original pixels only (see :mod:`modules.masking`): the pixel moments are
+  unchanged, and coefficients of the coarser levels that depend on padded
+  pixels are excluded.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+from scipy import fft
+
+SHAPE_MODES: tuple[str, ...] = ("none", "pad", "crop")
+
+
+def fft_friendly_size(size: int, multiple: int, *, larger: bool) -> int:
+    """Return the nearest multiple of ``multiple`` with a 5-smooth quotient.
+
+    Args:
+        size (int): Original size.
+        multiple (int): Required divisor (``2 ** height``).
+        larger (bool): If True, return the smallest such size not below ``size``,
+            otherwise the largest not above it (at least ``multiple``).
+
+    Returns:
+        int: The FFT-friendly size.
+
+    """
+    if larger:
+        return multiple * fft.next_fast_len(-(-size // multiple), real=True)
+    quotient = max(size // multiple, 1)
+    while fft.next_fast_len(quotient, real=True) != quotient:
+        quotient -= 1
+    return multiple * quotient
+
+
+def normalize_shape(image: np.ndarray, mask: np.ndarray | None, mode: str, height: int, *, min_size: int = 0) -> tuple[np.ndarray, np.ndarray | None]:
+    """Pad or crop an image to an FFT-friendly shape.
+
+    Args:
+        image (np.ndarray): 2-D image.
+        mask (np.ndarray | None): Boolean mask of the valid pixels of ``image``.
+        mode (str): ``"none"``, ``"pad"`` or ``"crop"``.
+        height (int): Height of the pyramid that will be built.
+        min_size (int): Smallest side the pyramid accepts. With ``"crop"`` a side that
+            would be cut below it keeps its size.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray | None]: The normalized image and its mask. With
+        ``"pad"`` the mask marks the original region (combined with ``mask``).
+
+    """
+    if mode == "none":
+        return image, mask
+    multiple = 2**height
+    rows, cols = image.shape
+    target = tuple(fft_friendly_size(size, multiple, larger=mode == "pad") for size in (rows, cols))
+    if mode == "crop":
+        target = tuple(size if cropped < min_size else cropped for size, cropped in zip((rows, cols), target, strict=True))
+    if target == (rows, cols):
+        return image, mask
+    if mode == "crop":
+        return image[: target[0], : target[1]], None if mask is None else mask[: target[0], : target[1]]
+    padding = ((0, target[0] - rows), (0, target[1] - cols))
+    valid = np.zeros(target, dtype=bool)
+    valid[:rows, :cols] = True if mask is None else mask
+    # "reflect" equals the reflect1 edge handling of the pyramid filters.
+    return np.pad(image, padding, mode="reflect"), valid
@@ -0,0 +1,196 @@
+"""Shared-memory hand-off of decoded images to a process pool.
+
+Sending a decoded 2048 x 2048 image to a worker process pickles and copies the
+whole pixel buffer. With :func:`batch_wavelet_process` the parent decodes and
+crops each image into a ``multiprocessing.shared_memory`` buffer and only a
+small :class:`SharedImageHandle` is sent to the worker, which attaches to the
+buffer without copying. Buffers are recycled across images, so a batch of
+same-sized images allocates at most ``max_buffers`` segments.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+
+from modules import wavelet
+from modules.image_ingest import ingest_image
+
+
+@dataclass(frozen=True)
+class SharedImageHandle:
+    """Picklable reference to an image stored in shared memory.
+
+    Attributes:
+        name (str): Name of the shared memory segment.
+        shape (tuple[int, ...]): Shape of the image.
+        dtype (str): Numpy dtype string of the image.
+
+    """
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+class SharedImagePool:
+    """Parent-side pool of reusable shared memory buffers.
+
+    A released buffer is handed out again for any image that fits in it. When
+    all ``max_buffers`` buffers are in use, :meth:`acquire` raises, so callers
+    bound the number of images in flight to the pool size.
+
+    Args:
+        max_buffers (int): Maximum number of shared memory segments.
+
+    Example:
+        with SharedImagePool(4) as pool:
+            handle, view = pool.acquire(image.shape, image.dtype)
+            view[...] = image
+            ...  # send handle to a worker
+            pool.release(handle)
+
+    """
+
+    def __init__(self, max_buffers: int):
+        self.max_buffers = max_buffers
+        self.allocations = 0
+        self._free: list[shared_memory.SharedMemory] = []
+        self._used: dict[str, shared_memory.SharedMemory] = {}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def acquire(self, shape: tuple[int, ...], dtype: Any) -> tuple[SharedImageHandle, np.ndarray]:
+        """Reserve a buffer for an image and return its handle and a writable view.
+
+        Args:
+            shape (tuple[int, ...]): Shape of the image.
+            dtype (Any): Numpy dtype of the image.
+
+        Returns:
+            tuple[SharedImageHandle, np.ndarray]: The handle to send to a worker and
+            a view on the buffer to write the image into.
+
+        Raises:
+            RuntimeError: If all buffers are in use.
+
+        """
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        shm = self._take_free(nbytes)
+        if shm is None:
+            if len(self._free) + len(self._used) >= self.max_buffers:
+                if not self._free:
+                    err_msg = "All shared image buffers are in use"
+                    raise RuntimeError(err_msg)
+                # Replace the smallest free buffer, which is too small for this image.
+                smallest = min(self._free, key=lambda s: s.size)
+                self._free.remove(smallest)
+                smallest.close()
+                smallest.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.allocations += 1
+        self._used[shm.name] = shm
+        view: np.ndarray = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        return SharedImageHandle(shm.name, tuple(shape), dtype.str), view
+
+    def release(self, handle: SharedImageHandle) -> None:
+        """Return the buffer of ``handle`` to the pool for reuse."""
+        self._free.append(self._used.pop(handle.name))
+
+    def close(self) -> None:
+        """Close and unlink every buffer of the pool."""
+        for shm in [*self._free, *self._used.values()]:
+            shm.close()
+            shm.unlink()
+        self._free.clear()
+        self._used.clear()
+
+    def _take_free(self, nbytes: int) -> shared_memory.SharedMemory | None:
+        candidates = [shm for shm in self._free if shm.size >= nbytes]
+        if not candidates:
+            return None
+        shm = min(candidates, key=lambda s: s.size)
+        self._free.remove(shm)
+        return shm
+
+
+@contextmanager
+def attach_shared_image(handle: SharedImageHandle) -> Iterator[np.ndarray]:
+    """Attach to a shared image in a worker process without copying.
+
+    The array is only valid inside the ``with`` block.
+
+    Args:
+        handle (SharedImageHandle): Handle created by :meth:`SharedImagePool.acquire`.
+
+    Yields:
+        np.ndarray: Read-only view on the shared image.
+
+    """
+    shm = shared_memory.SharedMemory(name=handle.name)
+    try:
+        image: np.ndarray = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+        image.flags.writeable = False
+        yield image
+        del image
+    finally:
+        shm.close()
+
+
+def _compute_shared_features(handle: SharedImageHandle, options: dict[str, Any]) -> dict[str, Any]:
+    with attach_shared_image(handle) as image:
+        return wavelet.compute_features(image, **options)
+
+
+def batch_wavelet_process(input_file_paths: Sequence[Path], *, workers: int, max_buffers: int | None = None, **options: Any) -> list[dict[str, Any]]:
+    """Compute features for many images on a process pool using shared memory.
+
+    The parent process decodes and crops each image into a recycled shared
+    buffer and submits only its handle. At most ``max_buffers`` images are in
+    flight, which also bounds the shared memory in use.
+
+    Args:
+        input_file_paths (Sequence[Path]): Images to process.
+        workers (int): Number of worker processes.
+        max_buffers (int | None): Number of shared buffers. Defaults to ``2 * workers``,
+            so every worker has its next image ready.
+        **options (Any): Keyword arguments passed to :func:`wavelet.compute_features`.
+
+    Returns:
+        list[dict[str, Any]]: Feature dictionaries in the order of ``input_file_paths``.
+
+    """
+    max_buffers = max_buffers if max_buffers is not None else 2 * workers
+    results: list[dict[str, Any]] = [{} for _ in input_file_paths]
+    pending: dict[Future, tuple[int, SharedImageHandle, dict[str, Any]]] = {}
+    with SharedImagePool(max_buffers) as pool, ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def collect(futures: set[Future]) -> None:
+            for future in futures:
+                index, handle, source_metadata = pending.pop(future)
+                pool.release(handle)
+                results[index] = future.result() | source_metadata
+
+        for index, path in enumerate(input_file_paths):
+            if len(pending) >= max_buffers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            ingested = ingest_image(path, crop=wavelet.CROP_SIZE)
+            handle, view = pool.acquire(ingested.pixels.shape, ingested.pixels.dtype)
+            view[...] = ingested.pixels
+            del view
+            pending[executor.submit(_compute_shared_features, handle, options)] = (index, handle, ingested.metadata())
+        collect(set(wait(pending).done))
+    return results
@@ -8,6 +8,7 @@ from rdetoolkit.exceptions import StructuredError
 from rdetoolkit.models.rde2types import MetaType
 
 from modules.interfaces import IStructuredDataProcessor
+from modules.output_writer import FeatureRecord, atomic_write_bytes
 
 
 class StructuredDataProcessor(IStructuredDataProcessor):
@@ -56,9 +57,7 @@ class StructuredDataProcessor(IStructuredDataProcessor):
             output_path (Path): Path for the CSV file to be saved
 
         """
-        df = pd.DataFrame(meta, index=[0])
-        df = df.rename(index={0: input_file_name})
-        self.to_csv(df, output_path, header=df.columns.to_list(), index=True)
+        atomic_write_bytes(output_path, FeatureRecord.from_meta(meta, input_file_name).csv_bytes())
 
     def to_png(self, tif_path: Path, png_path: Path) -> None:
         """Convert a TIFF image to PNG.
@@ -0,0 +1,395 @@
+"""Resource-usage telemetry of a structuring run.
+
+Batch pools are sized by VM SKU and tasks per node, but a task gives no
+feedback on how much CPU, memory and I/O it actually used. :class:`ResourceMonitor`
+samples the process from a background thread at a fixed interval and
+:func:`monitor_run` wraps a whole run with it and writes, to ``data/logs``:
+
+- ``telemetry.csv``: the time series of the samples,
+- ``telemetry_summary.json``: averages, peaks, totals and an estimate of the
+  number of such tasks one node of the current size could run concurrently,
+- ``telemetry_otlp.jsonl`` (optional): the time series as OpenTelemetry
+  metrics in the OTLP/JSON encoding used by the OpenTelemetry Collector file
+  exporter, so it can be replayed into any OTLP-compatible backend.
+
+The values are read from ``/proc`` (Linux) without additional
+dependencies; on other platforms only the CPU time and the peak RSS are
+available. CPU time and RSS include the child processes (e.g. the tile
+workers): the CPU time of terminated children (``RUSAGE_CHILDREN``) and
+the CPU time and RSS of the live descendants. I/O counts the bytes this
+process passed through read/write system calls (``rchar``/``wchar``), i.e.
+including page-cache hits and network mounts.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Self
+
+import numpy as np
+from rdetoolkit.config import load_config
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.rdelogger import get_logger
+
+from modules.settings import TelemetrySettings, load_telemetry_settings
+
+logger = get_logger(__name__, file_path="data/logs/rdesys.log")
+
+TIMESERIES_NAME: str = "telemetry.csv"
+SUMMARY_NAME: str = "telemetry_summary.json"
+OTLP_NAME: str = "telemetry_otlp.jsonl"
+SERVICE_NAME: str = "wavelet-transform-characterization"
+_MB: int = 1024**2
+
+
+@dataclass(frozen=True)
+class TelemetrySample:
+    """Cumulative resource usage of the process at one point in time.
+
+    Attributes:
+        timestamp (float): Wall-clock time (seconds since the epoch).
+        elapsed (float): Seconds since the monitor started.
+        cpu_seconds (float): User plus system CPU time of all threads and child processes.
+        rss_bytes (int): Resident set size of the process and its live descendants.
+        read_bytes (int): Bytes read through system calls.
+        write_bytes (int): Bytes written through system calls.
+
+    """
+
+    timestamp: float
+    elapsed: float
+    cpu_seconds: float
+    rss_bytes: int
+    read_bytes: int
+    write_bytes: int
+
+
+def read_process_usage() -> tuple[float, int, int, int]:
+    """Return the CPU seconds, RSS, read bytes and written bytes of this process.
+
+    The CPU seconds include the terminated children and the live descendants,
+    and the RSS that of the live descendants; the I/O is that of this process.
+    """
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        fields = _read_stat("self")
+        ticks = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks + children.ru_utime + children.ru_stime
+        rss_bytes = int(fields[21]) * page_size
+    except (OSError, IndexError, ValueError):
+        times = os.times()
+        cpu_seconds = times.user + times.system + times.children_user + times.children_system
+        # Without /proc only the peak RSS is available.
+        rss_bytes = _peak_rss()
+    else:
+        for pid in _descendants(os.getpid()):
+            try:
+                fields = _read_stat(str(pid))
+            except (OSError, IndexError):
+                # The process exited since it was listed.
+                continue
+            # Including the children the descendant has waited for (cutime, cstime).
+            cpu_seconds += sum(int(value) for value in fields[11:15]) / ticks
+            rss_bytes += int(fields[21]) * page_size
+    try:
+        io = dict(line.split(": ") for line in Path("/proc/self/io").read_text().splitlines())
+        read_bytes, write_bytes = int(io["rchar"]), int(io["wchar"])
+    except (OSError, KeyError, ValueError):
+        read_bytes = write_bytes = 0
+    return cpu_seconds, rss_bytes, read_bytes, write_bytes
+
+
+class ResourceMonitor:
+    """Sample the resource usage of the process on a background thread.
+
+    Args:
+        interval (float): Seconds between two samples.
+
+    Example:
+        with ResourceMonitor(interval=0.5) as monitor:
+            run()
+        print(monitor.summary())
+
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.samples: list[TelemetrySample] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Take the first sample and start the sampling thread."""
+        self._started = time.monotonic()
+        self._stop.clear()
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sampling thread and take the last sample."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.sample()
+
+    def sample(self) -> TelemetrySample:
+        """Record one sample now."""
+        cpu_seconds, rss_bytes, read_bytes, write_bytes = read_process_usage()
+        sample = TelemetrySample(time.time(), time.monotonic() - self._started, cpu_seconds, rss_bytes, read_bytes, write_bytes)
+        self.samples.append(sample)
+        return sample
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def summary(self) -> dict[str, Any]:
+        """Aggregate the samples for capacity planning.
+
+        ``cpu_cores_*`` are in units of busy cores (1.0 = one core fully used)
+        and are computed per sampling interval. ``suggested_tasks_per_node`` is
+        the number of such tasks that fit on this node by both CPU (mean cores)
+        and memory (peak RSS).
+
+        Returns:
+            dict[str, Any]: The summary values.
+
+        """
+        first, last = self.samples[0], self.samples[-1]
+        duration = max(last.elapsed - first.elapsed, 1e-9)
+        elapsed = np.array([s.elapsed for s in self.samples])
+        dt = np.maximum(np.diff(elapsed), 1e-9)
+        cores = np.diff([s.cpu_seconds for s in self.samples]) / dt if len(self.samples) > 1 else np.zeros(1)
+        rss = np.array([s.rss_bytes for s in self.samples], dtype=np.float64)
+        rss_peak = max(float(rss.max()), _peak_rss())
+        read_rate = np.diff([s.read_bytes for s in self.samples]) / dt if len(self.samples) > 1 else np.zeros(1)
+        write_rate = np.diff([s.write_bytes for s in self.samples]) / dt if len(self.samples) > 1 else np.zeros(1)
+        cpu_count = _cpu_count()
+        memory_total = _memory_total()
+        cpu_cores_mean = (last.cpu_seconds - first.cpu_seconds) / duration
+        by_cpu = cpu_count / max(cpu_cores_mean, 0.01)
+        by_memory = memory_total / rss_peak if memory_total else by_cpu
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(first.timestamp)),
+            "duration_seconds": duration,
+            "interval_seconds": self.interval,
+            "samples": len(self.samples),
+            "cpu_seconds": last.cpu_seconds - first.cpu_seconds,
+            "cpu_cores_mean": cpu_cores_mean,
+            "cpu_cores_p95": float(np.percentile(cores, 95)),
+            "cpu_cores_max": float(cores.max()),
+            "cpu_count": cpu_count,
+            "rss_mean_mb": float(rss.mean()) / _MB,
+            "rss_peak_mb": rss_peak / _MB,
+            "memory_total_mb": memory_total / _MB,
+            "read_mb": (last.read_bytes - first.read_bytes) / _MB,
+            "write_mb": (last.write_bytes - first.write_bytes) / _MB,
+            "read_mb_per_second_max": float(read_rate.max()) / _MB,
+            "write_mb_per_second_max": float(write_rate.max()) / _MB,
+            "suggested_tasks_per_node": max(int(min(by_cpu, by_memory)), 1),
+        }
+
+    def write_timeseries(self, path: Path) -> None:
+        """Write the samples as CSV.
+
+        ``cpu_seconds``, ``read_mb`` and ``write_mb`` are cumulative since the
+        monitor started and ``cpu_cores`` is the CPU use of each interval in busy cores.
+        """
+        first = previous = self.samples[0]
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["timestamp", "elapsed_seconds", "cpu_seconds", "cpu_cores", "rss_mb", "read_mb", "write_mb"])
+            for sample in self.samples:
+                dt = sample.elapsed - previous.elapsed
+                cores = (sample.cpu_seconds - previous.cpu_seconds) / dt if dt > 0 else 0.0
+                writer.writerow(
+                    [
+                        f"{sample.timestamp:.3f}",
+                        f"{sample.elapsed:.3f}",
+                        f"{sample.cpu_seconds - first.cpu_seconds:.3f}",
+                        f"{cores:.3f}",
+                        f"{sample.rss_bytes / _MB:.2f}",
+                        f"{(sample.read_bytes - first.read_bytes) / _MB:.3f}",
+                        f"{(sample.write_bytes - first.write_bytes) / _MB:.3f}",
+                    ],
+                )
+                previous = sample
+
+    def write_summary(self, path: Path) -> None:
+        """Write :meth:`summary` as JSON."""
+        path.write_text(json.dumps(self.summary(), indent=4), encoding="utf-8")
+
+    def write_otlp(self, path: Path) -> None:
+        """Write the samples as one OTLP/JSON ``ExportMetricsServiceRequest`` line.
+
+        The metrics follow the OpenTelemetry process semantic conventions:
+        ``process.cpu.time`` and ``process.disk.io`` (cumulative sums since the
+        monitor started) and ``process.memory.usage`` (gauge).
+        """
+        first = self.samples[0]
+        start = _nanos(first.timestamp)
+
+        def points(values: list[Any], attributes: dict[str, str] | None = None, cumulative: bool = True) -> list[dict[str, Any]]:
+            result = []
+            for sample, value in zip(self.samples, values, strict=True):
+                point: dict[str, Any] = {"timeUnixNano": _nanos(sample.timestamp)}
+                if cumulative:
+                    point["startTimeUnixNano"] = start
+                point["asDouble" if isinstance(value, float) else "asInt"] = value if isinstance(value, float) else str(value)
+                if attributes:
+                    point["attributes"] = [{"key": key, "value": {"stringValue": value}} for key, value in attributes.items()]
+                result.append(point)
+            return result
+
+        def cumulative_sum(name: str, unit: str, data_points: list[dict[str, Any]]) -> dict[str, Any]:
+            return {"name": name, "unit": unit, "sum": {"aggregationTemporality": 2, "isMonotonic": True, "dataPoints": data_points}}
+
+        metrics = [
+            cumulative_sum("process.cpu.time", "s", points([s.cpu_seconds - first.cpu_seconds for s in self.samples])),
+            {"name": "process.memory.usage", "unit": "By", "gauge": {"dataPoints": points([s.rss_bytes for s in self.samples], cumulative=False)}},
+            cumulative_sum(
+                "process.disk.io",
+                "By",
+                points([s.read_bytes - first.read_bytes for s in self.samples], {"direction": "read"})
+                + points([s.write_bytes - first.write_bytes for s in self.samples], {"direction": "write"}),
+            ),
+        ]
+        resource_attributes = {"service.name": SERVICE_NAME, "host.name": os.uname().nodename, "process.pid": str(os.getpid())}
+        if "AZ_BATCH_TASK_ID" in os.environ:
+            resource_attributes["azure.batch.job.id"] = os.environ.get("AZ_BATCH_JOB_ID", "")
+            resource_attributes["azure.batch.task.id"] = os.environ["AZ_BATCH_TASK_ID"]
+        request = {
+            "resourceMetrics": [
+                {
+                    "resource": {"attributes": [{"key": key, "value": {"stringValue": value}} for key, value in resource_attributes.items()]},
+                    "scopeMetrics": [{"scope": {"name": __name__}, "metrics": metrics}],
+                },
+            ],
+        }
+        path.write_text(json.dumps(request) + "\n", encoding="utf-8")
+
+
+@contextmanager
+def monitor_run(data_dir: Path) -> Iterator[ResourceMonitor | None]:
+    """Monitor a structuring run and write the telemetry files to ``data_dir/logs``.
+
+    The ``telemetry`` section of ``data_dir/tasksupport/rdeconfig.yaml`` is
+    read first. Telemetry must never fail the run: invalid settings and write
+    errors are logged to ``data/logs/rdesys.log`` and the run continues without (or
+    without writing) it.
+
+    Args:
+        data_dir (Path): The ``data`` directory of the run.
+
+    Yields:
+        ResourceMonitor | None: The running monitor, or None if telemetry is disabled.
+
+    """
+    try:
+        settings: TelemetrySettings = load_telemetry_settings(load_config(str(data_dir.joinpath("tasksupport"))))
+    except (StructuredError, OSError, ValueError) as e:
+        logger.warning("Telemetry is disabled: %s", e)
+        settings = TelemetrySettings(enabled=False)
+    if not settings.enabled:
+        yield None
+        return
+    monitor = ResourceMonitor(settings.interval)
+    monitor.start()
+    try:
+        yield monitor
+    finally:
+        monitor.stop()
+        try:
+            logs = data_dir.joinpath("logs")
+            logs.mkdir(parents=True, exist_ok=True)
+            monitor.write_timeseries(logs.joinpath(TIMESERIES_NAME))
+            monitor.write_summary(logs.joinpath(SUMMARY_NAME))
+            if settings.otlp:
+                monitor.write_otlp(logs.joinpath(OTLP_NAME))
+        except OSError as e:
+            logger.warning("Failed to write the telemetry: %s", e)
+
+
+def _nanos(timestamp: float) -> str:
+    return str(int(timestamp * 1e9))
+
+
+def _read_stat(pid: str) -> list[str]:
+    # Fields of /proc/<pid>/stat after the command name, starting with the state.
+    return Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()
+
+
+def _descendants(pid: int) -> list[int]:
+    # Live descendant processes, from /proc/<pid>/task/*/children where the kernel
+    # provides it (CONFIG_PROC_CHILDREN) and from the parent pids of all processes otherwise.
+    if Path(f"/proc/{pid}/task/{pid}/children").exists():
+
+        def children(parent: int) -> list[int]:
+            pids: list[int] = []
+            for path in Path(f"/proc/{parent}/task").glob("*/children"):
+                try:
+                    pids.extend(int(child) for child in path.read_text().split())
+                except OSError:
+                    continue
+            return pids
+
+    else:
+        parents: dict[int, list[int]] = {}
+        for path in Path("/proc").glob("[0-9]*/stat"):
+            try:
+                parents.setdefault(int(_read_stat(path.parent.name)[1]), []).append(int(path.parent.name))
+            except (OSError, IndexError, ValueError):
+                continue
+
+        def children(parent: int) -> list[int]:
+            return parents.get(parent, [])
+
+    result: list[int] = []
+    pending = children(pid)
+    while pending:
+        child = pending.pop()
+        result.append(child)
+        pending.extend(children(child))
+    return result
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def _memory_total() -> int:
+    try:
+        with open("/proc/meminfo") as fh:
+            return next(int(line.split()[1]) * 1024 for line in fh if line.startswith("MemTotal:"))
+    except (OSError, StopIteration):
+        return 0
@@ -0,0 +1,176 @@
+"""Header-only inspection of TIFF files.
+
+:func:`read_tiff_header` reads the file header and the image file
+directories (IFDs) with :class:`tifffile.TiffFile`, which does not decode any
+pixel. It reports the layout of the first page and the number of pages, and
+raises :class:`TiffHeaderError` for files that would otherwise only fail deep
+inside the feature extraction, after the expensive decode:
+
+- a wrong signature, or a header or first IFD outside the file,
+- missing or zero image dimensions,
+- strip or tile tables too short for the image layout,
+- segments extending past the end of the file (truncated uploads).
+"""
+
+from __future__ import annotations
+
+import math
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+from PIL.TiffImagePlugin import COMPRESSION_INFO
+
+try:
+    import tifffile
+except ImportError:  # pragma: no cover
+    tifffile = None  # type: ignore[assignment]
+
+PIL_BIT_DEPTHS: tuple[int, ...] = (1, 8, 16, 32)
+TIFFFILE_MAX_BIT_DEPTH: int = 64
+SAMPLE_FORMATS: dict[int, str] = {1: "uint", 2: "int", 3: "float", 4: "void"}
+_PHOTOMETRIC = 262
+
+
+class TiffHeaderError(ValueError):
+    """The TIFF header or IFD structure is malformed or inconsistent with the file."""
+
+
+@dataclass(frozen=True)
+class TiffHeader:
+    """Layout of the first page of a TIFF file.
+
+    Attributes:
+        shape (tuple[int, int]): Rows and columns of the image.
+        samples (int): Samples per pixel.
+        bit_depth (int): Bits per sample.
+        sample_format (str): ``"uint"``, ``"int"``, ``"float"`` or ``"void"``.
+        compression (int): TIFF compression code (1 = uncompressed, 5 = LZW, 8 = Deflate, ...).
+        photometric (int | None): Photometric interpretation code, if present.
+        planar (int): Planar configuration (1 = interleaved samples, 2 = one plane per sample).
+        tiled (bool): True if the page is stored in tiles rather than strips.
+        segments (int): Number of strips or tiles.
+        pages (int): Number of pages (IFDs) in the file.
+        bigtiff (bool): True for BigTIFF files.
+
+    """
+
+    shape: tuple[int, int]
+    samples: int
+    bit_depth: int
+    sample_format: str
+    compression: int
+    photometric: int | None
+    planar: int
+    tiled: bool
+    segments: int
+    pages: int
+    bigtiff: bool
+
+    def decoded_nbytes(self, crop: int | None = None) -> int:
+        """Return the size of the decoded pixels, optionally of the top-left ``crop`` region only.
+
+        Args:
+            crop (int | None): Edge length of the decoded region; ``None`` for the whole page.
+
+        Returns:
+            int: Bytes of the decoded pixel array (bilevel pixels count as one byte).
+
+        """
+        rows, cols = self.shape
+        if crop is not None:
+            rows, cols = min(rows, crop), min(cols, crop)
+        return rows * cols * self.samples * max(-(-self.bit_depth // 8), 1)
+
+    def unsupported_reason(self, backend: str) -> str | None:
+        """Return why a decoding backend cannot read this page, or None if it can.
+
+        Args:
+            backend (str): ``"pil"`` or ``"tifffile"``.
+
+        Returns:
+            str | None: A message naming the unsupported compression or bit depth.
+
+        """
+        if backend == "tifffile":
+            decodable = tifffile is not None and self.compression in tifffile.TIFF.DECOMPRESSORS
+            bit_depth_ok = 1 <= self.bit_depth <= TIFFFILE_MAX_BIT_DEPTH
+        else:
+            decodable = self.compression in COMPRESSION_INFO
+            bit_depth_ok = self.bit_depth in PIL_BIT_DEPTHS
+            # PIL refuses to open images above twice its decompression bomb limit.
+            if Image.MAX_IMAGE_PIXELS and self.shape[0] * self.shape[1] > 2 * Image.MAX_IMAGE_PIXELS:
+                return f"{self.shape[1]} x {self.shape[0]} pixels exceed the size limit of the pil backend"
+        if not decodable:
+            return f"compression {self.compression} cannot be decoded by the {backend} backend"
+        if not bit_depth_ok:
+            return f"{self.bit_depth}-bit samples cannot be decoded by the {backend} backend"
+        if self.sample_format == "void":
+            return "samples of undefined format"
+        return None
+
+
+def read_tiff_header(path: Path) -> TiffHeader:
+    """Read the header and IFDs of a TIFF file without decoding pixels.
+
+    Args:
+        path (Path): Path to the TIFF file.
+
+    Returns:
+        TiffHeader: The layout of the first page and the page count.
+
+    Raises:
+        TiffHeaderError: If the file is not a valid TIFF file or is truncated.
+        ImportError: If tifffile is not installed.
+
+    """
+    if tifffile is None:
+        err_msg = "tifffile is required to read TIFF headers"
+        raise ImportError(err_msg)
+    try:
+        with tifffile.TiffFile(path) as tif:
+            if not len(tif.pages):
+                err_msg = "no image file directory within the file (truncated file)"
+                raise TiffHeaderError(err_msg)
+            page = tif.pages.first
+            _check_segments(page, tif.filehandle.size)
+            return TiffHeader(**_page_layout(page), pages=len(tif.pages), bigtiff=tif.is_bigtiff)
+    except struct.error as e:
+        err_msg = f"the header is incomplete (truncated file): {e}"
+        raise TiffHeaderError(err_msg) from e
+    except tifffile.TiffFileError as e:
+        raise TiffHeaderError(str(e)) from e
+
+
+def _page_layout(page: Any) -> dict[str, Any]:
+    rows, cols = page.imagelength, page.imagewidth
+    photometric = page.tags.valueof(_PHOTOMETRIC)
+    if rows <= 0 or cols <= 0:
+        err_msg = f"invalid image size {cols} x {rows}"
+        raise TiffHeaderError(err_msg)
+    return {
+        "shape": (rows, cols),
+        "samples": page.samplesperpixel,
+        "bit_depth": page.bitspersample,
+        "sample_format": SAMPLE_FORMATS.get(int(page.sampleformat), "void"),
+        "compression": int(page.compression),
+        "photometric": None if photometric is None else int(photometric),
+        "planar": int(page.planarconfig),
+        "tiled": page.is_tiled,
+        "segments": math.prod(page.chunked),
+    }
+
+
+def _check_segments(page: Any, file_size: int) -> None:
+    # The strip or tile tables must cover the page and every segment must lie within the file.
+    expected = math.prod(page.chunked)
+    offsets, counts = page.dataoffsets, page.databytecounts
+    if len(offsets) != len(counts) or len(offsets) < expected:
+        err_msg = f"{len(offsets)} segment offsets and {len(counts)} byte counts for {expected} {'tiles' if page.is_tiled else 'strips'}"
+        raise TiffHeaderError(err_msg)
+    data_end = max((offset + count for offset, count in zip(offsets, counts, strict=True) if count), default=0)
+    if data_end > file_size:
+        err_msg = f"the image data ends at byte {data_end} but the file has {file_size} bytes (truncated file)"
+        raise TiffHeaderError(err_msg)
@@ -0,0 +1,214 @@
+"""Tile-parallel TIFF decoding with tifffile.
+
+PIL decodes compressed TIFFs on one thread and always decodes the whole
+image, although only the 2048 x 2048 crop is used. :func:`read_tiff` reads the
+compressed tiles or strips of the first page, decodes those that intersect
+the crop on a thread pool (the tifffile/imagecodecs decoders release the GIL)
+and copies each decoded segment directly into the output array. BigTIFF and
+the compressions supported by tifffile/imagecodecs (LZW, Deflate, ...) are
+handled transparently.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:  # pragma: no cover
+    tifffile = None  # type: ignore[assignment]
+
+# Compressed segments read ahead per decoding thread.
+SEGMENTS_IN_FLIGHT: int = 4
+
+# Samples per pixel of gray + alpha, RGB and RGBA pages.
+_GRAY_ALPHA_SAMPLES: int = 2
+_RGB_SAMPLES: int = 3
+_RGBA_SAMPLES: int = 4
+
+
+@dataclass(frozen=True)
+class TiffPageInfo:
+    """Header information of the first page of a TIFF file.
+
+    Attributes:
+        shape (tuple[int, int]): Rows and columns of the image.
+        samples (int): Samples per pixel.
+        bit_depth (int): Bits per sample.
+        photometric (str): Photometric interpretation (e.g. ``"MINISBLACK"``, ``"RGB"``, ``"PALETTE"``).
+        mode (str): Equivalent PIL mode (e.g. ``"L"``, ``"I;16"``, ``"RGB"``).
+        colormap (np.ndarray | None): ``(3, entries)`` colormap of palette images.
+
+    """
+
+    shape: tuple[int, int]
+    samples: int
+    bit_depth: int
+    photometric: str
+    mode: str
+    colormap: np.ndarray | None = None
+
+
+def is_available() -> bool:
+    """Return True if tifffile can be imported."""
+    return tifffile is not None
+
+
+def read_tiff(path: Path, *, crop: int | None = None, threads: int = 1) -> np.ndarray:
+    """Decode the first page of a TIFF file, optionally cropped to its top-left corner.
+
+    Args:
+        path (Path): Path to the TIFF file.
+        crop (int | None): Edge length of the top-left region to decode. ``None``
+            decodes the whole page.
+        threads (int): Number of decoding threads.
+
+    Returns:
+        np.ndarray: The pixel array with shape ``(rows, cols)`` or ``(rows, cols, samples)``.
+
+    Raises:
+        ImportError: If tifffile is not installed.
+
+    """
+    if tifffile is None:
+        err_msg = "tifffile is required for the tifffile backend"
+        raise ImportError(err_msg)
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages.first
+        if not _is_segment_decodable(page):
+            image = _to_rows_cols_samples(page, page.asarray(maxworkers=threads))
+            return image if crop is None else image[:crop, :crop]
+        return _read_segments(tif, page, crop, threads)
+
+
+def map_tiff(path: Path, scratch: Path, *, threads: int = 1) -> np.ndarray:
+    """Return the first page of a TIFF file as a memory-mapped array.
+
+    Uncompressed contiguous pages are mapped in place. Other pages are decoded
+    segment by segment into the memory-mapped file ``scratch``, with at most
+    ``SEGMENTS_IN_FLIGHT`` segments per thread read ahead, so neither needs
+    memory for the whole image.
+
+    Args:
+        path (Path): Path to the TIFF file.
+        scratch (Path): File created for the decoded pixels if the page cannot be mapped.
+        threads (int): Number of decoding threads.
+
+    Returns:
+        np.ndarray: A read-only ``numpy.memmap`` with shape ``(rows, cols)`` or ``(rows, cols, samples)``.
+
+    Raises:
+        ImportError: If tifffile is not installed.
+
+    """
+    if tifffile is None:
+        err_msg = "tifffile is required for the tifffile backend"
+        raise ImportError(err_msg)
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages.first
+        if page.is_memmappable:
+            return _to_rows_cols_samples(page, tifffile.memmap(path, page=0, mode="r"))
+        if not _is_segment_decodable(page):
+            return _to_rows_cols_samples(page, page.asarray(out=str(scratch), maxworkers=threads))
+        out = np.memmap(str(scratch), dtype=page.dtype, mode="w+", shape=(page.shaped[2], page.shaped[3], page.shaped[4]))
+        _read_segments(tif, page, None, threads, out=out)
+        return out if page.shaped[4] > 1 else out[:, :, 0]
+
+
+def read_page_info(path: Path) -> TiffPageInfo:
+    """Read the header of the first page of a TIFF file without decoding pixels.
+
+    Args:
+        path (Path): Path to the TIFF file.
+
+    Returns:
+        TiffPageInfo: Shape, sample layout and PIL-equivalent mode of the page.
+
+    Raises:
+        ImportError: If tifffile is not installed.
+
+    """
+    if tifffile is None:
+        err_msg = "tifffile is required for the tifffile backend"
+        raise ImportError(err_msg)
+    with tifffile.TiffFile(path) as tif:
+        page = tif.pages.first
+        samples = page.shaped[0] * page.shaped[4]
+        photometric = tifffile.PHOTOMETRIC(page.photometric).name
+        return TiffPageInfo(
+            shape=(page.shaped[2], page.shaped[3]),
+            samples=samples,
+            bit_depth=page.bitspersample,
+            photometric=photometric,
+            mode=_pil_mode(photometric, np.dtype(page.dtype) if page.dtype is not None else None, samples),
+            colormap=page.colormap,
+        )
+
+
+def _pil_mode(photometric: str, dtype: np.dtype | None, samples: int) -> str:
+    if photometric == "PALETTE":
+        return "P"
+    if photometric in ("RGB", "YCBCR", "CMYK") or samples >= _RGB_SAMPLES:
+        return {"YCBCR": "YCbCr", "CMYK": "CMYK"}.get(photometric, "RGBA" if samples == _RGBA_SAMPLES else "RGB")
+    if dtype is None:
+        return photometric
+    mode = {"b": "1", "f": "F"}.get(dtype.kind) or {1: "L", 2: "I;16"}.get(dtype.itemsize, "I")
+    return mode + "A" if samples == _GRAY_ALPHA_SAMPLES and mode in ("L",) else mode
+
+
+def _to_rows_cols_samples(page: Any, image: np.ndarray) -> np.ndarray:
+    # Planar-separate pages decode to (samples, rows, cols); move the samples last.
+    separate, depth, rows, cols, contig = page.shaped
+    if depth != 1 or separate == 1:
+        return image
+    image = np.moveaxis(image.reshape(separate, rows, cols, contig), 0, -2)
+    return image.reshape(rows, cols, separate * contig)
+
+
+def _is_segment_decodable(page: Any) -> bool:
+    # Planar-separate samples and volumetric tiles need the generic path.
+    return page.shaped[0] == 1 and page.shaped[1] == 1 and len(page.dataoffsets) == int(np.prod(page.chunked))
+
+
+def _read_segments(tif: Any, page: Any, crop: int | None, threads: int, out: np.ndarray | None = None) -> np.ndarray:
+    rows, cols, samples = page.shaped[2], page.shaped[3], page.shaped[4]
+    if crop is not None:
+        rows, cols = min(rows, crop), min(cols, crop)
+    if out is None:
+        out = np.empty((rows, cols, samples), dtype=page.dtype)
+    chunk_rows, chunk_cols = page.chunks[0], page.chunks[1]
+    grid_cols = -(-page.shaped[3] // chunk_cols)
+
+    def decode_into(data: bytes | None, index: int, y: int, x: int) -> None:
+        segment = page.decode(data, index, jpegtables=page.jpegtables)[0]
+        height, width = min(chunk_rows, rows - y), min(chunk_cols, cols - x)
+        if segment is None:
+            out[y : y + height, x : x + width] = 0
+        else:
+            out[y : y + height, x : x + width] = segment[0, :height, :width]
+
+    futures: deque[Future] = deque()
+    filehandle = tif.filehandle
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+        for index, (offset, bytecount) in enumerate(zip(page.dataoffsets, page.databytecounts, strict=True)):
+            y = (index // grid_cols) * chunk_rows
+            x = (index % grid_cols) * chunk_cols
+            if y >= rows or x >= cols:
+                continue
+            data = None
+            if bytecount:
+                filehandle.seek(offset)
+                data = filehandle.read(bytecount)
+            # Bound the compressed segments held in memory while the decoders catch up.
+            if len(futures) >= SEGMENTS_IN_FLIGHT * max(threads, 1):
+                futures.popleft().result()
+            futures.append(executor.submit(decode_into, data, index, y, x))
+        for future in futures:
+            future.result()
+    return out if samples > 1 else out[:, :, 0]
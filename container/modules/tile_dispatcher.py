@@ -0,0 +1,160 @@
+"""Parallel feature extraction of MultiDataTile tiles.
+
+``rdetoolkit.workflows.run`` calls ``dataset`` once per tile, one after the
+other. In MultiDataTile mode every input file is its own tile and the tiles
+are processed in the order of their sorted paths, so the files of the next
+tiles are known while the current one is processed. :class:`TileDispatcher`
+uses that to extract the features of the current tile and of the following
+ones concurrently in a bounded process pool. ``dataset`` itself still runs
+tile by tile in the main process and writes every output into the tile's
+own directories, so the output layout is unchanged, and an error raised
+while extracting a tile is re-raised by the ``dataset`` call of that tile,
+so rdetoolkit reports it for that tile only. A worker process that dies
+(e.g. killed for lack of memory) breaks the whole pool; the pool is then
+replaced and the current tile is extracted again on its own, so only the
+tile that crashes its worker fails. Files that are still being
+staged (see :mod:`modules.input_staging`) are submitted by a later call,
+once they have arrived.
+"""
+
+from __future__ import annotations
+
+import bisect
+import shutil
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Self
+
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.models.rde2types import MetaType
+
+from modules import masking
+from modules.input_staging import INPUT_STAGER
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+
+TIFF_SUFFIXES = (".tif", ".tiff")
+
+
+def _extract(settings: WaveletSettings, path: Path, store_dir: Path | None) -> tuple[dict[str, Any], Path | None]:
+    """Validate one tile and compute its features inside a worker process."""
+    reader = FileReader(settings)
+    reader.validate((path,))
+    store = store_dir.joinpath(f"{path.stem}_pyramid.zip") if store_dir is not None else None
+    return dict(reader.read(path, coefficient_store=store)), store
+
+
+class TileDispatcher:
+    """Look-ahead dispatcher of the feature extraction of consecutive tiles.
+
+    With ``tile_workers`` of 1 :meth:`read` simply calls ``FileReader.read``.
+    Otherwise it submits the current tile and the next ``2 * tile_workers - 1``
+    TIFF files of the same input directory to a pool of ``tile_workers``
+    processes and waits for the current one. Each worker plans its threads
+    with ``1 / tile_workers`` of the available memory.
+
+    Example:
+        with TILE_DISPATCHER:
+            meta = TILE_DISPATCHER.read(file_reader, rawfile)
+
+    """
+
+    def __init__(self) -> None:
+        self._executor: ProcessPoolExecutor | None = None
+        self._workers = 0
+        self._futures: dict[Path, Future] = {}
+        self._store_dir: Path | None = None
+        self._listings: dict[Path, list[Path]] = {}
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.shutdown()
+
+    def read(self, file_reader: FileReader, rawfile: Path, *, coefficient_store: Path | None = None) -> MetaType:
+        """Return the features of a validated tile, computed ahead if possible.
+
+        Args:
+            file_reader (FileReader): Reader with the settings of the run.
+            rawfile (Path): The validated TIFF file of the current tile.
+            coefficient_store (Path | None): If given, the pyramid coefficients are
+                moved to this file.
+
+        Returns:
+            MetaType: The extracted metadata.
+
+        Raises:
+            StructuredError: If the worker failed to validate or process the file, or
+                its process died while processing it.
+
+        """
+        settings = file_reader.settings
+        if settings.tile_workers <= 1:
+            return file_reader.read(rawfile, coefficient_store=coefficient_store)
+        executor = self._start(settings.tile_workers)
+        for path in self._upcoming(rawfile, settings)[: 2 * settings.tile_workers]:
+            if path not in self._futures and all(INPUT_STAGER.is_ready(p) for p in (path, *file_reader.mask_files(path))):
+                self._futures[path] = executor.submit(_extract, settings, path, self._new_store_dir() if coefficient_store is not None else None)
+        try:
+            features, store = self._futures.pop(rawfile.resolve()).result()
+        except BrokenProcessPool:
+            # Another tile may have killed the pool; only a crash of this tile alone is its error.
+            features, store = self._extract_alone(settings, rawfile.resolve(), with_store=coefficient_store is not None)
+        if coefficient_store is not None and store is not None:
+            shutil.move(store, coefficient_store)
+        return MetaType(features)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes and remove the unused look-ahead results."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._listings.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._store_dir is not None:
+            shutil.rmtree(self._store_dir, ignore_errors=True)
+            self._store_dir = None
+
+    def _start(self, workers: int) -> ProcessPoolExecutor:
+        if self._executor is None or self._workers != workers:
+            self.shutdown()
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+            self._workers = workers
+        return self._executor
+
+    def _extract_alone(self, settings: WaveletSettings, path: Path, *, with_store: bool) -> tuple[dict[str, Any], Path | None]:
+        """Replace the broken pool and extract one tile in it, without look-ahead."""
+        self.shutdown()
+        executor = self._start(settings.tile_workers)
+        try:
+            return executor.submit(_extract, settings, path, self._new_store_dir() if with_store else None).result()
+        except BrokenProcessPool as e:
+            self.shutdown()
+            emsg = f"Worker process died while processing {path.name}: {e}"
+            raise StructuredError(emsg) from e
+
+    def _new_store_dir(self) -> Path:
+        if self._store_dir is None:
+            self._store_dir = Path(tempfile.mkdtemp(prefix="wavelet_tiles_"))
+        return Path(tempfile.mkdtemp(dir=self._store_dir))
+
+    def _upcoming(self, rawfile: Path, settings: WaveletSettings) -> list[Path]:
+        """Return the current file and the following TIFF files in the order of rdetoolkit."""
+        directory = rawfile.parent.resolve()
+        if directory not in self._listings:
+            self._listings[directory] = sorted(
+                (path.resolve() for path in directory.iterdir() if path.suffix.lower() in TIFF_SUFFIXES and not (settings.mask == "sidecar" and masking.is_mask_file(path))),
+                key=str,
+            )
+        listing = self._listings[directory]
+        current = rawfile.resolve()
+        following = listing[bisect.bisect_right(listing, str(current), key=str) :]
+        return [current, *following]
+
+
+TILE_DISPATCHER = TileDispatcher()
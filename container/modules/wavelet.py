@@ -1,16 +1,117 @@
 import argparse
-from collections.abc import Hashable
+from collections.abc import Callable, Hashable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from operator import itemgetter
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
 
 import numpy as np
 import pandas as pd
 import pyrtools as pt  # type: ignore[import-untyped]
-from PIL import Image
-from scipy import stats
+from pyrtools.pyramids.c.wrapper import corrDn  # type: ignore[import-untyped]
+from pyrtools.pyramids.filters import parse_filter  # type: ignore[import-untyped]
+from pyrtools.pyramids.pyr_utils import max_pyr_height  # type: ignore[import-untyped]
+from scipy import fft, stats
 
+from modules import dwt, masking
+from modules.coefficient_store import CoefficientStoreWriter
+from modules.feature_registry import FeatureRegistry
+from modules.image_ingest import ingest_image
+from modules.masking import get_mask
+from modules.moment_sampling import MOMENT_NAMES, SampledMoments, sample_pixel_moments
+from modules.prescreen import Screening, screen_image, uniform_image_feature
+from modules.shape_normalization import normalize_shape
 
-def wavelet_process(input_file_path: Path) -> dict[str, float]:
+PYRAMID_HEIGHT: int = 5
+PYRAMID_ORDER: int = 3
+CROP_SIZE: int = 2048
+QUICK_BIN_FACTOR: int = 4
+# Decompositions of compute_features: the steerable pyramid or a wavelet of dwt.WAVELETS.
+ENGINES: tuple[str, ...] = ("steerable", *dwt.WAVELETS)
+# Size of the largest filter (``lofilt``) of the order-3 steerable pyramid.
+PYRAMID_FILTER_SIZE: int = 17
+# Edge handling of SteerablePyramidSpace (pyrtools default).
+PYRAMID_EDGE_TYPE: str = "reflect1"
+# Columns of the feature vector, in output order.
+FEATURE_NAMES: tuple[str, ...] = (
+    "ms_mean",
+    "ms_std",
+    "ms_kurtosis",
+    "ms_skewness",
+    "ss_residual_highpass",
+    "ss_residual_lowpass",
+    "s_0",
+    "s_1",
+    "s_2",
+    "s_3",
+    "s_4",
+)
+# Metadata entries that tell incomparable feature vectors apart (engine, mode, extent),
+# and their values for the default settings, with which they are not output.
+VARIANT_KEYS: tuple[str, str, str] = ("feature_engine", "feature_mode", "feature_extent")
+STANDARD_VARIANT: tuple[str, str, str] = ("steerable", "full", "crop")
+# Number of bins of the "histogram" intermediate.
+HISTOGRAM_BINS: int = 256
+# Number of stack images decomposed per FFT batch by compute_stack_features.
+STACK_BATCH_SIZE: int = 4
+# Float64 copies of the crop alive at the peak of compute_features, plus two per band
+# thread (an upper bound of tracemalloc measurements on 1024 and 2048 px images).
+PYRAMID_WORKING_COPIES: int = 10
+
+# Output features and the intermediates they are computed from. "moments" (the ms_*
+# pixel moments) and "bands" (the ss_<key> band means) are computed by the pyramid pass
+# of compute_features; "pixels" and "histogram" are derived from "image" and "mask" on
+# first use. A new feature is added here with FEATURES.feature and requested with the
+# ``features`` argument.
+FEATURES = FeatureRegistry()
+for _name in MOMENT_NAMES:
+    FEATURES.add_feature(_name, ("moments",), itemgetter(_name))
+FEATURES.add_feature("ss_residual_highpass", ("bands",), itemgetter("ss_residual_highpass"))
+FEATURES.add_feature("ss_residual_lowpass", ("bands",), itemgetter("ss_residual_lowpass"))
+for _h in range(PYRAMID_HEIGHT):
+    FEATURES.add_feature(f"s_{_h}", ("bands",), itemgetter(f"ss_({_h}, 0)"))
+
+
+@FEATURES.intermediate("pixels", "image", "mask")
+def _valid_pixels(image: np.ndarray, mask: np.ndarray | None) -> np.ndarray:
+    return np.asarray(image).reshape(-1) if mask is None else np.asarray(image)[mask]
+
+
+@FEATURES.intermediate("histogram", "pixels")
+def _pixel_histogram(pixels: np.ndarray) -> np.ndarray:
+    return np.histogram(pixels, bins=HISTOGRAM_BINS)[0]
+
+
+@FEATURES.feature("ms_median", "pixels")
+def _pixel_median(pixels: np.ndarray) -> float:
+    return float(np.median(pixels))
+
+
+@FEATURES.feature("ms_entropy", "histogram")
+def _histogram_entropy(counts: np.ndarray) -> float:
+    # Shannon entropy in bits of the HISTOGRAM_BINS-bin histogram.
+    p = counts[counts > 0] / counts.sum()
+    return float(-np.sum(p * np.log2(p)))
+
+
+def wavelet_process(
+    input_file_path: Path,
+    *,
+    quick: bool = False,
+    bin_factor: int = QUICK_BIN_FACTOR,
+    threads: int = 1,
+    backend: str = "pil",
+    separate_channels: bool = False,
+    moment_sample_size: int | None = None,
+    mask: str = "none",
+    coefficient_store: Path | None = None,
+    prescreen: bool = True,
+    shape_mode: str = "none",
+    features: Sequence[str] = FEATURE_NAMES,
+    engine: str = "steerable",
+) -> dict[str, Any]:
     """Extract steerable pyramid features from an image and save them as CSV.
 
     This function loads an image from ``input_file_path``, crops it to a
@@ -20,9 +121,41 @@ def wavelet_process(input_file_path: Path) -> dict[str, float]:
     inside ``output_file_path``. The first (and only) record of the feature
     vector is also returned as a dictionary.
 
+    In quick mode the cropped image is block-averaged by ``bin_factor``
+    before the decomposition. The feature names are the same as in the full
+    computation, but the values are approximate, so ``feature_mode`` and
+    ``feature_bin_factor`` are added to the result to mark them as such.
+
+    Color, palette and bilevel images are converted to grayscale while
+    decoding, and the mode and bit depth of the original image are added to
+    the result as ``image_mode`` and ``image_bit_depth``. With
+    ``separate_channels`` every channel is decomposed instead (see
+    :func:`compute_channel_features`).
+
     Args:
         input_file_path (Path): Path to the image file to be processed.
-        output_file_path (Path): Directory where the CSV file will be saved.
+        quick (bool): If True, compute provisional features on a block-averaged image.
+        bin_factor (int): Requested block size for quick mode. It is reduced when the
+            binned image would be too small for the pyramid height.
+        threads (int): Number of threads used to decode the image and build the pyramid.
+        backend (str): Image decoding backend, ``"pil"``, ``"tifffile"`` or ``"auto"``.
+        separate_channels (bool): If True, compute per-channel features of multi-channel images.
+        moment_sample_size (int | None): Number of pixels sampled for approximate ``ms_*``
+            features. ``None`` computes them exactly. Not used with ``separate_channels``.
+        mask (str): Region-of-interest mask, ``"none"``, ``"sidecar"`` (``<stem>_mask.png``)
+            or ``"auto"`` (banner detection). Not used with ``separate_channels``.
+        coefficient_store (Path | None): If given, the pyramid coefficients are also written
+            to this file (see :mod:`modules.coefficient_store`). Not used with ``separate_channels``.
+        prescreen (bool): If True, blank, saturated and constant images are flagged and
+            constant images skip the pyramid (see :func:`compute_features`). Not used with
+            ``separate_channels``.
+        shape_mode (str): ``"none"``, ``"pad"`` or ``"crop"``: bring the image to an FFT-friendly
+            shape before the pyramid (see :mod:`modules.shape_normalization`). Not used with
+            ``separate_channels``.
+        features (Sequence[str]): Names of the registered features (see :data:`FEATURES`) to
+            compute, in output order. Not used with ``separate_channels``.
+        engine (str): Decomposition, ``"steerable"`` or a wavelet of :data:`dwt.WAVELETS`
+            (see :func:`compute_features`). Not used with ``separate_channels``.
 
     Returns:
         dict: A dictionary mapping feature names to their computed values
@@ -37,41 +170,365 @@ def wavelet_process(input_file_path: Path) -> dict[str, float]:
         (e.g., unexpected image shape).
 
     """
-    height: int = 5
-    order: int = 3
-    df = pd.DataFrame()
-    image = np.array(Image.open(input_file_path))
-    image_array = np.array(image)[:2048, :2048]
-    feature = get_steerable_pyramid_feature(image_array, height, order)
-    df = pd.DataFrame(list(feature.values()), index=list(feature.keys())).T
-    feature_labels = df.columns
-    for h in range(height):
-        df[f"s_{h}"] = df[[f"ss_({h}, 0)" for k in range(order)]].mean(axis=1)
-    df_mini = df[
-        [
-            "ms_mean",
-            "ms_std",
-            "ms_kurtosis",
-            "ms_skewness",
-            "ss_residual_highpass",
-            "ss_residual_lowpass",
-            "s_0",
-            "s_1",
-            "s_2",
-            "s_3",
-            "s_4",
-        ]
-    ]
-    feature_labels = df_mini.columns
-
-    output_df = df[feature_labels]
-    original_dict: dict[Hashable, Any] = output_df.to_dict(orient="records")[0]
-    # Convert to dictionary of str type
-    result: dict[str, Any] = {str(key): value for key, value in original_dict.items()}
+    ingested = ingest_image(input_file_path, backend=backend, threads=threads, crop=CROP_SIZE, keep_channels=separate_channels)
+    if separate_channels:
+        result = compute_channel_features(ingested.pixels, quick=quick, bin_factor=bin_factor, threads=threads)
+    else:
+        roi = get_mask(input_file_path, ingested.pixels, mask)
+        valid = None if roi is None else roi.valid
+        result = compute_features(ingested.pixels, quick=quick, bin_factor=bin_factor, threads=threads, moment_sample_size=moment_sample_size, mask=valid, coefficient_store=coefficient_store, prescreen=prescreen, shape_mode=shape_mode, features=features, engine=engine)
+        if roi is not None:
+            result |= roi.metadata()
+    return result | ingested.metadata()
+
+
+def load_image(source: Path | BinaryIO, *, backend: str = "pil", threads: int = 1, crop: int | None = None) -> np.ndarray:
+    """Decode an image file into a 2-D grayscale array.
+
+    See :func:`modules.image_ingest.ingest_image`, which also returns the
+    original mode and bit depth.
+
+    Args:
+        source (Path | BinaryIO): Path to the image file, or a binary stream with its content.
+        backend (str): ``"pil"``, ``"tifffile"`` or ``"auto"``.
+        threads (int): Number of decoding threads of the tifffile backend.
+        crop (int | None): Edge length of the top-left region to return. ``None`` returns
+            the whole image.
+
+    Returns:
+        np.ndarray: The grayscale pixel array.
+
+    """
+    return ingest_image(source, backend=backend, threads=threads, crop=crop).pixels
+
+
+def compute_features(
+    image: np.ndarray,
+    *,
+    quick: bool = False,
+    bin_factor: int = QUICK_BIN_FACTOR,
+    threads: int = 1,
+    moment_sample_size: int | None = None,
+    mask: np.ndarray | None = None,
+    coefficient_store: Path | None = None,
+    prescreen: bool = True,
+    shape_mode: str = "none",
+    features: Sequence[str] = FEATURE_NAMES,
+    engine: str = "steerable",
+) -> dict[str, Any]:
+    """Compute the steerable pyramid feature vector of a decoded image.
+
+    This is the part of :func:`wavelet_process` that follows decoding, so
+    callers that already hold the pixel array (e.g. the feature service)
+    produce exactly the same features.
+
+    With ``moment_sample_size`` the ``ms_*`` features are estimated from a
+    stratified pixel sample (see :mod:`modules.moment_sampling`) and their
+    95% confidence interval half-widths are added as ``ms_*_error`` together
+    with ``moment_sample_size``.
+
+    With ``prescreen`` the crop is first classified by :func:`prescreen.screen_image`
+    and the result gets ``image_quality`` and ``dominant_value_fraction``.
+    Constant images (including fully blank or saturated ones) are not
+    decomposed; they get the features of a uniform image at their value,
+    without the quick mode and sampling entries, and no coefficients are
+    stored. Near-blank and near-saturated images are flagged but computed as usual.
+
+    With ``shape_mode`` ``"pad"`` or ``"crop"`` the (binned) crop is brought to
+    an FFT-friendly shape by :func:`shape_normalization.normalize_shape` and the
+    shape of the decomposed image is added as ``pyramid_shape``. Padded pixels
+    are excluded from every reduction, and no side is cropped below the size
+    the pyramid needs.
+
+    Only the intermediates the requested ``features`` depend on are computed
+    (see :data:`FEATURES`): without a feature of the band means the pyramid is
+    not built (unless ``coefficient_store`` is given), and without a feature of
+    the pixel moments they are not computed.
+
+    With an ``engine`` other than ``"steerable"`` the band means are computed from
+    a decimated orthogonal wavelet transform by :func:`dwt.get_dwt_feature`, which
+    is an order of magnitude faster. The features keep their names but not their
+    values, and the result gets ``feature_engine``.
+
+    Args:
+        image (np.ndarray): Decoded 2-D image array.
+        quick (bool): If True, compute provisional features on a block-averaged image.
+        bin_factor (int): Requested block size for quick mode.
+        threads (int): Number of threads used to build the pyramid.
+        moment_sample_size (int | None): Number of pixels sampled for the ``ms_*`` features.
+            ``None`` computes them exactly from every pixel. Ignored when ``mask`` is given.
+        mask (np.ndarray | None): Boolean mask of the valid pixels of ``image``. The
+            features are reduced over the valid pixels only.
+        coefficient_store (Path | None): If given, every band is also written to this file
+            as float32 chunks, readable with :class:`~modules.coefficient_store.CoefficientStore`.
+        prescreen (bool): If True, screen the image for blank, saturated or constant content first
+            and skip the pyramid of constant images.
+        shape_mode (str): ``"none"``, ``"pad"`` or ``"crop"``.
+        features (Sequence[str]): Names of the registered features to compute, in output order.
+        engine (str): ``"steerable"`` or a wavelet of :data:`dwt.WAVELETS` (``"haar"``, ``"db2"``, ``"db4"``).
+
+    Returns:
+        dict: A dictionary mapping feature names to their computed values.
+
+    Raises:
+        ValueError: If a name in ``features`` is not a registered feature, or ``engine`` is unknown.
+
+    """
+    height: int = PYRAMID_HEIGHT
+    order: int = PYRAMID_ORDER
+    if engine not in ENGINES:
+        emsg = f"Unknown engine: {engine}. Available: {', '.join(ENGINES)}"
+        raise ValueError(emsg)
+    required = FEATURES.requirements(features)
+    image_array = image[:CROP_SIZE, :CROP_SIZE]
+    valid = None if mask is None else mask[:CROP_SIZE, :CROP_SIZE]
+    screening = screen_image(image_array, valid) if prescreen else None
+    if screening is not None and not screening.usable:
+        return _get_uniform_features(screening, image_array, valid, features=features, engine=engine, height=height, order=order)
+    image_array, valid, factor = _bin_crop(image_array, valid, quick=quick, bin_factor=bin_factor, height=height)
+    sampled = _sample_moments(image_array, valid, moment_sample_size, moments="moments" in required)
+    valid_shape = image_array.shape
+    image_array, valid = normalize_shape(image_array, valid, shape_mode, height, min_size=PYRAMID_FILTER_SIZE * 2 ** (height - 1))
+    attributes = {"engine": engine, "height": height, "order": order, "image_shape": list(image_array.shape), "valid_shape": list(valid_shape), "bin_factor": factor}
+    feature = _decompose(
+        image_array,
+        valid,
+        engine=engine,
+        threads=threads,
+        bands="bands" in required,
+        moments="moments" in required and sampled is None,
+        coefficient_store=coefficient_store,
+        attributes=attributes,
+    )
+    if sampled is not None:
+        feature = sampled.moments | feature
+    pyramid_shape = None if shape_mode == "none" else image_array.shape
+    metadata = _get_run_metadata(engine=engine, factor=factor if quick else None, sampled=sampled, pyramid_shape=pyramid_shape, screening=screening)
+    return summarize_features(feature, features, image=image_array, mask=valid) | metadata
+
+
+def compute_channel_features(channels: np.ndarray, *, quick: bool = False, bin_factor: int = QUICK_BIN_FACTOR, threads: int = 1) -> dict[str, Any]:
+    """Compute the feature vector of every channel of a multi-channel image.
+
+    All channels are decomposed together by
+    :func:`get_steerable_pyramid_features_batched`. The columns of channel
+    ``c`` are the feature names of :func:`compute_features` with the suffix
+    ``_ch<c>``, and ``feature_channels`` holds the number of channels.
+    The channels are not pre-screened: a constant channel is decomposed, and
+    its ``ms_kurtosis`` and ``ms_skewness`` are NaN, as with ``prescreen=False``
+    in :func:`compute_features`.
+
+    Args:
+        channels (np.ndarray): Decoded image with shape ``(channels, rows, cols)``.
+        quick (bool): If True, compute provisional features on block-averaged channels.
+        bin_factor (int): Requested block size for quick mode.
+        threads (int): Number of threads used by the FFTs.
+
+    Returns:
+        dict: A dictionary mapping per-channel feature names to their computed values.
+
+    """
+    height: int = PYRAMID_HEIGHT
+    order: int = PYRAMID_ORDER
+    stack = channels[:, :CROP_SIZE, :CROP_SIZE]
+    factor = 1
+    if quick:
+        factor = get_quick_bin_factor(stack.shape[1:], bin_factor, height)
+        stack = block_average(stack, factor)
+    result: dict[str, Any] = {}
+    for c, feature in enumerate(get_steerable_pyramid_features_batched(stack, height, order, threads=threads)):
+        result.update({f"{key}_ch{c}": value for key, value in summarize_features(feature, image=stack[c]).items()})
+    result["feature_channels"] = len(stack)
+    if quick:
+        result["feature_mode"] = "quick"
+        result["feature_bin_factor"] = factor
+    return result
+
+
+def compute_stack_features(
+    images: np.ndarray,
+    *,
+    quick: bool = False,
+    bin_factor: int = QUICK_BIN_FACTOR,
+    threads: int = 1,
+    batch_size: int = STACK_BATCH_SIZE,
+) -> np.ndarray:
+    """Compute the feature vectors of a stack of same-shape images.
+
+    This is the array counterpart of :func:`wavelet_process` for batch runs
+    where the images share the crop shape. Each group of ``batch_size``
+    images is decomposed by one set of batched FFT calls and the pixel
+    moments are reduced along the image axis, so the per-image overhead of
+    the pyramid construction and the DataFrame handling is paid once per
+    group. ``batch_size`` bounds the memory of the FFT buffers (about
+    100 MB per 2048 x 2048 image). The images are not pre-screened, so the
+    columns match :func:`compute_features` with ``prescreen=False``: a constant
+    image is decomposed and its ``ms_kurtosis`` and ``ms_skewness`` are NaN.
+
+    Args:
+        images (np.ndarray): Decoded grayscale images with shape ``(N, H, W)``.
+        quick (bool): If True, compute provisional features on block-averaged images.
+        bin_factor (int): Requested block size for quick mode.
+        threads (int): Number of threads used by the FFTs.
+        batch_size (int): Number of images decomposed together.
+
+    Returns:
+        np.ndarray: ``(N, len(FEATURE_NAMES))`` array whose columns follow :data:`FEATURE_NAMES`.
+
+    """
+    height: int = PYRAMID_HEIGHT
+    order: int = PYRAMID_ORDER
+    stack = images[:, :CROP_SIZE, :CROP_SIZE]
+    if quick:
+        stack = block_average(stack, get_quick_bin_factor(stack.shape[1:], bin_factor, height))
+    result = np.empty((len(stack), len(FEATURE_NAMES)))
+    for start in range(0, len(stack), max(batch_size, 1)):
+        batch = np.asarray(stack[start : start + batch_size], dtype=np.float64)
+        pixels = batch.reshape(len(batch), -1)
+        band_means = get_band_means_batched(batch, height, order, threads=threads)
+        result[start : start + len(batch)] = np.column_stack(
+            [
+                np.mean(pixels, axis=1),
+                np.std(pixels, axis=1, ddof=1),
+                stats.kurtosis(pixels, axis=1),
+                stats.skew(pixels, axis=1),
+                band_means["residual_highpass"],
+                band_means["residual_lowpass"],
+                *(band_means[(h, 0)] for h in range(height)),
+            ],
+        )
     return result
 
 
-def get_steerable_pyramid_feature(image: Any, height: int, order: int) -> dict:
+def summarize_features(feature: dict, names: Sequence[str] = FEATURE_NAMES, *, image: np.ndarray | None = None, mask: np.ndarray | None = None) -> dict[str, Any]:
+    """Evaluate the output features from the raw pyramid statistics.
+
+    Args:
+        feature (dict): Output of :func:`get_steerable_pyramid_feature` (``ms_*`` moments
+            and ``ss_<key>`` band means; either part may be missing if no requested
+            feature needs it).
+        names (Sequence[str]): Registered features to evaluate, in output order.
+        image (np.ndarray | None): The decomposed image, for features derived from the pixels.
+        mask (np.ndarray | None): Boolean mask of the valid pixels of ``image``.
+
+    Returns:
+        dict: The value of every requested feature.
+
+    """
+    inputs = {
+        "moments": {key: value for key, value in feature.items() if key.startswith("ms_")},
+        "bands": {key: value for key, value in feature.items() if key.startswith("ss_")},
+        "image": image,
+        "mask": mask,
+    }
+    # Convert numpy scalars to Python scalars
+    return {key: value.item() if isinstance(value, np.generic) else value for key, value in FEATURES.evaluate(names, inputs).items()}
+
+
+def feature_variant(result: dict) -> tuple[str, str, str]:
+    """Return the ``(engine, mode, extent)`` a feature result was computed with.
+
+    The band features of different engines, of quick and full mode and of the
+    crop and the whole image (``out_of_core``) are not comparable. Missing or
+    empty entries (e.g. NaN cells of a CSV column) take the standard value.
+
+    Args:
+        result (dict): Output of :func:`wavelet_process` or a row read back from it.
+
+    Returns:
+        tuple[str, str, str]: Values of :data:`VARIANT_KEYS`, :data:`STANDARD_VARIANT` by default.
+
+    """
+    engine, mode, extent = (value if isinstance(value := result.get(key), str) and value else default for key, default in zip(VARIANT_KEYS, STANDARD_VARIANT, strict=True))
+    return engine, mode, extent
+
+
+def get_quick_bin_factor(shape: tuple[int, ...], bin_factor: int, height: int) -> int:
+    """Return the largest usable block size not exceeding ``bin_factor``.
+
+    The binned image must stay large enough for a pyramid of ``height`` levels,
+    so small images fall back to a smaller block size (down to 1, no binning).
+
+    Args:
+        shape (tuple[int, ...]): Shape of the cropped image.
+        bin_factor (int): Requested block size.
+        height (int): Height of the pyramid that will be built on the binned image.
+
+    Returns:
+        int: The block size to use.
+
+    """
+    min_size = PYRAMID_FILTER_SIZE * 2 ** (height - 1)
+    factor = max(bin_factor, 1)
+    while factor > 1 and min(shape[:2]) // factor < min_size:
+        factor -= 1
+    return factor
+
+
+def estimate_working_memory(
+    shape: tuple[int, int],
+    *,
+    threads: int = 1,
+    channels: int = 1,
+    quick: bool = False,
+    bin_factor: int = QUICK_BIN_FACTOR,
+) -> int:
+    """Estimate the peak memory of :func:`compute_features` from the image shape alone.
+
+    The estimate covers the pyramid of the cropped (and, in quick mode,
+    block-averaged) image, not the decoded pixels. It is meant for planning
+    before the image is decoded, e.g. from :func:`tiff_header.read_tiff_header`.
+
+    Args:
+        shape (tuple[int, int]): Rows and columns of the uncropped image.
+        threads (int): Number of band threads.
+        channels (int): Number of channels decomposed (per-channel features).
+        quick (bool): If True, estimate for the block-averaged image of quick mode.
+        bin_factor (int): Requested block size of quick mode.
+
+    Returns:
+        int: Estimated peak memory in bytes.
+
+    """
+    rows, cols = min(shape[0], CROP_SIZE), min(shape[1], CROP_SIZE)
+    if quick:
+        factor = get_quick_bin_factor((rows, cols), bin_factor, PYRAMID_HEIGHT)
+        rows, cols = rows // factor, cols // factor
+    return rows * cols * np.dtype(np.float64).itemsize * (PYRAMID_WORKING_COPIES + 2 * threads) * channels
+
+
+def block_average(image: np.ndarray, factor: int) -> np.ndarray:
+    """Downsample an image by averaging non-overlapping ``factor`` x ``factor`` blocks.
+
+    Rows and columns that do not fill a whole block are discarded. Leading
+    axes (e.g. channels) are kept.
+
+    Args:
+        image (np.ndarray): Image array with rows and columns on the last two axes.
+        factor (int): Block size.
+
+    Returns:
+        np.ndarray: The block-averaged image as a float array.
+
+    """
+    if factor <= 1:
+        return image
+    rows = image.shape[-2] // factor
+    cols = image.shape[-1] // factor
+    trimmed = image[..., : rows * factor, : cols * factor].astype(np.float64)
+    return trimmed.reshape(*image.shape[:-2], rows, factor, cols, factor).mean(axis=(-3, -1))
+
+
+def get_steerable_pyramid_feature(
+    image: Any,
+    height: int,
+    order: int,
+    *,
+    threads: int = 1,
+    moments: bool = True,
+    mask: np.ndarray | None = None,
+    on_band: Callable[[Hashable, np.ndarray], None] | None = None,
+) -> dict:
     """Extract statistical features from a steerable pyramid decomposition.
 
     The function builds a :class:`~pyrtools.pyramids.SteerablePyramidSpace`
@@ -79,10 +536,25 @@ def get_steerable_pyramid_feature(image: Any, height: int, order: int) -> dict:
     of global statistics on the original image and the mean absolute
     coefficients for each sub?band of the pyramid.
 
+    With ``threads`` greater than 1 the same convolutions are issued to a
+    thread pool instead: the orientation bands of a scale, the next lowpass
+    image and the pixel moments are computed concurrently (the pyrtools C
+    convolution releases the GIL). Each value is still computed by a single
+    thread with the same operations, so the result is identical to the
+    sequential path.
+
     Args:
         image (Any): 2?D array?like image data (e.g., ``numpy.ndarray``).
         height (int): Height of the pyramid (number of decomposition scales).
         order (int): Order of the pyramid (number of orientation bands).
+        threads (int): Number of worker threads. 1 builds the pyramid sequentially.
+        moments (bool): If False, the ``ms_*`` pixel moments are not computed.
+        mask (np.ndarray | None): Boolean mask of the valid pixels. The moments and band
+            means are then reduced over the valid pixels (and the corresponding
+            coefficients of the decimated levels) only, see :mod:`modules.masking`.
+        on_band (Callable[[Hashable, np.ndarray], None] | None): Called with the key and the
+            coefficients of every band before they are discarded (from the worker threads
+            when ``threads`` is greater than 1).
 
     Returns:
         dict: Mapping from feature names to their numeric values. The dictionary
@@ -100,24 +572,338 @@ def get_steerable_pyramid_feature(image: Any, height: int, order: int) -> dict:
         ``height``/``order`` arguments are invalid for the pyramid constructor.
 
     """
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            pixel_moments = executor.submit(_get_pixel_moments, image, mask) if moments else None
+            band_means = _get_band_means_threaded(image, height, order, executor, mask=mask, on_band=on_band)
+            feature_dict = pixel_moments.result() if pixel_moments is not None else {}
+        for key, value in band_means.items():
+            feature_dict["ss_" + str(key)] = value
+        return feature_dict
+
     pyr = pt.pyramids.SteerablePyramidSpace(image, height=height, order=order)
-    array = image.reshape(-1)
-    feature_dict = {
+    feature_dict = _get_pixel_moments(image, mask) if moments else {}
+    masks = None if mask is None else masking.level_masks(mask, height)
+    for key in pyr.pyr_coeffs:
+        name = "ss_" + str(key)
+        if on_band is not None:
+            on_band(key, pyr.pyr_coeffs[key])
+        if masks is None:
+            feature_dict[name] = np.mean(abs(pyr.pyr_coeffs[key]))
+        else:
+            feature_dict[name] = masking.masked_mean_abs(pyr.pyr_coeffs[key], masks[_get_band_level(key, height)])
+
+    return feature_dict
+
+
+def _get_raw_feature(
+    image: np.ndarray,
+    mask: np.ndarray | None,
+    *,
+    engine: str,
+    height: int,
+    order: int,
+    threads: int,
+    bands: bool,
+    moments: bool,
+    on_band: Callable[[Hashable, np.ndarray], None] | None,
+) -> dict:
+    # The ms_* moments and ss_<key> band means that are needed, from the engine's decomposition
+    # if band means are needed or the bands are stored, otherwise from the pixels alone.
+    if bands and engine != "steerable":
+        feature = _get_pixel_moments(image, mask) if moments else {}
+        return feature | dwt.get_dwt_feature(image, height, wavelet=engine, mask=mask, on_band=on_band)
+    if bands:
+        return get_steerable_pyramid_feature(image, height, order, threads=threads, moments=moments, mask=mask, on_band=on_band)
+    return _get_pixel_moments(image, mask) if moments else {}
+
+
+def _get_uniform_features(
+    screening: Screening,
+    image: np.ndarray,
+    mask: np.ndarray | None,
+    *,
+    features: Sequence[str],
+    engine: str,
+    height: int,
+    order: int,
+) -> dict[str, Any]:
+    # Features of a constant image, without decomposing it.
+    uniform = uniform_image_feature(screening.value, height, order) if engine == "steerable" else dwt.uniform_dwt_feature(screening.value, height)
+    return summarize_features(uniform, features, image=image, mask=mask) | _get_run_metadata(engine=engine, screening=screening)
+
+
+def _bin_crop(image: np.ndarray, mask: np.ndarray | None, *, quick: bool, bin_factor: int, height: int) -> tuple[np.ndarray, np.ndarray | None, int]:
+    # The crop and its mask block-averaged in quick mode, and the block size used.
+    if not quick:
+        return image, mask, 1
+    factor = get_quick_bin_factor(image.shape, bin_factor, height)
+    return block_average(image, factor), None if mask is None else masking.downsample_mask(mask, factor), factor
+
+
+def _sample_moments(image: np.ndarray, mask: np.ndarray | None, sample_size: int | None, *, moments: bool) -> SampledMoments | None:
+    # Sampled ms_* moments, if requested, needed and the image is not masked.
+    if sample_size is None or mask is not None or not moments:
+        return None
+    return sample_pixel_moments(image, sample_size)
+
+
+def _decompose(
+    image: np.ndarray,
+    mask: np.ndarray | None,
+    *,
+    engine: str,
+    threads: int,
+    bands: bool,
+    moments: bool,
+    coefficient_store: Path | None,
+    attributes: dict[str, Any],
+) -> dict:
+    # The raw features, with every band also written to the coefficient store if one is given.
+    with ExitStack() as stack:
+        on_band = None
+        if coefficient_store is not None:
+            on_band = stack.enter_context(CoefficientStoreWriter(coefficient_store, attributes=attributes)).add_band
+        return _get_raw_feature(
+            image,
+            mask,
+            engine=engine,
+            height=attributes["height"],
+            order=attributes["order"],
+            threads=threads,
+            bands=bands or on_band is not None,
+            moments=moments,
+            on_band=on_band,
+        )
+
+
+def _get_run_metadata(
+    *,
+    engine: str,
+    factor: int | None = None,
+    sampled: SampledMoments | None = None,
+    pyramid_shape: tuple[int, ...] | None = None,
+    screening: Screening | None = None,
+) -> dict[str, Any]:
+    # Entries that describe how the features were computed, omitted for the defaults.
+    metadata: dict[str, Any] = {} if engine == "steerable" else {"feature_engine": engine}
+    if factor is not None:
+        metadata |= {"feature_mode": "quick", "feature_bin_factor": factor}
+    if sampled is not None:
+        metadata |= sampled.metadata()
+    if pyramid_shape is not None:
+        metadata["pyramid_shape"] = f"{pyramid_shape[0]} x {pyramid_shape[1]}"
+    if screening is not None:
+        metadata |= screening.metadata()
+    return metadata
+
+
+def _get_pixel_moments(image: np.ndarray, mask: np.ndarray | None) -> dict:
+    return get_pixel_moments(image.reshape(-1)) if mask is None else masking.masked_pixel_moments(image, mask)
+
+
+def _get_band_level(key: Hashable, height: int) -> int:
+    # Decimation level of a pyr_coeffs key.
+    if key == "residual_highpass":
+        return 0
+    if key == "residual_lowpass":
+        return height
+    return key[0]  # type: ignore[index]
+
+
+def get_pixel_moments(array: np.ndarray) -> dict:
+    """Return the mean, sample standard deviation, kurtosis and skewness of pixel values.
+
+    Args:
+        array (np.ndarray): Flattened pixel values.
+
+    Returns:
+        dict: ``ms_mean``, ``ms_std``, ``ms_kurtosis`` and ``ms_skewness``.
+
+    """
+    return {
         "ms_mean": np.mean(array),
         "ms_std": np.std(array, ddof=1),
         "ms_kurtosis": stats.kurtosis(array),
         "ms_skewness": stats.skew(array),
     }
-    for key in pyr.pyr_coeffs:
-        name = "ss_" + str(key)
-        feature_dict[name] = np.mean(abs(pyr.pyr_coeffs[key]))
 
-    return feature_dict
+
+def get_steerable_pyramid_features_batched(images: np.ndarray, height: int, order: int, *, threads: int = 1) -> list[dict]:
+    """Extract the features of :func:`get_steerable_pyramid_feature` for a stack of images.
+
+    The channels are decomposed together along the leading axis. Each
+    pyramid level is computed with one batched FFT of the padded lowpass
+    image, which is reused for all orientation filters and the next lowpass
+    filter, so the filter spectra and the image transform are shared instead
+    of being set up once per channel and per band. Edges are reflected like
+    the ``reflect1`` mode of pyrtools. The results agree with the per-channel
+    computation to floating-point rounding.
+
+    Args:
+        images (np.ndarray): Images with shape ``(channels, rows, cols)``.
+        height (int): Height of the pyramid.
+        order (int): Order of the pyramid.
+        threads (int): Number of threads used by the FFTs.
+
+    Returns:
+        list[dict]: Features of each channel, keyed like :func:`get_steerable_pyramid_feature`.
+
+    Raises:
+        ValueError: If ``height`` exceeds the maximum height for the image size.
+
+    """
+    stack = np.asarray(images, dtype=np.float64)
+    band_means = get_band_means_batched(stack, height, order, threads=threads)
+
+    feature_dicts = []
+    for c, channel in enumerate(stack):
+        feature_dict = get_pixel_moments(channel.reshape(-1))
+        for key, means in band_means.items():
+            feature_dict["ss_" + str(key)] = means[c]
+        feature_dicts.append(feature_dict)
+    return feature_dicts
+
+
+def get_band_means_batched(stack: np.ndarray, height: int, order: int, *, threads: int = 1) -> dict[Hashable, np.ndarray]:
+    """Return the mean absolute coefficient of every band for each image of a stack.
+
+    See :func:`get_steerable_pyramid_features_batched` for the computation.
+
+    Args:
+        stack (np.ndarray): Float images with shape ``(images, rows, cols)``.
+        height (int): Height of the pyramid.
+        order (int): Order of the pyramid.
+        threads (int): Number of threads used by the FFTs.
+
+    Returns:
+        dict[Hashable, np.ndarray]: Per-image band means keyed like ``pyr_coeffs``.
+
+    Raises:
+        ValueError: If ``height`` exceeds the maximum height for the image size.
+
+    """
+    filters = parse_filter(f"sp{order}_filters", normalize=False)
+    max_height = max_pyr_height(stack.shape[1:], filters["lofilt"].shape)
+    if height > max_height:
+        err_msg = f"Cannot build pyramid higher than {max_height} levels."
+        raise ValueError(err_msg)
+    band_filters = _get_band_filters(filters, order)
+
+    band_means: dict[Hashable, np.ndarray] = {}
+    highpass, lo = _correlate_batch(stack, [filters["hi0filt"], filters["lo0filt"]], threads)
+    band_means["residual_highpass"] = np.mean(abs(highpass), axis=(1, 2))
+    del highpass
+    lo = np.ascontiguousarray(lo)
+    for i in range(height):
+        for b, band in enumerate(_correlate_batch(lo, [*band_filters, filters["lofilt"]], threads)):
+            if b <= order:
+                band_means[(i, b)] = np.mean(abs(band), axis=(1, 2))
+            else:
+                lo = np.ascontiguousarray(band[:, ::2, ::2])
+    band_means["residual_lowpass"] = np.mean(abs(lo), axis=(1, 2))
+    return band_means
+
+
+def _correlate_batch(stack: np.ndarray, filters: list[np.ndarray], threads: int) -> Iterator[np.ndarray]:
+    """Correlate a stack of images with each filter using one shared FFT of the stack.
+
+    The stack is padded by reflection (``reflect1``) for the largest filter,
+    transformed once, and each filter result is produced lazily.
+    """
+    radius = max(filt.shape[0] for filt in filters) // 2
+    rows, cols = stack.shape[1:]
+    padded = np.pad(stack, ((0, 0), (radius, radius), (radius, radius)), mode="reflect")
+    shape = (fft.next_fast_len(padded.shape[1], real=True), fft.next_fast_len(padded.shape[2], real=True))
+    spectrum = fft.rfft2(padded, s=shape, axes=(1, 2), workers=threads)
+    del padded
+    for filt in filters:
+        kernel = fft.rfft2(filt[::-1, ::-1], s=shape)
+        full = fft.irfft2(spectrum * kernel, s=shape, axes=(1, 2), workers=threads)
+        top = filt.shape[0] - 1 + radius - filt.shape[0] // 2
+        left = filt.shape[1] - 1 + radius - filt.shape[1] // 2
+        yield full[:, top : top + rows, left : left + cols]
+
+
+def _get_band_filters(filters: dict, order: int) -> list[np.ndarray]:
+    bfiltsz = int(np.floor(np.sqrt(filters["bfilts"].shape[0])))
+    return [filters["bfilts"][:, b].reshape(bfiltsz, bfiltsz).T for b in range(order + 1)]
+
+
+def _get_band_means_threaded(
+    image: Any,
+    height: int,
+    order: int,
+    executor: ThreadPoolExecutor,
+    *,
+    mask: np.ndarray | None = None,
+    on_band: Callable[[Hashable, np.ndarray], None] | None = None,
+) -> dict[Hashable, Any]:
+    """Build a steerable pyramid on a thread pool and return the mean absolute coefficient of each band.
+
+    This mirrors :class:`~pyrtools.pyramids.SteerablePyramidSpace` (same filters,
+    edge handling and key order) but reduces each band as soon as it is computed,
+    so the band arrays are not kept for the whole decomposition.
+
+    Args:
+        image (Any): 2-D image data.
+        height (int): Height of the pyramid.
+        order (int): Order of the pyramid.
+        executor (ThreadPoolExecutor): Pool that computes the bands.
+        mask (np.ndarray | None): Boolean mask of the valid pixels.
+        on_band (Callable[[Hashable, np.ndarray], None] | None): Called with every band.
+
+    Returns:
+        dict[Hashable, Any]: Mean absolute coefficient keyed like ``pyr_coeffs``.
+
+    Raises:
+        ValueError: If ``height`` exceeds the maximum height for the image size.
+
+    """
+    image = np.asarray(image).astype(float)
+    filters = parse_filter(f"sp{order}_filters", normalize=False)
+    max_height = max_pyr_height(image.shape, filters["lofilt"].shape)
+    if height > max_height:
+        err_msg = f"Cannot build pyramid higher than {max_height} levels."
+        raise ValueError(err_msg)
+    band_filters = _get_band_filters(filters, order)
+
+    masks: list[Any] = [None] * (height + 1) if mask is None else masking.level_masks(mask, height)
+    def report(key: Hashable) -> Callable[[np.ndarray], None] | None:
+        return None if on_band is None else partial(on_band, key)
+
+    futures: dict[Hashable, Future] = {"residual_highpass": executor.submit(_get_band_mean, image, filters["hi0filt"], masks[0], report("residual_highpass"))}
+    lo = corrDn(image=image, filt=filters["lo0filt"], edge_type=PYRAMID_EDGE_TYPE)
+    for i in range(height):
+        for b, filt in enumerate(band_filters):
+            futures[(i, b)] = executor.submit(_get_band_mean, lo, filt, masks[i], report((i, b)))
+        lo = corrDn(image=lo, filt=filters["lofilt"], edge_type=PYRAMID_EDGE_TYPE, step=(2, 2))
+    band_means = {key: future.result() for key, future in futures.items()}
+    if on_band is not None:
+        on_band("residual_lowpass", lo)
+    band_means["residual_lowpass"] = np.mean(abs(lo)) if mask is None else masking.masked_mean_abs(lo, masks[height])
+    return band_means
+
+
+def _get_band_mean(image: np.ndarray, filt: np.ndarray, mask: np.ndarray | None = None, on_band: Callable[[np.ndarray], None] | None = None) -> Any:
+    band = corrDn(image=image, filt=filt, edge_type=PYRAMID_EDGE_TYPE)
+    if on_band is not None:
+        on_band(band)
+    return np.mean(abs(band)) if mask is None else masking.masked_mean_abs(band, mask)
 
 
-def main(input_file_path: Path, output_file_path: Path) -> None:
+def main(
+    input_file_path: Path,
+    output_file_path: Path,
+    *,
+    quick: bool = False,
+    threads: int = 1,
+    separate_channels: bool = False,
+    moment_sample_size: int | None = None,
+    engine: str = "steerable",
+) -> None:
     """Execute unit tests."""
-    dict_result = wavelet_process(Path(input_file_path))
+    dict_result = wavelet_process(Path(input_file_path), quick=quick, threads=threads, separate_channels=separate_channels, moment_sample_size=moment_sample_size, engine=engine)
     output_df = pd.DataFrame(dict_result, index=[0])
     output_df = output_df.rename(index={0: input_file_path.name})
     output_df.to_csv(output_file_path.joinpath("steerable_pyramid_feature.csv"))
@@ -127,12 +913,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("input_file_path")
     parser.add_argument("output_file_path")
+    parser.add_argument("--quick", action="store_true", help="compute provisional features on a block-averaged image")
+    parser.add_argument("--threads", type=int, default=1, help="number of threads used to build the pyramid")
+    parser.add_argument("--separate-channels", action="store_true", help="compute the features of every channel of a color image")
+    parser.add_argument("--moment-sample-size", type=int, default=None, help="estimate the ms_* features from this many sampled pixels")
+    parser.add_argument("--engine", choices=ENGINES, default="steerable", help="decomposition used for the band features")
     options = parser.parse_args()
     input_file_path = options.input_file_path
     output_file_path = options.output_file_path
 
     # wavelet_process(Path(input_file_path), Path(output_file_path))
-    main(Path(input_file_path), Path(output_file_path))
+    main(Path(input_file_path), Path(output_file_path), quick=options.quick, threads=options.threads, separate_channels=options.separate_channels, moment_sample_size=options.moment_sample_size, engine=options.engine)
     """
     fig, ax = plt.subplots()
     plt.title("name1")
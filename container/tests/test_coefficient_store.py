@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import numpy as np
+import pyrtools as pt
+import pytest
+
+from modules import wavelet
+from modules.coefficient_store import CoefficientStore, CoefficientStoreWriter
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).random((600, 520)) * 255
+
+
+class TestCoefficientStore:
+    """ピラミッド係数の保存・読み込みのテスト"""
+
+    def test_round_trip(self, tmp_path, image):
+        path = tmp_path / "pyramid.zip"
+        features = wavelet.compute_features(image, coefficient_store=path)
+        assert features == wavelet.compute_features(image)
+        pyramid = pt.pyramids.SteerablePyramidSpace(image, height=5, order=3)
+        with CoefficientStore(path) as store:
+            assert store.keys() == list(pyramid.pyr_coeffs.keys())
+            assert store.attributes["image_shape"] == [600, 520]
+            for key, coeff in pyramid.pyr_coeffs.items():
+                np.testing.assert_allclose(store[key].read(), coeff, rtol=1e-6, atol=1e-3)
+
+    def test_threaded(self, tmp_path, image):
+        sequential, threaded = tmp_path / "sequential.zip", tmp_path / "threaded.zip"
+        wavelet.compute_features(image, coefficient_store=sequential)
+        wavelet.compute_features(image, coefficient_store=threaded, threads=3)
+        with CoefficientStore(sequential) as expected, CoefficientStore(threaded) as store:
+            assert sorted(map(str, store.keys())) == sorted(map(str, expected.keys()))
+            for key in expected:
+                np.testing.assert_array_equal(store[key].read(), expected[key].read())
+
+    def test_discarded_on_error(self, tmp_path, image):
+        path = tmp_path / "pyramid.zip"
+        with pytest.raises(RuntimeError), CoefficientStoreWriter(path) as writer:
+            writer.add_band((0, 0), image)
+            raise RuntimeError("pyramid failed")
+        assert not path.exists()
+
+    def test_region(self, tmp_path):
+        band = np.arange(300 * 200, dtype=np.float32).reshape(300, 200)
+        path = Path(tmp_path / "band.zip")
+        with CoefficientStoreWriter(path, chunk=64) as writer:
+            writer.add_band((1, 2), band)
+        with CoefficientStore(path) as store:
+            lazy = store[(1, 2)]
+            assert lazy.shape == (300, 200)
+            np.testing.assert_array_equal(lazy[70:130, 10:199], band[70:130, 10:199])
+            np.testing.assert_array_equal(lazy[::7, 190:], band[::7, 190:])
+            np.testing.assert_array_equal(lazy[250:], band[250:])
+            np.testing.assert_array_equal(np.asarray(lazy), band)
+            assert (1, 2) in store
+            with pytest.raises(KeyError):
+                store[(0, 0)]
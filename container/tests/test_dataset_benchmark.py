@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.dataset_benchmark import check_budgets
+
+CONTAINER_DIR = os.path.dirname(os.path.dirname(__file__))
+
+
+class TestDatasetBenchmark:
+    """dataset関数のエンドツーエンドベンチマーク(smallプロファイル)"""
+
+    @pytest.mark.benchmark
+    def test_small_profile_within_budgets(self, tmp_path):
+        output = tmp_path / "result.json"
+        cmd = [sys.executable, "-m", "benchmarks.dataset_benchmark", "--profile", "small", "--work-dir", str(tmp_path), "--output", str(output)]
+        rtn = subprocess.run(cmd, cwd=CONTAINER_DIR, encoding="utf-8", capture_output=True, check=False)
+        report = json.loads(output.read_text(encoding="utf-8"))
+        assert report["result"]["tiles"] == len(report["result"]["tile_seconds"])
+        assert rtn.returncode == 0, report["violations"]
+        assert os.path.exists(tmp_path / "data" / "divided" / "0002" / "structured" / "tile0002.csv")
+
+    def test_check_budgets(self):
+        summary = {"tile_seconds_p95": 2.0, "tiles_per_second": 0.5}
+        assert check_budgets(summary, {"tile_seconds_p95": 3.0, "tiles_per_second_min": 0.1}) == []
+        violations = check_budgets(summary, {"tile_seconds_p95": 1.0, "tiles_per_second_min": 1.0})
+        assert len(violations) == 2
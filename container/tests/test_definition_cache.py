@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+from rdetoolkit.rde2util import Meta
+
+from modules.definition_cache import DefinitionCache
+
+TASKSUPPORT = Path(__file__).parents[2].joinpath("templates", "template", "tasksupport")
+
+
+@pytest.fixture
+def tasksupport(tmp_path) -> Path:
+    shutil.copy(TASKSUPPORT / "metadata-def.json", tmp_path / "metadata-def.json")
+    return tmp_path
+
+
+class TestDefinitionCache:
+    """定義ファイルキャッシュのテスト"""
+
+    def test_definition_is_parsed_once(self, tasksupport, mocker):
+        cache = DefinitionCache()
+        spy = mocker.patch("modules.definition_cache.Meta", wraps=Meta)
+        cache.meta(tasksupport / "metadata-def.json")
+        cache.meta(tasksupport / "metadata-def.json")
+        assert spy.call_count == 1
+
+    def test_touched_file_is_not_reparsed(self, tasksupport, mocker):
+        cache = DefinitionCache()
+        path = tasksupport / "metadata-def.json"
+        spy = mocker.patch("modules.definition_cache.Meta", wraps=Meta)
+        cache.meta(path)
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        cache.meta(path)
+        assert spy.call_count == 1
+
+    def test_modified_file_is_reparsed(self, tasksupport):
+        cache = DefinitionCache()
+        path = tasksupport / "metadata-def.json"
+        assert "extra_key" not in cache.meta(path).metaDef
+        metadef = json.loads(path.read_text(encoding="utf-8"))
+        metadef["extra_key"] = {"name": {"ja": "追加", "en": "Extra"}, "schema": {"type": "string"}}
+        path.write_text(json.dumps(metadef), encoding="utf-8")
+        assert "extra_key" in cache.meta(path).metaDef
+
+    def test_meta_objects_are_independent(self, tasksupport):
+        cache = DefinitionCache()
+        first = cache.meta(tasksupport / "metadata-def.json")
+        first.assign_vals({"ms_mean": 1.0})
+        second = cache.meta(tasksupport / "metadata-def.json")
+        assert first.metaConst
+        assert not second.metaConst
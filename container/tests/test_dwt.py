@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.models.config import Config
+
+from modules import dwt, wavelet
+from modules.settings import load_wavelet_settings
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).random((320, 384)) * 255
+
+
+class TestDwt:
+    """離散ウェーブレット変換のテスト"""
+
+    @pytest.mark.parametrize("name", list(dwt.WAVELETS))
+    def test_orthonormal(self, name, image):
+        lowpass, highpass = dwt.get_filters(name)
+        assert lowpass.sum() == pytest.approx(np.sqrt(2))
+        assert highpass.sum() == pytest.approx(0, abs=1e-12)
+        approximation, details = dwt.dwt2(image, name)
+        energy = np.sum(approximation**2) + sum(np.sum(band**2) for band in details)
+        assert energy == pytest.approx(np.sum(image**2), rel=1e-9)
+        assert approximation.shape == (160, 192)
+
+    def test_odd_shape(self):
+        approximation, details = dwt.dwt2(np.ones((5, 7)), "db4")
+        assert approximation.shape == (3, 4)
+        assert all(band.shape == (3, 4) for band in details)
+        np.testing.assert_allclose(approximation, 2.0)
+        np.testing.assert_allclose(details, 0.0, atol=1e-12)
+
+    def test_unknown_wavelet(self, image):
+        with pytest.raises(ValueError, match="Unknown wavelet"):
+            dwt.get_dwt_feature(image, 3, wavelet="db3")
+
+
+class TestDwtEngine:
+    """waveletエンジンによる特徴量計算のテスト"""
+
+    @pytest.mark.parametrize("engine", ["haar", "db2", "db4"])
+    def test_feature_names(self, engine, image):
+        steerable = wavelet.compute_features(image)
+        result = wavelet.compute_features(image, engine=engine)
+        assert list(result) == [*wavelet.FEATURE_NAMES, "feature_engine", "image_quality", "dominant_value_fraction"]
+        assert result["feature_engine"] == engine
+        for name in ("ms_mean", "ms_std", "ms_kurtosis", "ms_skewness"):
+            assert result[name] == pytest.approx(steerable[name])
+        assert all(result[f"s_{h}"] > 0 for h in range(wavelet.PYRAMID_HEIGHT))
+
+    def test_coarser_scales_of_smooth_image(self):
+        x = np.arange(512)
+        image = np.add.outer(np.zeros(512), np.sin(2 * np.pi * x / 64)) * 100
+        result = wavelet.compute_features(image, engine="db4", prescreen=False)
+        # A period of 64 pixels lies in the band of the fourth decomposition (s_2).
+        assert result["s_2"] > 10 * max(result["s_0"], result["ss_residual_highpass"])
+
+    def test_mask(self, image):
+        mask = np.ones(image.shape, dtype=bool)
+        mask[:64] = False
+        changed = image.copy()
+        changed[:64] = 1e6
+        first = wavelet.compute_features(image, engine="haar", mask=mask)
+        second = wavelet.compute_features(changed, engine="haar", mask=mask)
+        for name in wavelet.FEATURE_NAMES:
+            assert second[name] == pytest.approx(first[name])
+
+    def test_uniform_image(self):
+        result = wavelet.compute_features(np.full((256, 256), 7.0), engine="db2")
+        assert result["image_quality"] == "constant"
+        computed = wavelet.compute_features(np.full((256, 256), 7.0), engine="db2", prescreen=False)
+        for name in ("ms_mean", "ss_residual_highpass", "ss_residual_lowpass", "s_0", "s_1", "s_2", "s_3", "s_4"):
+            assert result[name] == pytest.approx(computed[name], abs=1e-9)
+
+    def test_unknown_engine(self, image):
+        with pytest.raises(ValueError, match="Unknown engine"):
+            wavelet.compute_features(image, engine="fft")
+
+    def test_settings(self):
+        assert load_wavelet_settings(Config()).engine == "steerable"
+        assert load_wavelet_settings(Config(wavelet={"engine": "haar"})).engine == "haar"
+        with pytest.raises(StructuredError):
+            load_wavelet_settings(Config(wavelet={"engine": "db3"}))
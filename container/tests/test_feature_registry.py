@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from PIL import Image
+from rdetoolkit.exceptions import StructuredError
+
+from modules import wavelet
+from modules.feature_registry import FeatureRegistry
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).random((300, 300)) * 255
+
+
+class TestFeatureRegistry:
+    """特徴量レジストリのテスト"""
+
+    def test_intermediate_computed_once(self):
+        registry = FeatureRegistry()
+        calls = []
+
+        @registry.intermediate("pixels", "image")
+        def _pixels(image):
+            calls.append(1)
+            return image.reshape(-1)
+
+        registry.add_feature("max", ("pixels",), np.max)
+        registry.add_feature("min", ("pixels",), np.min)
+        registry.add_feature("size", ("image",), np.size)
+        assert registry.evaluate(["min", "max"], {"image": np.arange(6).reshape(2, 3)}) == {"min": 0, "max": 5}
+        assert len(calls) == 1
+        assert registry.evaluate(["size"], {"image": np.zeros((2, 3))}) == {"size": 6}
+        assert len(calls) == 1
+        assert registry.requirements(["max"]) == {"pixels", "image"}
+
+    def test_unknown(self):
+        registry = FeatureRegistry()
+        registry.add_feature("max", ("pixels",), np.max)
+        with pytest.raises(ValueError, match="Unknown features: mean"):
+            registry.evaluate(["mean"], {})
+        with pytest.raises(KeyError, match="pixels"):
+            registry.evaluate(["max"], {})
+
+    def test_standard_features(self, image):
+        assert wavelet.FEATURES.names[: len(wavelet.FEATURE_NAMES)] == wavelet.FEATURE_NAMES
+        assert list(wavelet.compute_features(image, prescreen=False)) == list(wavelet.FEATURE_NAMES)
+
+    def test_pixel_features_skip_pyramid(self, image, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError
+
+        monkeypatch.setattr(wavelet, "get_steerable_pyramid_feature", fail)
+        result = wavelet.compute_features(image, prescreen=False, features=["ms_entropy", "ms_mean", "ms_median"])
+        assert list(result) == ["ms_entropy", "ms_mean", "ms_median"]
+        assert result["ms_mean"] == pytest.approx(image.mean())
+        assert result["ms_median"] == pytest.approx(np.median(image))
+        assert result["ms_entropy"] == pytest.approx(8, abs=0.01)
+
+    def test_masked_pixels(self, image):
+        mask = np.zeros(image.shape, dtype=bool)
+        mask[:100] = True
+        result = wavelet.compute_features(image, mask=mask, prescreen=False, features=["ms_median", "s_0"])
+        assert result["ms_median"] == pytest.approx(np.median(image[:100]))
+
+    def test_unknown_feature_setting(self, tmp_path, image):
+        path = tmp_path / "image.tif"
+        Image.fromarray(image.astype(np.uint8)).save(path)
+        with pytest.raises(StructuredError, match="Unknown features: ms_max"):
+            FileReader(WaveletSettings(features=["ms_mean", "ms_max"])).validate((path,))
@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules import feature_service, wavelet
+
+
+@pytest.fixture(scope="module")
+def service_url():
+    """ワーカー1つのサービスをlocalhostの空きポートで起動する"""
+    service = feature_service.FeatureService(workers=1, max_batch_size=4, max_batch_wait=0.05)
+    service.start()
+    server = feature_service.create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    service.stop()
+
+
+@pytest.fixture
+def texture_tif(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "texture.tif"
+    Image.fromarray((rng.random((300, 300)) * 255).astype(np.uint8)).save(path)
+    return path
+
+
+class TestFeatureService:
+    """特徴量抽出サービスのテスト"""
+
+    def test_path_request(self, service_url, texture_tif):
+        features = feature_service.request_features(texture_tif, url=service_url)
+        assert features == pytest.approx(wavelet.wavelet_process(texture_tif))
+
+    def test_buffer_request(self, service_url, texture_tif):
+        features = feature_service.request_features(texture_tif.read_bytes(), url=service_url, quick=True)
+        assert features["feature_mode"] == "quick"
+
+    def test_concurrent_requests_are_batched(self, service_url, texture_tif):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(feature_service.request_features(texture_tif, url=service_url))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 4
+
+        stats = feature_service.request_stats(url=service_url)
+        assert stats["queue_depth"] == 0
+        assert stats["batches"] < stats["completed"]
+        assert stats["latency_ms"]["p50"] <= stats["latency_ms"]["p99"]
+
+    def test_invalid_image(self, service_url):
+        with pytest.raises(Exception, match="422"):
+            feature_service.request_features(b"not an image", url=service_url)
+
+
+class TestServiceFailures:
+    """ワーカープールの障害とタイムアウトのテスト"""
+
+    def test_broken_pool_is_replaced(self, texture_tif):
+        service = feature_service.FeatureService(workers=1, max_batch_wait=0.0)
+        service.start()
+        try:
+            executor = service._executor
+
+            def broken(*args, **kwargs):
+                raise BrokenProcessPool("A child process terminated abruptly")
+
+            executor.submit = broken
+            with pytest.raises(feature_service.ServiceUnavailableError, match="BrokenProcessPool"):
+                service.submit(str(texture_tif)).result(timeout=10)
+            # 次のリクエストは新しいプールで処理される
+            assert "s_0" in service.submit(str(texture_tif)).result(timeout=60)
+            assert service._executor is not executor
+            assert service.stats()["pool_restarts"] == 1
+        finally:
+            service.stop()
+
+    def test_http_status(self, monkeypatch):
+        service = feature_service.FeatureService(request_timeout=0.1)
+        server = feature_service.create_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            monkeypatch.setattr(service, "submit", lambda source, quick: Future())
+            with pytest.raises(Exception, match="504"):
+                feature_service.request_features(b"image", url=url)
+            failed = Future()
+            failed.set_exception(feature_service.ServiceUnavailableError("pool failed"))
+            monkeypatch.setattr(service, "submit", lambda source, quick: failed)
+            with pytest.raises(Exception, match="503"):
+                feature_service.request_features(b"image", url=url)
+        finally:
+            server.shutdown()
+            server.server_close()
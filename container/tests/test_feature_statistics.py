@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+from modules import feature_statistics, wavelet
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, len(wavelet.FEATURE_NAMES))) * np.arange(1, len(wavelet.FEATURE_NAMES) + 1) + 100
+
+
+class TestRunningStatistics:
+    """特徴量の逐次統計量のテスト"""
+
+    def test_update(self):
+        vectors = _vectors(50)
+        statistics = feature_statistics.RunningStatistics()
+        for vector in vectors:
+            statistics.update(vector)
+        assert statistics.count == 50
+        assert statistics.mean == pytest.approx(vectors.mean(axis=0))
+        assert statistics.covariance() == pytest.approx(np.cov(vectors, rowvar=False))
+        assert statistics.std(ddof=0) == pytest.approx(vectors.std(axis=0))
+
+    def test_merge(self):
+        vectors = _vectors(100)
+        shards = [feature_statistics.RunningStatistics() for _ in range(3)]
+        for i, vector in enumerate(vectors):
+            shards[min(i // 40, 2)].update(vector)
+        merged = feature_statistics.RunningStatistics()
+        for shard in shards:
+            merged.merge(shard)
+        assert merged.count == 100
+        assert merged.mean == pytest.approx(vectors.mean(axis=0))
+        assert merged.covariance() == pytest.approx(np.cov(vectors, rowvar=False))
+
+    def test_skips_incomplete(self):
+        statistics = feature_statistics.RunningStatistics()
+        assert not statistics.update({"s_0_ch0": 1.0})
+        assert not statistics.update(np.full(len(wavelet.FEATURE_NAMES), np.nan))
+        assert statistics.count == 0
+        assert np.all(np.isnan(statistics.covariance()))
+
+    def test_record_and_merge_files(self, tmp_path):
+        vectors = _vectors(10)
+        registry = feature_statistics.CampaignStatistics()
+        for i, vector in enumerate(vectors):
+            features = dict(zip(wavelet.FEATURE_NAMES, vector, strict=True)) | {"image_quality": "ok"}
+            registry.record(tmp_path / f"shard{i % 2}" / feature_statistics.STATISTICS_NAME, features)
+        registry.record(tmp_path / "shard0" / feature_statistics.STATISTICS_NAME, dict.fromkeys(wavelet.FEATURE_NAMES, 0.0) | {"image_quality": "blank"})
+        feature_statistics.main(tmp_path / "merged.json", [tmp_path / f"shard{i}" / feature_statistics.STATISTICS_NAME for i in range(2)])
+        merged = feature_statistics.RunningStatistics.load(tmp_path / "merged.json")
+        assert merged.count == 10
+        assert merged.covariance() == pytest.approx(np.cov(vectors, rowvar=False))
+
+    def test_record_once_per_file(self, tmp_path):
+        vectors = _vectors(3)
+        registry = feature_statistics.CampaignStatistics()
+        path = tmp_path / feature_statistics.STATISTICS_NAME
+        for name, vector in zip(["a.tif", "b.tif", "a.tif"], vectors, strict=True):
+            registry.record(path, dict(zip(wavelet.FEATURE_NAMES, vector, strict=True)), name)
+        # 同じ実行の中で再処理したタイルは二重に数えない
+        assert feature_statistics.RunningStatistics.load(path).count == 2
+        # 保存する状態の大きさは画像の枚数に依存しない
+        assert sorted(json.loads(path.read_text())) == ["comoment", "count", "mean", "names"]
+
+    def test_merge_shards_with_common_names(self, tmp_path):
+        vectors = _vectors(4)
+        registry = feature_statistics.CampaignStatistics()
+        for i, vector in enumerate(vectors):
+            registry.record(tmp_path / f"shard{i % 2}" / feature_statistics.STATISTICS_NAME, dict(zip(wavelet.FEATURE_NAMES, vector, strict=True)), f"shard{i % 2}/image_{i // 2:04d}.tif")
+        # 並列実行の結果は、同じファイル名を含んでいてもまとめられる
+        feature_statistics.main(tmp_path / "merged.json", [tmp_path / f"shard{i}" / feature_statistics.STATISTICS_NAME for i in range(2)])
+        merged = feature_statistics.RunningStatistics.load(tmp_path / "merged.json")
+        assert merged.count == 4
+        assert merged.mean == pytest.approx(vectors.mean(axis=0))
+
+    def test_record_by_variant(self, tmp_path):
+        vectors = _vectors(4)
+        registry = feature_statistics.CampaignStatistics()
+        path = tmp_path / feature_statistics.STATISTICS_NAME
+        extra = [{}, {"feature_mode": "quick", "feature_bin_factor": 4}, {"feature_engine": "haar"}, {"feature_extent": "image"}]
+        for i, (vector, entries) in enumerate(zip(vectors, extra, strict=True)):
+            registry.record(path, dict(zip(wavelet.FEATURE_NAMES, vector, strict=True)) | entries, f"{i}.tif")
+        # エンジン・モード・計算範囲ごとに別のファイルに集計する
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "feature_statistics.json",
+            "feature_statistics_haar_full_crop.json",
+            "feature_statistics_steerable_full_image.json",
+            "feature_statistics_steerable_quick_crop.json",
+        ]
+        quick = feature_statistics.RunningStatistics.load(tmp_path / "feature_statistics_steerable_quick_crop.json")
+        assert quick.count == 1
+        assert quick.mean == pytest.approx(vectors[1])
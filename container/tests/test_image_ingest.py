@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from modules import image_ingest, wavelet
+
+
+@pytest.fixture(scope="module")
+def rgb():
+    return (np.random.default_rng(0).random((300, 280, 3)) * 255).astype(np.uint8)
+
+
+class TestIngestImage:
+    """入力画像のグレースケール正規化とモード取得のテスト"""
+
+    @pytest.mark.parametrize("backend", ["pil", "tifffile"])
+    def test_grayscale_keeps_dtype(self, tmp_path, backend):
+        pixels = (np.random.default_rng(1).random((300, 280)) * 65535).astype(np.uint16)
+        Image.fromarray(pixels).save(tmp_path / "gray.tif")
+        ingested = image_ingest.ingest_image(tmp_path / "gray.tif", backend=backend, crop=256)
+        assert (ingested.mode, ingested.bit_depth) == ("I;16", 16)
+        assert ingested.pixels.dtype == np.uint16
+        assert (ingested.pixels == pixels[:256, :256]).all()
+
+    @pytest.mark.parametrize("backend", ["pil", "tifffile"])
+    def test_rgb(self, tmp_path, rgb, backend):
+        Image.fromarray(rgb).save(tmp_path / "rgb.tif")
+        ingested = image_ingest.ingest_image(tmp_path / "rgb.tif", backend=backend)
+        assert (ingested.mode, ingested.bit_depth) == ("RGB", 8)
+        assert np.allclose(ingested.pixels, rgb @ np.array(image_ingest.LUMA_WEIGHTS))
+
+    def test_planar_separate_rgb(self, tmp_path, rgb):
+        tifffile.imwrite(tmp_path / "planar.tif", np.moveaxis(rgb, -1, 0), photometric="rgb", planarconfig="separate")
+        ingested = image_ingest.ingest_image(tmp_path / "planar.tif", backend="tifffile", crop=200)
+        assert np.allclose(ingested.pixels, rgb[:200, :200] @ np.array(image_ingest.LUMA_WEIGHTS))
+
+    @pytest.mark.parametrize("backend", ["pil", "tifffile"])
+    def test_palette(self, tmp_path, rgb, backend):
+        palette_image = Image.fromarray(rgb).convert("P")
+        palette_image.save(tmp_path / "palette.tif")
+        expected = np.asarray(palette_image.convert("RGB")) @ np.array(image_ingest.LUMA_WEIGHTS)
+        ingested = image_ingest.ingest_image(tmp_path / "palette.tif", backend=backend)
+        assert ingested.mode == "P"
+        assert np.allclose(ingested.pixels, expected)
+
+    @pytest.mark.parametrize("backend", ["pil", "tifffile"])
+    def test_bilevel(self, tmp_path, backend):
+        pixels = np.random.default_rng(2).random((100, 90)) > 0.5
+        Image.fromarray(pixels).save(tmp_path / "bilevel.tif")
+        ingested = image_ingest.ingest_image(tmp_path / "bilevel.tif", backend=backend)
+        assert (ingested.mode, ingested.bit_depth) == ("1", 1)
+        assert ingested.pixels.dtype == np.uint8
+        assert (ingested.pixels == pixels).all()
+
+    @pytest.mark.parametrize(
+        ("pixels", "kwargs", "expected"),
+        [
+            # 4ビットの画素は0〜15の範囲で反転される
+            (np.arange(16, dtype=np.uint8).reshape(4, 4), {"bitspersample": 4}, 15 - np.arange(16, dtype=np.uint8).reshape(4, 4)),
+            (np.linspace(0, 0.5, 16, dtype=np.float32).reshape(4, 4), {}, 0.5 - np.linspace(0, 0.5, 16, dtype=np.float32).reshape(4, 4)),
+        ],
+    )
+    def test_miniswhite(self, tmp_path, pixels, kwargs, expected):
+        tifffile.imwrite(tmp_path / "inverted.tif", pixels, photometric="miniswhite", **kwargs)
+        ingested = image_ingest.ingest_image(tmp_path / "inverted.tif", backend="tifffile")
+        assert np.allclose(ingested.pixels, expected)
+        assert np.allclose(image_ingest.map_image(tmp_path / "inverted.tif", tmp_path).pixels, expected)
+
+    def test_mode_in_features(self, tmp_path, rgb):
+        Image.fromarray(rgb).save(tmp_path / "rgb.tif")
+        result = wavelet.wavelet_process(tmp_path / "rgb.tif")
+        assert result["image_mode"] == "RGB"
+        assert result["image_bit_depth"] == 8
@@ -0,0 +1,160 @@
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.models.config import SystemSettings
+
+from modules import datasets_process, input_staging, tile_dispatcher
+from modules.input_staging import InputStager, LocalStorage
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+from modules.tile_dispatcher import TileDispatcher
+
+
+@pytest.fixture
+def job_dir(tmp_path):
+    directory = tmp_path / "job"
+    for name in ("inputdata", "invoice", "tasksupport"):
+        directory.joinpath(name).mkdir(parents=True)
+    directory.joinpath("invoice", "invoice.json").write_text("{}")
+    directory.joinpath("tasksupport", "rdeconfig.yaml").write_text("system: {}\n")
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        Image.fromarray((rng.random((300, 300)) * 255).astype(np.uint8)).save(directory / "inputdata" / f"img{i}.tif")
+    return directory
+
+
+class GatedStorage(LocalStorage):
+    """img2.tifの転送をgateが開くまで止めるストレージ"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.gate = threading.Event()
+
+    def download(self, key, destination):
+        if key.endswith("img2.tif"):
+            self.gate.wait(10)
+        super().download(key, destination)
+
+
+class TestLocalStorage:
+    """ローカルディレクトリのストレージのテスト"""
+
+    def test_list_and_download(self, job_dir, tmp_path):
+        storage = LocalStorage(job_dir)
+        assert storage.list_keys() == ["inputdata/img0.tif", "inputdata/img1.tif", "inputdata/img2.tif", "invoice/invoice.json", "tasksupport/rdeconfig.yaml"]
+        storage.download("inputdata/img1.tif", tmp_path / "copy.tif")
+        assert (tmp_path / "copy.tif").read_bytes() == (job_dir / "inputdata" / "img1.tif").read_bytes()
+
+    def test_bandwidth(self, job_dir, tmp_path):
+        size = (job_dir / "inputdata" / "img0.tif").stat().st_size
+        start = time.perf_counter()
+        LocalStorage(job_dir, bandwidth=size / 0.2).download("inputdata/img0.tif", tmp_path / "copy.tif")
+        assert time.perf_counter() - start >= 0.2
+
+    def test_open_storage(self, job_dir, monkeypatch):
+        assert input_staging.open_storage(f"file://{job_dir}").root == job_dir
+        with pytest.raises(ValueError, match="not a directory"):
+            input_staging.open_storage(str(job_dir / "missing"))
+        monkeypatch.delenv("AZURE_STORAGE_CONNECTION_STRING", raising=False)
+        with pytest.raises(ValueError, match="AZURE_STORAGE_CONNECTION_STRING"):
+            input_staging.open_storage("az://container/job")
+
+
+class TestInputStager:
+    """入力ファイルのストリーミング配置のテスト"""
+
+    def test_overlaps_download(self, job_dir, tmp_path):
+        data = tmp_path / "data"
+        storage = GatedStorage(job_dir)
+        with InputStager() as stager:
+            stager.start(storage, data, workers=1)
+            # 入力ファイル以外は先に配置され、入力ファイルは名前だけ先に作られる
+            assert (data / "invoice" / "invoice.json").read_text() == "{}"
+            assert sorted(p.name for p in (data / "inputdata").iterdir()) == ["img0.tif", "img1.tif", "img2.tif"]
+            assert (data / "inputdata" / "img2.tif").stat().st_size == 0
+            assert stager.wait((data / "inputdata" / "img0.tif",))
+            assert (data / "inputdata" / "img0.tif").read_bytes() == (job_dir / "inputdata" / "img0.tif").read_bytes()
+            # 最初のファイルを処理できる時点で、後続のファイルはまだ転送中
+            assert not stager.is_ready(data / "inputdata" / "img2.tif")
+            storage.gate.set()
+            stager.wait((data / "inputdata" / "img2.tif",))
+            assert stager.is_ready(data / "inputdata" / "img2.tif")
+            assert not stager.wait((data / "invoice" / "invoice.json",))
+        assert sorted(p.name for p in data.iterdir()) == ["inputdata", "invoice", "tasksupport"]
+
+    def test_failed_download(self, job_dir, tmp_path, monkeypatch):
+        storage = LocalStorage(job_dir)
+        download = storage.download
+
+        def fail(key, destination):
+            if key.endswith("img1.tif"):
+                raise OSError("connection reset")
+            download(key, destination)
+
+        monkeypatch.setattr(storage, "download", fail)
+        with InputStager() as stager:
+            stager.start(storage, tmp_path / "data")
+            assert stager.wait((tmp_path / "data" / "inputdata" / "img0.tif",))
+            with pytest.raises(StructuredError, match="Failed to stage input file img1.tif: connection reset"):
+                stager.wait((tmp_path / "data" / "inputdata" / "img1.tif",))
+            assert not stager.is_ready(tmp_path / "data" / "inputdata" / "img1.tif")
+
+    def test_failure_writes_job_failed(self, job_dir, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        job_dir.joinpath("inputdata", "archive.zip").write_bytes(b"PK")
+        download = LocalStorage.download
+
+        def fail(storage, key, destination):
+            if key.endswith(".zip"):
+                raise OSError("connection reset")
+            download(storage, key, destination)
+
+        monkeypatch.setattr(LocalStorage, "download", fail)
+        # ワークフロー開始前の配置の失敗もjob.failedに記録して終了する
+        with pytest.raises(SystemExit), datasets_process.structuring_run(tmp_path / "data", stage_from=str(job_dir)):
+            pytest.fail("the run must not start")
+        assert "Failed to stage inputdata/archive.zip: connection reset" in (tmp_path / "data" / "job.failed").read_text()
+        assert not list((tmp_path / "data").glob(".staging_*"))
+        # dataディレクトリがまだ無くても記録される
+        shutil.rmtree(tmp_path / "data")
+        with pytest.raises(SystemExit), datasets_process.structuring_run(tmp_path / "data", stage_from=str(tmp_path / "missing")):
+            pytest.fail("the run must not start")
+        assert "Invalid staging source" in (tmp_path / "data" / "job.failed").read_text()
+
+    def test_without_source(self, tmp_path):
+        stager = InputStager().open(None, tmp_path / "data")
+        assert not stager.wait((tmp_path / "img0.tif",))
+        assert stager.is_ready(tmp_path / "img0.tif")
+
+    def test_refresh_raw_copies(self, tmp_path):
+        rawfile = tmp_path / "img0.tif"
+        rawfile.write_bytes(b"pixels")
+        nonshared_raw = tmp_path / "nonshared_raw"
+        nonshared_raw.mkdir()
+        (nonshared_raw / "img0.tif").touch()
+        resource_paths = SimpleNamespace(rawfiles=(rawfile,), raw=tmp_path / "raw", nonshared_raw=nonshared_raw)
+        input_staging.refresh_raw_copies(SystemSettings(save_raw=False, save_nonshared_raw=True), resource_paths)
+        assert (nonshared_raw / "img0.tif").read_bytes() == b"pixels"
+        assert not (tmp_path / "raw").exists()
+
+    def test_dispatcher_waits_for_staged_files(self, job_dir, tmp_path, monkeypatch):
+        data = tmp_path / "data"
+        storage = GatedStorage(job_dir)
+        stager = InputStager()
+        monkeypatch.setattr(tile_dispatcher, "INPUT_STAGER", stager)
+        reader = FileReader(WaveletSettings(tile_workers=2))
+        with stager, TileDispatcher() as dispatcher:
+            stager.start(storage, data, workers=1)
+            stager.wait((data / "inputdata" / "img0.tif", data / "inputdata" / "img1.tif"))
+            dispatcher.read(reader, data / "inputdata" / "img0.tif")
+            # 転送中のファイルは先読みされない
+            assert list(dispatcher._futures) == [(data / "inputdata" / "img1.tif").resolve()]
+            storage.gate.set()
+            stager.wait((data / "inputdata" / "img2.tif",))
+            assert "s_0" in dispatcher.read(reader, data / "inputdata" / "img2.tif")
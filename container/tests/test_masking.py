@@ -0,0 +1,72 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules import masking, wavelet
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+
+
+@pytest.fixture
+def banner_image():
+    image = np.random.default_rng(0).random((600, 500)) * 200 + 20
+    image[540:] = 0
+    image[560:570, 10:200] = 255
+    valid = np.ones(image.shape, dtype=bool)
+    valid[540:] = False
+    return image, valid
+
+
+class TestMaskedReductions:
+    """マスク付きの集計のテスト"""
+
+    def test_pixel_moments(self, banner_image):
+        image, valid = banner_image
+        expected = wavelet.get_pixel_moments(image[:540].reshape(-1))
+        assert masking.masked_pixel_moments(image, valid, tile=128) == pytest.approx(expected)
+
+    def test_mean_abs(self, banner_image):
+        image, valid = banner_image
+        assert masking.masked_mean_abs(image - 100, valid, tile=128) == pytest.approx(np.abs(image[:540] - 100).mean())
+
+    def test_full_mask_is_unmasked(self, banner_image):
+        image, _ = banner_image
+        masked = wavelet.get_steerable_pyramid_feature(image, 5, 3, mask=np.ones(image.shape, dtype=bool))
+        assert masked == pytest.approx(wavelet.get_steerable_pyramid_feature(image, 5, 3))
+
+    def test_threaded_identical(self, banner_image):
+        image, valid = banner_image
+        sequential = wavelet.get_steerable_pyramid_feature(image, 5, 3, mask=valid)
+        assert wavelet.get_steerable_pyramid_feature(image, 5, 3, mask=valid, threads=3) == sequential
+
+    def test_level_masks(self):
+        masks = masking.level_masks(np.ones((600, 500), dtype=bool), 5)
+        assert [m.shape for m in masks] == [(600, 500), (300, 250), (150, 125), (75, 63), (38, 32), (19, 16)]
+
+
+class TestGetMask:
+    """マスクの取得(サイドカーファイル・バナー自動検出)のテスト"""
+
+    def test_detect_banner(self, banner_image):
+        image, valid = banner_image
+        assert (masking.detect_banner(image) == valid).all()
+        assert masking.detect_banner(image[:540]) is None
+
+    def test_sidecar(self, tmp_path, banner_image):
+        image, valid = banner_image
+        Image.fromarray(image.astype(np.uint8)).save(tmp_path / "image.tif")
+        Image.fromarray(valid.astype(np.uint8) * 255).save(tmp_path / "image_mask.png")
+        result = wavelet.wavelet_process(tmp_path / "image.tif", mask="sidecar")
+        assert result["mask_source"] == "sidecar"
+        assert result["masked_fraction"] == pytest.approx(0.1)
+        assert result["ms_mean"] == pytest.approx(image[:540].astype(np.uint8).mean())
+
+    def test_validate_ignores_sidecar(self, tmp_path):
+        Image.fromarray(np.zeros((64, 64), dtype=np.uint8)).save(tmp_path / "image.tif")
+        reader = FileReader(WaveletSettings(mask="sidecar"))
+        rawfiles = (tmp_path / "image.tif", tmp_path / "image_mask.png")
+        assert reader.validate(rawfiles) == tmp_path / "image.tif"
+        assert reader.is_mask_tile((Path("image_mask.png"),))
+        assert not reader.is_mask_tile(rawfiles)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from modules import wavelet
+from modules.moment_sampling import MOMENT_NAMES, sample_pixel_moments
+
+
+@pytest.fixture(scope="module")
+def image():
+    return np.random.default_rng(0).gamma(2.0, 20.0, (1024, 1024))
+
+
+class TestSamplePixelMoments:
+    """層化サンプリングによる輝度統計量の近似計算のテスト"""
+
+    def test_within_error(self, image):
+        exact = wavelet.get_pixel_moments(image.reshape(-1))
+        sampled = sample_pixel_moments(image, 65536)
+        assert sampled.sample_size >= 65536
+        for name in MOMENT_NAMES:
+            assert sampled.errors[name] > 0
+            assert abs(sampled.moments[name] - exact[name]) <= 2 * sampled.errors[name]
+
+    def test_reproducible(self, image):
+        assert sample_pixel_moments(image, 10000).moments == sample_pixel_moments(image, 10000).moments
+
+    def test_small_image_is_exact(self):
+        image = np.random.default_rng(1).random((50, 40))
+        sampled = sample_pixel_moments(image, 10000)
+        assert sampled.moments == pytest.approx(wavelet.get_pixel_moments(image.reshape(-1)))
+        assert sampled.errors == dict.fromkeys(MOMENT_NAMES, 0.0)
+
+    def test_compute_features(self, image):
+        result = wavelet.compute_features(image[:400, :400], moment_sample_size=20000)
+        assert result["moment_sample_size"] >= 20000
+        assert set(wavelet.FEATURE_NAMES) <= set(result)
+        assert all(f"{name}_error" in result for name in MOMENT_NAMES)
@@ -0,0 +1,125 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import tifffile
+from rdetoolkit.exceptions import StructuredError
+
+from modules import out_of_core, wavelet
+from modules.image_ingest import ingest_image, map_image
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+
+
+@pytest.fixture(scope="module")
+def pixels():
+    return (np.random.default_rng(0).random((700, 563)) * 65535).astype(np.uint16)
+
+
+class TestTiledPyramid:
+    """タイル分割によるピラミッド計算のテスト"""
+
+    @pytest.mark.parametrize(("shape", "tile"), [((700, 563), 96), ((512, 512), 128), ((301, 427), 64)])
+    def test_matches_full_image(self, tmp_path, pixels, shape, tile):
+        image = pixels[: shape[0], : shape[1]]
+        expected = wavelet.get_steerable_pyramid_feature(image, wavelet.PYRAMID_HEIGHT, wavelet.PYRAMID_ORDER)
+        result = out_of_core.get_tiled_pyramid_feature(image, wavelet.PYRAMID_HEIGHT, wavelet.PYRAMID_ORDER, scratch=tmp_path, tile=tile)
+        assert list(result) == list(expected)
+        for key, value in expected.items():
+            assert result[key] == pytest.approx(value, rel=1e-12, abs=1e-12)
+        # 一時ファイルは削除される
+        assert not list(tmp_path.iterdir())
+
+    def test_threads(self, tmp_path, pixels):
+        single = out_of_core.get_tiled_pyramid_feature(pixels, 5, 3, scratch=tmp_path, tile=128)
+        assert out_of_core.get_tiled_pyramid_feature(pixels, 5, 3, scratch=tmp_path, tile=128, threads=3) == single
+
+    def test_tiles(self):
+        assert out_of_core.tiles((60, 250), 64) == [(0, 60, 0, 64), (0, 60, 64, 128), (0, 60, 128, 192), (0, 60, 192, 250)]
+        assert out_of_core.tiles((130, 40), 64) == [(0, 64, 0, 40), (64, 130, 0, 40)]
+
+    def test_invalid_tile(self, tmp_path, pixels):
+        with pytest.raises(ValueError, match="Tile size"):
+            out_of_core.get_tiled_pyramid_feature(pixels, 5, 3, scratch=tmp_path, tile=33)
+
+
+class TestProcessImage:
+    """メモリマップによる画像全体の特徴量計算のテスト"""
+
+    @pytest.mark.parametrize("options", [{}, {"tile": (128, 128), "compression": "zlib"}, {"rowsperstrip": 64, "compression": "lzw"}])
+    def test_matches_wavelet_process(self, tmp_path, pixels, options):
+        path = tmp_path / "image.tif"
+        tifffile.imwrite(path, pixels, **options)
+        result = out_of_core.process_image(path, tile=128)
+        expected = wavelet.wavelet_process(path)
+        assert result.pop("pyramid_shape") == "700 x 563"
+        assert result.pop("feature_extent") == "image"
+        assert result == pytest.approx(expected, rel=1e-12)
+
+    def test_near_saturated_computed(self, tmp_path):
+        image = np.full((300, 280), 255, dtype=np.uint8)
+        image[10:13, 20:40] = 7
+        path = tmp_path / "saturated.tif"
+        tifffile.imwrite(path, image)
+        result = out_of_core.process_image(path, tile=128)
+        assert result["image_quality"] == "saturated"
+        assert result == pytest.approx(out_of_core.process_image(path, tile=128, prescreen=False) | {"image_quality": "saturated", "dominant_value_fraction": result["dominant_value_fraction"]}, rel=1e-12)
+        assert result["ms_kurtosis"] != 0.0
+
+    def test_map_rgb(self, tmp_path):
+        rgb = (np.random.default_rng(1).random((300, 260, 3)) * 255).astype(np.uint8)
+        path = tmp_path / "rgb.tif"
+        tifffile.imwrite(path, rgb, tile=(64, 64), compression="zlib")
+        mapped = map_image(path, tmp_path)
+        assert isinstance(mapped.pixels, np.memmap)
+        np.testing.assert_array_equal(mapped.pixels, ingest_image(path).pixels)
+        assert mapped.metadata() == {"image_mode": "RGB", "image_bit_depth": 8}
+
+    def test_bounded_memory(self, tmp_path):
+        path = tmp_path / "large.tif"
+        tifffile.imwrite(path, (np.random.default_rng(2).random((2048, 2048)) * 255).astype(np.uint8), tile=(256, 256), compression="zlib")
+        tracemalloc.start()
+        out_of_core.process_image(path, tile=256)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # 画像全体のfloat64配列(32 MB)よりはるかに小さい
+        assert peak < 2 * out_of_core.estimate_working_memory(tile=256)
+
+    def test_unsupported_features(self):
+        with pytest.raises(ValueError, match="ms_median"):
+            out_of_core.check_features(["ms_mean", "ms_median"])
+
+
+class TestFileReader:
+    """out_of_core設定のテスト"""
+
+    def test_read(self, tmp_path, pixels):
+        path = tmp_path / "image.tif"
+        tifffile.imwrite(path, pixels, tile=(128, 128), compression="zlib")
+        reader = FileReader(WaveletSettings(out_of_core=True, tiff_backend="pil"))
+        meta = reader.read(reader.validate((path,)))
+        assert meta["pyramid_shape"] == "700 x 563"
+        assert meta["s_0"] == pytest.approx(FileReader().read(path)["s_0"], rel=1e-12)
+
+    def test_unsupported_features(self, tmp_path, pixels):
+        path = tmp_path / "image.tif"
+        tifffile.imwrite(path, pixels)
+        with pytest.raises(StructuredError, match="Features not available out of core: ms_median"):
+            FileReader(WaveletSettings(out_of_core=True, features=["ms_mean", "ms_median"])).validate((path,))
+
+    @pytest.mark.parametrize(
+        ("settings", "message"),
+        [
+            ({"mode": "quick"}, "mode: quick"),
+            ({"engine": "haar", "mask": "auto"}, "mask: auto, engine: haar"),
+            ({"channels": "separate"}, "channels: separate"),
+            ({"moments": "sampled", "moment_sample_size": 4096}, "moments: sampled"),
+            ({"shape_normalization": "pad"}, "shape_normalization: pad"),
+            ({"save_coefficients": True}, "save_coefficients: True"),
+        ],
+    )
+    def test_unsupported_settings(self, tmp_path, pixels, settings, message):
+        path = tmp_path / "image.tif"
+        tifffile.imwrite(path, pixels)
+        with pytest.raises(StructuredError, match=f"Settings not available with out_of_core: {message}"):
+            FileReader(WaveletSettings(out_of_core=True, **settings)).validate((path,))
@@ -0,0 +1,72 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdetoolkit.rde2util import Meta
+
+from modules import output_writer, wavelet
+
+METADATA_DEF = "../templates/template/tasksupport/metadata-def.json"
+
+
+@pytest.fixture
+def meta():
+    features = wavelet.compute_features(np.random.default_rng(0).random((300, 300)) * 255)
+    return features | {"image_mode": "L", "image_bit_depth": np.int64(8), "dominant_value_fraction": np.float32(0.3), "note": "a, \"b\"", "missing": float("nan"), "single": np.float32(0.1)}
+
+
+class TestOutputWriter:
+    """CSVとmetadata.jsonの出力のテスト"""
+
+    def test_csv_matches_pandas(self, meta, tmp_path):
+        # 従来のpandasによるファイル出力とバイト単位で一致する
+        df = pd.DataFrame(meta, index=[0]).rename(index={0: "img.tif"})
+        df.to_csv(tmp_path / "pandas.csv", header=df.columns.to_list(), index=True)
+        assert output_writer.FeatureRecord.from_meta(meta, "img.tif").csv_bytes() == (tmp_path / "pandas.csv").read_bytes()
+
+    def test_csv_bytes(self):
+        meta = {"a": 1.0, "b": np.float32(0.1), "c": "x,y", "d": float("nan"), "e": np.int64(3), "f": None, "g": 1e-20, "h": True, "i": 'say "hi"'}
+        rows = [",a,b,c,d,e,f,g,h,i", 'img.tif,1.0,0.1,"x,y",,3,,1e-20,True,"say ""hi"""']
+        assert output_writer.FeatureRecord.from_meta(meta, "img.tif").csv_bytes() == "".join(row + os.linesep for row in rows).encode("utf-8")
+
+    def test_write_both_outputs(self, meta, tmp_path):
+        writer = output_writer.OutputWriter()
+        writer.write(meta, "img.tif", tmp_path / "img.csv", tmp_path / "metadata.json", Meta(METADATA_DEF))
+        assert pd.read_csv(tmp_path / "img.csv", index_col=0).loc["img.tif", "s_0"] == meta["s_0"]
+        constant = json.loads((tmp_path / "metadata.json").read_text(encoding="utf-8"))["constant"]
+        assert constant["s_0"]["value"] == meta["s_0"]
+        assert constant["image_bit_depth"]["value"] == 8
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["img.csv", "metadata.json"]
+        # 従来どおりnumpyの値をそのまま渡した場合とバイト単位で一致する
+        previous = Meta(METADATA_DEF)
+        previous.assign_vals(meta)
+        (tmp_path / "previous").mkdir()
+        previous.writefile(str(tmp_path / "previous" / "metadata.json"))
+        assert (tmp_path / "metadata.json").read_bytes() == (tmp_path / "previous" / "metadata.json").read_bytes()
+
+    def test_buffered(self, meta, tmp_path):
+        writer = output_writer.OutputWriter()
+        with writer:
+            for i in range(3):
+                writer.write(meta, f"{i}.tif", tmp_path / f"{i}.csv", tmp_path / f"{i}.json", Meta(METADATA_DEF), buffer_size=2)
+            assert writer.pending == 0
+            writer.write(meta, "3.tif", tmp_path / "3.csv", tmp_path / "3.json", Meta(METADATA_DEF), buffer_size=2)
+            assert writer.pending == 1
+            assert not (tmp_path / "3.csv").exists()
+            assert (tmp_path / "3.json").exists()
+        assert (tmp_path / "3.csv").exists()
+
+    def test_atomic_write_keeps_old_file_on_error(self, tmp_path):
+        path = tmp_path / "out.txt"
+        output_writer.atomic_write_bytes(path, b"old")
+
+        def fail(tmp):
+            tmp.write_bytes(b"partial")
+            raise OSError
+
+        with pytest.raises(OSError):
+            output_writer.atomic_write(path, fail)
+        assert path.read_bytes() == b"old"
+        assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
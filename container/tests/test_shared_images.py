@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules import wavelet
+from modules.shared_images import SharedImagePool, attach_shared_image, batch_wavelet_process
+
+
+@pytest.fixture
+def texture_tifs(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"texture{i}.tif"
+        Image.fromarray((rng.random((300, 300)) * 255).astype(np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+class TestSharedImagePool:
+    """共有メモリバッファの再利用テスト"""
+
+    def test_buffers_are_recycled(self):
+        with SharedImagePool(2) as pool:
+            for _ in range(5):
+                handle, view = pool.acquire((64, 64), np.uint16)
+                view[...] = 7
+                del view
+                with attach_shared_image(handle) as image:
+                    assert image.dtype == np.uint16
+                    assert (image == 7).all()
+                    assert not image.flags.writeable
+                pool.release(handle)
+            assert pool.allocations == 1
+
+    def test_pool_exhausted(self):
+        with SharedImagePool(1) as pool:
+            pool.acquire((8, 8), np.uint8)
+            with pytest.raises(RuntimeError):
+                pool.acquire((8, 8), np.uint8)
+
+
+class TestBatchWaveletProcess:
+    """プロセスプールによるバッチ処理のテスト"""
+
+    def test_same_as_sequential(self, texture_tifs):
+        results = batch_wavelet_process(texture_tifs, workers=2, max_buffers=2)
+        assert results == [wavelet.wavelet_process(path) for path in texture_tifs]
@@ -0,0 +1,89 @@
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+import yaml
+
+from modules import telemetry
+
+
+def busy(seconds: float) -> None:
+    """指定した時間だけCPUを使用する"""
+    matrix = np.random.default_rng(0).random((200, 200))
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        matrix = matrix @ matrix / 200
+
+
+class TestResourceMonitor:
+    """リソース使用量のテレメトリのテスト"""
+
+    def test_samples_and_summary(self):
+        with telemetry.ResourceMonitor(interval=0.05) as monitor:
+            busy(0.3)
+        assert len(monitor.samples) >= 4
+        summary = monitor.summary()
+        assert summary["cpu_seconds"] > 0
+        assert summary["rss_peak_mb"] >= summary["rss_mean_mb"] > 0
+        assert summary["suggested_tasks_per_node"] >= 1
+
+    def test_includes_children(self):
+        before = telemetry.read_process_usage()
+        code = "import time\nmemory = bytearray(200 * 2**20)\nend = time.monotonic() + 0.3\nwhile time.monotonic() < end: pass\nprint(flush=True)\ntime.sleep(10)"
+        child = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+        try:
+            child.stdout.readline()
+            running = telemetry.read_process_usage()
+        finally:
+            child.kill()
+            child.wait()
+        finished = telemetry.read_process_usage()
+        # 子プロセスのRSSは実行中のみ、CPU時間は終了後も加算される
+        assert running[1] - before[1] > 150 * 2**20
+        assert running[0] - before[0] >= 0.2
+        assert finished[0] >= running[0]
+        assert finished[1] - before[1] < 150 * 2**20
+
+    def test_otlp(self, tmp_path):
+        with telemetry.ResourceMonitor(interval=0.05) as monitor:
+            busy(0.1)
+        monitor.write_otlp(tmp_path / "metrics.jsonl")
+        request = json.loads((tmp_path / "metrics.jsonl").read_text())
+        metrics = {m["name"]: m for m in request["resourceMetrics"][0]["scopeMetrics"][0]["metrics"]}
+        assert set(metrics) == {"process.cpu.time", "process.memory.usage", "process.disk.io"}
+        cpu_points = metrics["process.cpu.time"]["sum"]["dataPoints"]
+        assert len(cpu_points) == len(monitor.samples)
+        assert cpu_points[0]["asDouble"] == 0.0
+        assert len(metrics["process.disk.io"]["sum"]["dataPoints"]) == 2 * len(monitor.samples)
+
+
+class TestMonitorRun:
+    """構造化処理全体のテレメトリ出力のテスト"""
+
+    def write_config(self, data_dir, section):
+        data_dir.joinpath("tasksupport").mkdir(parents=True)
+        config = {"system": {"extended_mode": "MultiDataTile"}, "telemetry": section}
+        data_dir.joinpath("tasksupport", "rdeconfig.yaml").write_text(yaml.safe_dump(config))
+
+    def test_writes_files(self, tmp_path):
+        self.write_config(tmp_path, {"interval": 0.05, "otlp": True})
+        with telemetry.monitor_run(tmp_path) as monitor:
+            busy(0.1)
+        assert monitor is not None
+        logs = tmp_path / "logs"
+        assert json.loads((logs / telemetry.SUMMARY_NAME).read_text())["samples"] == len(monitor.samples)
+        assert len((logs / telemetry.TIMESERIES_NAME).read_text().splitlines()) == len(monitor.samples) + 1
+        assert (logs / telemetry.OTLP_NAME).exists()
+
+    def test_disabled_or_invalid(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        self.write_config(tmp_path / "disabled", {"enabled": False})
+        self.write_config(tmp_path / "invalid", {"interval": 0})
+        for name in ("disabled", "invalid"):
+            with telemetry.monitor_run(tmp_path / name) as monitor:
+                assert monitor is None
+            assert not (tmp_path / name / "logs").exists()
+        # 設定の誤りはrdesys.logに記録される
+        assert "Telemetry is disabled" in (tmp_path / "data" / "logs" / "rdesys.log").read_text()
@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial import cKDTree
+
+from modules import texture_index, wavelet
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, len(wavelet.FEATURE_NAMES))) * np.arange(1, len(wavelet.FEATURE_NAMES) + 1) * 100
+
+
+def _write_csv(path, vectors, names):
+    pd.DataFrame(vectors, index=names, columns=list(wavelet.FEATURE_NAMES)).to_csv(path)
+
+
+class TestTextureIndex:
+    """特徴量の近傍検索インデックスのテスト"""
+
+    @pytest.mark.parametrize("n", [10, 64, 1000])
+    def test_matches_brute_force(self, n):
+        vectors = _vectors(n)
+        index = texture_index.TextureIndex()
+        for start in range(0, n, 37):
+            index.add(vectors[start : start + 37], [str(i) for i in range(start, min(start + 37, n))], "a.csv")
+        assert len(index) == n
+        point = vectors[3] * 1.01
+        expected_distance, expected_rows = cKDTree((vectors - index._center) / index._scale).query((point - index._center) / index._scale, k=5)
+        neighbours = index.query(point, k=5)
+        assert [n.name for n in neighbours] == [str(i) for i in expected_rows]
+        assert [n.distance for n in neighbours] == pytest.approx(expected_distance)
+
+    def test_normalization(self):
+        vectors = _vectors(100)
+        index = texture_index.TextureIndex()
+        index.add(vectors[:10], [str(i) for i in range(10)], "a.csv")
+        assert index._center == pytest.approx(vectors[:10].mean(axis=0))
+        index.add(vectors[10:], [str(i) for i in range(10, 100)], "a.csv")
+        # 全件を含む最初の木(64件)の作成時に推定し直す
+        assert index._scale == pytest.approx(vectors[:64].std(axis=0))
+
+    def test_segments_merge(self):
+        index = texture_index.TextureIndex()
+        index.add(_vectors(7 * texture_index.BUFFER_SIZE + 5), [str(i) for i in range(7 * texture_index.BUFFER_SIZE + 5)], "a.csv")
+        assert index._segment_sizes == [4 * texture_index.BUFFER_SIZE, 2 * texture_index.BUFFER_SIZE, texture_index.BUFFER_SIZE]
+
+    def test_add_files_skips_duplicates(self, tmp_path, monkeypatch):
+        _write_csv(tmp_path / "a.csv", _vectors(3), ["x.tif", "y.tif", "z.tif"])
+        pd.DataFrame({"s_0_R": [1.0]}, index=["rgb.tif"]).to_csv(tmp_path / "rgb.csv")
+        index = texture_index.TextureIndex()
+        assert index.add_files([tmp_path]) == 3
+        assert index.add_files([tmp_path / "a.csv"]) == 0
+        # 相対パスで指定しても同じファイルは二重に登録しない
+        monkeypatch.chdir(tmp_path)
+        assert index.add_files([Path("a.csv")]) == 0
+        assert index.query(dict(zip(wavelet.FEATURE_NAMES, _vectors(3)[1], strict=True)), k=1)[0].name == "y.tif"
+
+    def test_skips_other_variants(self, tmp_path):
+        table = pd.DataFrame(_vectors(4), index=["full.tif", "quick.tif", "haar.tif", "whole.tif"], columns=list(wavelet.FEATURE_NAMES))
+        table["feature_mode"] = [None, "quick", None, None]
+        table["feature_engine"] = [None, None, "haar", None]
+        table["feature_extent"] = [None, None, None, "image"]
+        table.to_csv(tmp_path / "mixed.csv")
+        index = texture_index.TextureIndex()
+        assert index.add_files([tmp_path / "mixed.csv"]) == 1
+        assert index.query(_vectors(4)[1], k=5)[0].name == "full.tif"
+        quick = texture_index.TextureIndex(("steerable", "quick", "crop"))
+        assert quick.add_files([tmp_path / "mixed.csv"]) == 1
+        quick.save(tmp_path / "quick.npz")
+        assert texture_index.TextureIndex.load(tmp_path / "quick.npz").variant == ("steerable", "quick", "crop")
+        with pytest.raises(ValueError, match="steerable/quick/crop"):
+            texture_index.main("add", tmp_path / "quick.npz", [tmp_path / "mixed.csv"])
+
+    def test_save_load(self, tmp_path):
+        index = texture_index.TextureIndex()
+        index.add(_vectors(200), [str(i) for i in range(200)], "a.csv")
+        index.save(tmp_path / "index.npz")
+        loaded = texture_index.TextureIndex.load(tmp_path / "index.npz")
+        assert loaded.query(_vectors(1, seed=1)[0], k=10) == index.query(_vectors(1, seed=1)[0], k=10)
+        assert loaded.add(_vectors(200), [str(i) for i in range(200)], "a.csv") == 0
+
+    def test_cli(self, tmp_path, capsys):
+        _write_csv(tmp_path / "a.csv", _vectors(20), [f"{i}.tif" for i in range(20)])
+        _write_csv(tmp_path / "query.csv", _vectors(20)[[4]], ["q.tif"])
+        texture_index.main("add", tmp_path / "index.npz", [tmp_path / "a.csv"])
+        assert capsys.readouterr().out.strip() == "20 added, 20 in index"
+        texture_index.main("query", tmp_path / "index.npz", [tmp_path / "query.csv"], k=2)
+        lines = capsys.readouterr().out.strip().splitlines()
+        assert len(lines) == 2
+        assert lines[0].split("\t")[:2] == ["0", "4.tif"]
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+from rdetoolkit.exceptions import StructuredError
+
+from modules import inputfile_handler
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+from modules.tiff_header import TiffHeaderError, read_tiff_header
+
+
+@pytest.fixture(scope="module")
+def pixels():
+    return (np.random.default_rng(0).random((700, 650)) * 65535).astype(np.uint16)
+
+
+class TestReadTiffHeader:
+    """ヘッダのみによるTIFF検証のテスト"""
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            {"tile": (128, 128), "compression": "lzw"},
+            {"rowsperstrip": 64, "compression": "zlib", "bigtiff": True},
+            {"byteorder": ">"},
+        ],
+    )
+    def test_same_as_tifffile(self, tmp_path, pixels, options):
+        path = tmp_path / "image.tif"
+        tifffile.imwrite(path, pixels, **options)
+        header = read_tiff_header(path)
+        with tifffile.TiffFile(path) as tif:
+            page = tif.pages[0]
+            assert header.shape == page.shape
+            assert header.bit_depth == page.bitspersample
+            assert header.compression == page.compression
+            assert header.segments == len(page.dataoffsets)
+            assert header.bigtiff == tif.is_bigtiff
+            assert header.photometric == page.photometric
+        assert header.pages == 1
+
+    def test_pil_bilevel_and_pages(self, tmp_path):
+        frames = [Image.fromarray(np.random.default_rng(i).random((40, 30)) > 0.5) for i in range(3)]
+        frames[0].save(tmp_path / "pages.tif", save_all=True, append_images=frames[1:])
+        header = read_tiff_header(tmp_path / "pages.tif")
+        assert (header.shape, header.bit_depth, header.pages) == ((40, 30), 1, 3)
+
+    def test_planar_separate(self, tmp_path):
+        rgb = np.zeros((3, 50, 40), dtype=np.uint8)
+        tifffile.imwrite(tmp_path / "planar.tif", rgb, planarconfig="separate", photometric="rgb")
+        header = read_tiff_header(tmp_path / "planar.tif")
+        assert (header.samples, header.planar, header.segments) == (3, 2, 3)
+        assert header.decoded_nbytes(crop=20) == 20 * 20 * 3
+
+    @pytest.mark.parametrize(
+        ("content", "message"),
+        [
+            (lambda data: data[: len(data) // 2], "truncated"),
+            (lambda data: data[:6], "truncated"),
+            (lambda data: b"GIF89a" + data[6:], "not a TIFF"),
+            (lambda data: data[:4] + (len(data) + 100).to_bytes(4, "little") + data[8:], "no image file directory"),
+        ],
+    )
+    def test_invalid(self, tmp_path, pixels, content, message):
+        tifffile.imwrite(tmp_path / "image.tif", pixels, tile=(128, 128))
+        path = tmp_path / "broken.tif"
+        path.write_bytes(content((tmp_path / "image.tif").read_bytes()))
+        with pytest.raises(TiffHeaderError, match=message):
+            read_tiff_header(path)
+
+
+class TestValidateHeader:
+    """FileReader.validateでのヘッダ検証とメモリ計画のテスト"""
+
+    def test_rejects_truncated(self, tmp_path, pixels):
+        tifffile.imwrite(tmp_path / "image.tif", pixels)
+        data = (tmp_path / "image.tif").read_bytes()
+        (tmp_path / "image.tif").write_bytes(data[:-1000])
+        with pytest.raises(StructuredError, match="Invalid TIFF file image.tif"):
+            FileReader().validate((tmp_path / "image.tif",))
+
+    def test_rejects_undecodable(self, tmp_path, pixels):
+        tifffile.imwrite(tmp_path / "image.tif", pixels[:64, :64], compression="jpeg2000")
+        with pytest.raises(StructuredError, match="compression 34712 cannot be decoded by the pil backend"):
+            FileReader(WaveletSettings(tiff_backend="pil")).validate((tmp_path / "image.tif",))
+        assert FileReader(WaveletSettings(tiff_backend="tifffile")).validate((tmp_path / "image.tif",))
+
+    def test_plan_threads(self, tmp_path, pixels, monkeypatch, caplog):
+        monkeypatch.chdir(tmp_path)
+        tifffile.imwrite(tmp_path / "image.tif", pixels)
+        reader = FileReader(WaveletSettings(threads=4, tiff_backend="tifffile"))
+        reader.validate((tmp_path / "image.tif",))
+        assert reader.header.shape == (700, 650)
+        assert reader.threads == 4
+        budget = inputfile_handler.MEMORY_RESERVE + 700 * 650 * (2 + 8 * 12)
+        monkeypatch.setattr(inputfile_handler, "_available_memory", lambda: budget)
+        reader.validate((tmp_path / "image.tif",))
+        assert reader.threads == 1
+        monkeypatch.setattr(inputfile_handler, "_available_memory", lambda: budget - 1)
+        # メモリが足りなくても1スレッドで処理を続け、警告を出す
+        reader.validate((tmp_path / "image.tif",))
+        assert reader.threads == 1
+        assert "needs about" in caplog.text
+        assert "needs about" in (tmp_path / "data" / "logs" / "rdesys.log").read_text()
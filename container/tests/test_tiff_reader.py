@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from modules import tiff_reader, wavelet
+
+
+@pytest.fixture(scope="module")
+def pixels():
+    return (np.random.default_rng(0).random((700, 650)) * 65535).astype(np.uint16)
+
+
+class TestReadTiff:
+    """tifffileによるタイル並列デコードのテスト"""
+
+    @pytest.mark.parametrize(
+        ("options", "bigtiff"),
+        [
+            ({"tile": (128, 128), "compression": "lzw"}, False),
+            ({"rowsperstrip": 64, "compression": "lzw"}, False),
+            ({"tile": (256, 128), "compression": "zlib"}, True),
+            ({}, False),
+        ],
+    )
+    def test_decode(self, tmp_path, pixels, options, bigtiff):
+        path = tmp_path / "image.tif"
+        tifffile.imwrite(path, pixels, bigtiff=bigtiff, **options)
+        assert (tiff_reader.read_tiff(path, threads=4) == pixels).all()
+        assert (tiff_reader.read_tiff(path, crop=300, threads=4) == pixels[:300, :300]).all()
+
+    def test_rgb(self, tmp_path):
+        rgb = (np.random.default_rng(1).random((300, 260, 3)) * 255).astype(np.uint8)
+        path = tmp_path / "rgb.tif"
+        tifffile.imwrite(path, rgb, tile=(64, 64), compression="zlib")
+        assert (tiff_reader.read_tiff(path, crop=200, threads=2) == rgb[:200, :200]).all()
+
+    def test_same_as_pil(self, tmp_path, pixels):
+        path = tmp_path / "image.tif"
+        Image.fromarray(pixels).save(path)
+        decoded = wavelet.load_image(path, backend="tifffile", crop=512)
+        assert (decoded == wavelet.load_image(path, backend="pil", crop=512)).all()
+        assert (wavelet.load_image(path, backend="auto", crop=512) == decoded).all()
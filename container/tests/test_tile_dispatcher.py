@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+from rdetoolkit.exceptions import StructuredError
+
+from modules import inputfile_handler, tile_dispatcher, wavelet
+from modules.inputfile_handler import FileReader
+from modules.settings import WaveletSettings
+from modules.tile_dispatcher import TileDispatcher
+
+
+def _crash_on_img1(settings, path, store_dir):
+    # C拡張のセグメンテーション違反やOOM-killによるワーカーの異常終了を模擬する
+    if path.name == "img1.tif":
+        os._exit(1)
+    return _extract(settings, path, store_dir)
+
+
+_extract = tile_dispatcher._extract
+
+
+@pytest.fixture
+def inputdata(tmp_path):
+    directory = tmp_path / "inputdata"
+    directory.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(4):
+        Image.fromarray((rng.random((300, 300)) * 255).astype(np.uint8)).save(directory / f"img{i}.tif")
+    return directory
+
+
+class TestTileDispatcher:
+    """タイルの並列処理のテスト"""
+
+    def test_matches_sequential(self, inputdata):
+        reader = FileReader(WaveletSettings(tile_workers=2))
+        with TileDispatcher() as dispatcher:
+            for i in range(4):
+                path = reader.validate((inputdata / f"img{i}.tif",))
+                assert dispatcher.read(reader, path) == pytest.approx(FileReader().read(path))
+                # 現在のタイルと続くタイルが先に投入される
+                assert len(dispatcher._futures) == min(3, 3 - i)
+
+    def test_error_reported_for_its_tile(self, inputdata):
+        (inputdata / "img1.tif").write_bytes(b"II*\x00" + b"\x00" * 4)
+        reader = FileReader(WaveletSettings(tile_workers=2))
+        with TileDispatcher() as dispatcher:
+            assert "s_0" in dispatcher.read(reader, inputdata / "img0.tif")
+            with pytest.raises(StructuredError, match="Invalid TIFF file img1.tif"):
+                dispatcher.read(reader, inputdata / "img1.tif")
+            assert "s_0" in dispatcher.read(reader, inputdata / "img2.tif")
+
+    def test_worker_crash_reported_for_its_tile(self, inputdata, monkeypatch):
+        monkeypatch.setattr(tile_dispatcher, "_extract", _crash_on_img1)
+        reader = FileReader(WaveletSettings(tile_workers=2))
+        with TileDispatcher() as dispatcher:
+            # 異常終了したワーカーのタイルだけがエラーになり、プールは作り直される
+            assert "s_0" in dispatcher.read(reader, inputdata / "img0.tif")
+            with pytest.raises(StructuredError, match="Worker process died while processing img1.tif"):
+                dispatcher.read(reader, inputdata / "img1.tif")
+            assert "s_0" in dispatcher.read(reader, inputdata / "img2.tif")
+            assert "s_0" in dispatcher.read(reader, inputdata / "img3.tif")
+
+    def test_coefficient_store(self, inputdata, tmp_path):
+        reader = FileReader(WaveletSettings(tile_workers=2, save_coefficients=True))
+        with TileDispatcher() as dispatcher:
+            dispatcher.read(reader, inputdata / "img0.tif", coefficient_store=tmp_path / "img0_pyramid.zip")
+            store_dir = dispatcher._store_dir
+        assert (tmp_path / "img0_pyramid.zip").exists()
+        assert not store_dir.exists()
+
+    def test_memory_shared_between_tiles(self, monkeypatch, inputdata):
+        header = FileReader().check_header(inputdata / "img0.tif")
+        peak = 300 * 300 + wavelet.estimate_working_memory((300, 300), threads=8, channels=1, quick=False, bin_factor=4)
+        monkeypatch.setattr(inputfile_handler, "_available_memory", lambda: inputfile_handler.MEMORY_RESERVE + peak)
+        assert FileReader(WaveletSettings(threads=8)).plan_threads(header, "pil") == 8
+        assert FileReader(WaveletSettings(threads=8, tile_workers=2)).plan_threads(header, "pil") == 1
@@ -0,0 +1,202 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.models.config import Config
+
+from modules import prescreen, shape_normalization, wavelet
+from modules.settings import load_wavelet_settings
+
+
+@pytest.fixture
+def texture_tif(tmp_path) -> Path:
+    """乱数テクスチャのTIFF画像を作成する"""
+    rng = np.random.default_rng(0)
+    path = tmp_path / "texture.tif"
+    Image.fromarray((rng.random((600, 640)) * 255).astype(np.uint8)).save(path)
+    return path
+
+
+class TestQuickMode:
+    """quickモード(ビニング画像による近似特徴量)のテスト"""
+
+    def test_same_feature_names(self, texture_tif):
+        full = wavelet.wavelet_process(texture_tif)
+        quick = wavelet.wavelet_process(texture_tif, quick=True)
+        assert "feature_mode" not in full
+        assert quick.pop("feature_mode") == "quick"
+        quick.pop("feature_bin_factor")
+        assert list(quick.keys()) == list(full.keys())
+
+    def test_bin_factor_falls_back_for_small_images(self, texture_tif):
+        quick = wavelet.wavelet_process(texture_tif, quick=True, bin_factor=4)
+        # 600 // 2 = 300 >= 17 * 2**4 = 272, 600 // 3 = 200 < 272
+        assert quick["feature_bin_factor"] == 2
+
+    def test_block_average(self):
+        image = np.arange(36, dtype=np.uint8).reshape(6, 6)
+        binned = wavelet.block_average(image, 4)
+        assert binned.shape == (1, 1)
+        assert binned[0, 0] == image[:4, :4].mean()
+
+
+class TestThreadedPyramid:
+    """スレッド並列によるピラミッド構築のテスト"""
+
+    def test_identical_to_sequential(self):
+        image = np.random.default_rng(1).random((300, 320)) * 255
+        sequential = wavelet.get_steerable_pyramid_feature(image, 5, 3)
+        threaded = wavelet.get_steerable_pyramid_feature(image, 5, 3, threads=4)
+        assert list(threaded.keys()) == list(sequential.keys())
+        assert all(threaded[k] == sequential[k] for k in sequential)
+
+    def test_height_too_large(self):
+        image = np.zeros((100, 100))
+        with pytest.raises(ValueError, match="Cannot build pyramid"):
+            wavelet.get_steerable_pyramid_feature(image, 5, 3, threads=2)
+
+
+class TestWaveletSettings:
+    """rdeconfig.yamlのwaveletセクション読み込みのテスト"""
+
+    def test_default(self):
+        assert load_wavelet_settings(Config()).mode == "full"
+
+    def test_quick(self):
+        settings = load_wavelet_settings(Config(wavelet={"mode": "quick", "quick_bin_factor": 2}))
+        assert settings.mode == "quick"
+        assert settings.quick_bin_factor == 2
+
+    def test_invalid(self):
+        with pytest.raises(StructuredError):
+            load_wavelet_settings(Config(wavelet={"mode": "fast"}))
+
+    @pytest.mark.parametrize("section", [{"mask": "auto"}, {"moments": "sampled"}, {"prescreen": False}, {"engine": "haar"}, {"features": ["s_0"]}])
+    def test_separate_channels_rejects_ignored_settings(self, section):
+        # channels: separateで使われない設定は、読み込み時にエラーにする
+        with pytest.raises(StructuredError, match=f"Settings not available with channels: separate: {next(iter(section))}"):
+            load_wavelet_settings(Config(wavelet={"channels": "separate"} | section))
+        assert load_wavelet_settings(Config(wavelet={"channels": "separate", "mode": "quick"})).channels == "separate"
+
+
+class TestBatchedPyramid:
+    """複数チャンネルの一括ピラミッド計算のテスト"""
+
+    def test_same_as_per_channel(self):
+        images = np.random.default_rng(2).random((3, 300, 290)) * 255
+        batched = wavelet.get_steerable_pyramid_features_batched(images, 5, 3)
+        for image, features in zip(images, batched, strict=True):
+            expected = wavelet.get_steerable_pyramid_feature(image, 5, 3)
+            assert list(features.keys()) == list(expected.keys())
+            assert features == pytest.approx(expected, rel=1e-9)
+
+    def test_channel_columns(self, tmp_path):
+        rgb = (np.random.default_rng(3).random((300, 290, 3)) * 255).astype(np.uint8)
+        Image.fromarray(rgb).save(tmp_path / "rgb.tif")
+        result = wavelet.wavelet_process(tmp_path / "rgb.tif", separate_channels=True)
+        assert result["feature_channels"] == 3
+        for c in range(3):
+            assert result[f"ms_mean_ch{c}"] == pytest.approx(rgb[..., c].mean())
+            assert f"s_4_ch{c}" in result
+
+    def test_stack_features(self):
+        images = np.random.default_rng(4).random((3, 300, 290)) * 255
+        features = wavelet.compute_stack_features(images, batch_size=2)
+        assert features.shape == (3, len(wavelet.FEATURE_NAMES))
+        for image, row in zip(images, features, strict=True):
+            expected = wavelet.compute_features(image)
+            assert row == pytest.approx([expected[name] for name in wavelet.FEATURE_NAMES], rel=1e-9)
+
+
+class TestPrescreen:
+    """黒画像・飽和画像・一様な画像の事前判定のテスト"""
+
+    def test_constant_same_as_pyramid(self):
+        image = np.full((300, 320), 37, dtype=np.uint8)
+        screened = wavelet.compute_features(image)
+        computed = wavelet.compute_features(image, prescreen=False)
+        assert screened["image_quality"] == "constant"
+        assert screened["ms_kurtosis"] == 0.0
+        assert screened["ms_skewness"] == 0.0
+        for name in ("ms_mean", "ms_std", "ss_residual_highpass", "ss_residual_lowpass", "s_0", "s_4"):
+            assert screened[name] == pytest.approx(computed[name], abs=1e-12)
+
+    @pytest.mark.parametrize(
+        ("value", "dtype", "quality"),
+        [(0, np.uint16, "blank"), (255, np.uint8, "saturated"), (65535, np.uint16, "saturated"), (1.5, np.float64, "constant")],
+    )
+    def test_quality(self, value, dtype, quality):
+        image = np.full((400, 400), value, dtype=dtype)
+        image[::50, ::50] = 3 if quality != "constant" else value
+        screening = prescreen.screen_image(image, sample_size=4096)
+        assert screening.quality == quality
+        assert screening.value == value
+        # ピラミッドを省略するのは一様な画像のみ
+        assert screening.usable == (quality != "constant")
+
+    def test_near_blank_computed(self):
+        image = np.zeros((300, 320), dtype=np.uint16)
+        image[100:102, 50:60] = 4000
+        result = wavelet.compute_features(image)
+        assert result["image_quality"] == "blank"
+        unscreened = {name: value for name, value in result.items() if name not in ("image_quality", "dominant_value_fraction")}
+        assert unscreened == wavelet.compute_features(image, prescreen=False)
+
+    def test_fully_blank_skipped(self):
+        image = np.zeros((300, 320), dtype=np.uint16)
+        result = wavelet.compute_features(image)
+        assert result["image_quality"] == "blank"
+        assert result["ms_kurtosis"] == 0.0
+
+    def test_usable_image(self):
+        image = np.random.default_rng(0).random((300, 320)) * 255
+        result = wavelet.compute_features(image)
+        assert result["image_quality"] == "ok"
+        unscreened = {name: value for name, value in result.items() if name not in ("image_quality", "dominant_value_fraction")}
+        assert unscreened == wavelet.compute_features(image, prescreen=False)
+
+    def test_masked(self):
+        image = np.random.default_rng(0).random((300, 320)) * 255
+        image[:200] = 0
+        valid = np.zeros(image.shape, dtype=bool)
+        valid[:200] = True
+        assert prescreen.screen_image(image).quality == "ok"
+        assert prescreen.screen_image(image, valid).quality == "blank"
+
+
+class TestShapeNormalization:
+    """FFTに適した画像サイズへの正規化のテスト"""
+
+    @pytest.mark.parametrize(("size", "padded", "cropped"), [(1103, 1152, 1024), (1392, 1440, 1280), (1536, 1536, 1536), (272, 288, 256)])
+    def test_fft_friendly_size(self, size, padded, cropped):
+        assert shape_normalization.fft_friendly_size(size, 32, larger=True) == padded
+        assert shape_normalization.fft_friendly_size(size, 32, larger=False) == cropped
+
+    def test_pad_excludes_padding(self):
+        image = np.random.default_rng(0).random((300, 290)) * 255
+        padded = wavelet.compute_features(image, shape_mode="pad")
+        unpadded = wavelet.compute_features(image)
+        assert padded["pyramid_shape"] == "320 x 320"
+        for name in ("ms_mean", "ms_std", "ms_kurtosis", "ms_skewness", "ss_residual_highpass", "s_0"):
+            assert padded[name] == pytest.approx(unpadded[name])
+
+    @pytest.mark.parametrize("size", [272, 280, 287])
+    def test_crop_keeps_pyramid_size(self, size):
+        # 256に切り詰めるとピラミッドの最小サイズ(17 * 2**4 = 272)を下回るため切り詰めない
+        image = np.random.default_rng(0).random((size, 300)) * 255
+        cropped, _ = shape_normalization.normalize_shape(image, None, "crop", 5, min_size=272)
+        assert cropped.shape == (size, 288)
+        result = wavelet.compute_features(image, shape_mode="crop", prescreen=False)
+        assert result["pyramid_shape"] == f"{size} x 288"
+
+    def test_quick_crop_keeps_pyramid_size(self):
+        result = wavelet.compute_features(np.random.default_rng(0).random((1100, 1100)) * 255, quick=True, shape_mode="crop", prescreen=False)
+        assert (result["feature_bin_factor"], result["pyramid_shape"]) == (4, "275 x 275")
+
+    def test_crop(self):
+        image = np.random.default_rng(0).random((300, 290)) * 255
+        cropped = wavelet.compute_features(image, shape_mode="crop", prescreen=False)
+        assert cropped.pop("pyramid_shape") == "288 x 288"
+        assert cropped == pytest.approx(wavelet.compute_features(image[:288, :288], prescreen=False))